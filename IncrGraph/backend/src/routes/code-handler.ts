@@ -1,5 +1,6 @@
 import { Router, Request, Response } from "express";
 import fs from "fs-extra";
+import os from "os";
 import path from "path";
 import {
 	CodeAnalysisRequest,
@@ -7,14 +8,32 @@ import {
 	CodeExecutionMetrics,
 	CodeExecutionRequest,
 	CodeExecutionResponse,
+	CodeManyAnalysisRequest,
 	CodeManyExecutionRequest,
+	CodeRerunRequest,
+	ConfigurationPageRequest,
 	createCustomLogger,
 	FileIdCodeList,
+	FragmentTrace,
+	IdCodeTuple,
+	PythonImportRequest,
+	PythonImportResponse,
+	SessionCompactionRequest,
+	SessionCompactionResponse,
 	SessionConfig,
 } from "shared";
 import { spawn, execFile } from "child_process";
 import { v4 as uuidv4 } from "uuid";
 import { getSubDirectories } from "./file-explorer";
+import {
+	ExecutionResult,
+	getPythonWorkerPool,
+} from "../utils/pythonWorkerPool";
+import {
+	ExecutionSchedule,
+	getAnalyzerDaemon,
+	ScheduleElement,
+} from "../utils/analyzerDaemon";
 
 const router = Router();
 
@@ -109,179 +128,182 @@ const addPathToSession = async (
 	}
 };
 
+// State manifest of an execution (objects live in the session's object
+// store), and the full session pickle written by older sessions
+const STATE_FILE = "state.json";
+const LEGACY_STATE_FILE = "state.pkl";
+
+// Profile files written by `execution_worker.py` for profiled executions
+const PROFILE_FILES = ["profile.pstats", "profile.collapsed"];
+// Globals used by traced executions, written by `execution_worker.py`
+const TRACE_FILE = "trace.json";
+
+/**
+ * Copy the state of an execution directory to another one
+ *
+ * * The state it replaces is removed rather than overwritten, as session_gc.py
+ * * hard links identical states together
+ *
+ * @param {string} fromDir - The execution directory holding the state
+ * @param {string} toDir - The execution directory to copy it to
+ */
+const copyState = async (fromDir: string, toDir: string) => {
+	for (const file of [STATE_FILE, LEGACY_STATE_FILE]) {
+		if (fs.existsSync(path.join(fromDir, file))) {
+			await fs.remove(path.join(toDir, file));
+			await fs.copyFile(path.join(fromDir, file), path.join(toDir, file));
+			return;
+		}
+	}
+};
+
+/**
+ * Read the configuration of an execution directory
+ *
+ * * The types of the values it describes resolve the method calls of the
+ * * fragments run after it
+ *
+ * @param {string} executionDir - The execution directory
+ * @returns The configuration, or undefined if there is none
+ */
+const readConfiguration = async (executionDir: string) => {
+	const configFilePath = path.join(executionDir, "configuration.json");
+	if (!fs.existsSync(configFilePath)) {
+		return undefined;
+	}
+	try {
+		return await fs.readJSON(configFilePath);
+	} catch (error) {
+		logger.error("Error reading configuration", { executionDir, error });
+		return undefined;
+	}
+};
+
 export const executeCode = async (
 	code: string,
 	languageBinPath: string,
 	sessionId: string,
     executionDir: string,
     prevExecutionDir: string,
+	dependencies: string[] | null = null,
+	profile: boolean = false,
+	memoize: boolean = false,
+	trace: boolean = false,
 ): Promise<Omit<CodeExecutionResponse, "metaNodeData">> => {
 
 	await fs.mkdir(executionDir, { recursive: true });
+	// Drop the profile and trace of an earlier run of this execution
+	for (const file of [...PROFILE_FILES, TRACE_FILE]) {
+		await fs.remove(path.join(executionDir, file));
+	}
 
-	const stateFilePath = path.join(executionDir, "state.pkl");
+	const stateFilePath = path.join(executionDir, STATE_FILE);
 	const configFilePath = path.join(executionDir, "configuration.json");
-	const prevStateFilePath = path.join(prevExecutionDir, "state.pkl");
+	const prevStateFilePath = path.join(prevExecutionDir, STATE_FILE);
 	const prevConfigFilePath = path.join(
 		prevExecutionDir,
 		"configuration.json",
 	);
-	const scriptFilePath = path.join(executionDir, "script.py");
-
-	const completeCode = `
-import dill as IGC_RUN_VARIABLE_DILL
-import json as IGC_RUN_VARIABLE_JSON
-import os as IGC_RUN_VARIABLE_OS
-import types as IGC_RUN_VARIABLE_TYPES
-
-state = {}
-config = {}
-
-# Paths for temporary files
-IGC_RUN_VARIABLE_prevStateFilePath = "${prevStateFilePath
-		.replace(/\\/g, "\\\\")
-		.replace(/"/g, '\\"')}"
-
-# Save the initial state to compare later
-IGC_RUN_VARIABLE_initial_globals = set(globals().keys())
-
-# Load initial state if it exists
-if IGC_RUN_VARIABLE_OS.path.exists(IGC_RUN_VARIABLE_prevStateFilePath):
-    IGC_RUN_VARIABLE_DILL.load_session(IGC_RUN_VARIABLE_prevStateFilePath)
-
-IGC_RUN_VARIABLE_stateFilePath = "${stateFilePath
-		.replace(/\\/g, "\\\\")
-		.replace(/"/g, '\\"')}"
-IGC_RUN_VARIABLE_configFilePath = "${configFilePath
-		.replace(/\\/g, "\\\\")
-		.replace(/"/g, '\\"')}"
-
-# User code
-${code}
-
-# Capture the state of all variables
-IGC_RUN_VARIABLE_global_items = list(globals().items())
-config = {}
-
-for IGC_RUN_VARIABLE_key, IGC_RUN_VARIABLE_value in IGC_RUN_VARIABLE_global_items:
-    if IGC_RUN_VARIABLE_key not in IGC_RUN_VARIABLE_initial_globals and not IGC_RUN_VARIABLE_key.startswith('IGC_RUN_VARIABLE_'):
-        if isinstance(IGC_RUN_VARIABLE_value, (int, float, str, bool, dict, list, tuple, set)):
-            config[IGC_RUN_VARIABLE_key] = IGC_RUN_VARIABLE_value
-        elif isinstance(IGC_RUN_VARIABLE_value, IGC_RUN_VARIABLE_TYPES.FunctionType):
-            config[IGC_RUN_VARIABLE_key] = "<function>"
-        elif isinstance(IGC_RUN_VARIABLE_value, type):
-            config[IGC_RUN_VARIABLE_key] = "<class>"
-        else:
-            config[IGC_RUN_VARIABLE_key] = f"<{type(IGC_RUN_VARIABLE_value).__name__}>"
-
-# Save the state for the next execution
-IGC_RUN_VARIABLE_DILL.dump_session(IGC_RUN_VARIABLE_stateFilePath)
-
-# Save the config to a separate JSON file
-with open(IGC_RUN_VARIABLE_configFilePath, "w") as IGC_RUN_VARIABLE_configFile:
-    IGC_RUN_VARIABLE_JSON.dump(config, IGC_RUN_VARIABLE_configFile, default=str)
-    IGC_RUN_VARIABLE_configFile.flush()
-`;
-
-	await fs.writeFile(scriptFilePath, completeCode);
-
-	return new Promise((resolve, reject) => {
-		const startTime = process.hrtime();
-		logger.info("Executing Python code", { sessionId, code });
 
-		const pythonProcess = spawn(languageBinPath, [scriptFilePath]);
+	// Keep the code that ran, so re-runs can tell which fragments were edited
+	await fs.writeFile(path.join(executionDir, "code.py"), code);
 
-		let stdout = "";
-		let stderr = "";
+	const startTime = process.hrtime();
+	logger.info("Executing Python code", { sessionId, code });
 
-		pythonProcess.stdout.on("data", (data) => {
-			stdout += data.toString();
-		});
-
-		pythonProcess.stderr.on("data", (data) => {
-			stderr += data.toString();
+	// Run the fragment in a warm worker, which only loads the previous state
+	// from disk if it does not already hold it
+	let stdout = "";
+	let stderr = "";
+	let workerMetrics: ExecutionResult["metrics"] | undefined;
+	try {
+		const result = await getPythonWorkerPool(languageBinPath).execute({
+			code,
+			stateIn: prevStateFilePath,
+			stateOut: stateFilePath,
+			configOut: configFilePath,
+			dependencies,
+			profileDir: profile ? executionDir : null,
+			memoize,
+			trace,
 		});
+		stdout = result.output;
+		stderr = result.error;
+		workerMetrics = result.metrics;
+	} catch (e) {
+		logger.error("Python worker failed", { error: e });
+		stderr = `${e}`;
+	}
 
-		pythonProcess.on("close", async () => {
-			const endTime = process.hrtime(startTime);
-			const execTime = endTime[0] * 1000 + endTime[1] / 1000000; // Execution time in milliseconds
-
-			let config = {};
-			try {
-				if (fs.existsSync(configFilePath)) {
-					config = JSON.parse(
-						await fs.readFile(configFilePath, "utf8"),
-					);
-				} else {
-					logger.error(
-						"Config file does not exist. Copying the previous one here...",
-						{ sessionId },
-					);
-					await fs.copyFile(prevConfigFilePath, configFilePath);
-					config = JSON.parse(
-						await fs.readFile(prevConfigFilePath, "utf8"),
-					);
-				}
-				if (!fs.existsSync(stateFilePath)) {
-					logger.error(
-						"State file does not exist. Copying the previous one here...",
-						{ sessionId },
-					);
-					await fs.copyFile(prevStateFilePath, stateFilePath);
-				}
-			} catch (e) {
-				logger.error(
-					"Error reading config or combined result after execution",
-					{ error: e },
-				);
-				reject(e); // Reject the promise if there's an error
-				return;
-			}
-
-			const metrics = {
-				executionTime: execTime,
-				sessionId: sessionId,
-			};
-
-			// Log the result of execution
-			await fs.writeFile(path.join(executionDir, "std.out"), stdout);
-			await fs.writeFile(path.join(executionDir, "std.err"), stderr);
-			await fs.writeFile(
-				path.join(executionDir, "metrics.json"),
-				JSON.stringify(metrics, null, 4),
-			);
+	const endTime = process.hrtime(startTime);
+	const execTime = endTime[0] * 1000 + endTime[1] / 1000000; // Execution time in milliseconds
 
-			const result: Omit<CodeExecutionResponse, "metaNodeData"> = {
-				output: stdout,
-				error: stderr,
-				metrics: metrics,
-				configuration: config,
-			};
+	let config = {};
+	if (fs.existsSync(configFilePath)) {
+		config = JSON.parse(await fs.readFile(configFilePath, "utf8"));
+	} else {
+		logger.error(
+			"Config file does not exist. Copying the previous one here...",
+			{ sessionId },
+		);
+		await fs.copyFile(prevConfigFilePath, configFilePath);
+		config = JSON.parse(await fs.readFile(prevConfigFilePath, "utf8"));
+	}
+	if (!fs.existsSync(stateFilePath)) {
+		logger.error(
+			"State file does not exist. Copying the previous one here...",
+			{ sessionId },
+		);
+		await copyState(prevExecutionDir, executionDir);
+	}
 
-			if (stderr) {
-				logger.error("Error executing Python code", {
-					sessionId,
-					error: stderr,
-				});
-			} else {
-				logger.info("Python code executed successfully", {
-					sessionId,
-					result,
-				});
-			}
+	const metrics: CodeExecutionMetrics = {
+		executionTime: execTime,
+		sessionId: sessionId,
+	};
+	if (workerMetrics) {
+		// Time not spent in the worker's own phases went to waiting for an
+		// idle worker (or starting one) and passing the request around
+		const workerTime = Object.values(workerMetrics.phases ?? {}).reduce(
+			(total, time) => total + time,
+			0,
+		);
+		Object.assign(metrics, workerMetrics, {
+			phases: {
+				wait: Math.max(0, execTime - workerTime),
+				...workerMetrics.phases,
+			},
+		});
+	}
 
-			// Clean up temporary script file but keep the state file
-			await fs.unlink(scriptFilePath);
+	// Log the result of execution
+	await fs.writeFile(path.join(executionDir, "std.out"), stdout);
+	await fs.writeFile(path.join(executionDir, "std.err"), stderr);
+	await fs.writeFile(
+		path.join(executionDir, "metrics.json"),
+		JSON.stringify(metrics, null, 4),
+	);
 
-			// Resolve the result
-			resolve(result);
+	const result: Omit<CodeExecutionResponse, "metaNodeData"> = {
+		output: stdout,
+		error: stderr,
+		metrics: metrics,
+		configuration: config,
+	};
+
+	if (stderr) {
+		logger.error("Error executing Python code", {
+			sessionId,
+			error: stderr,
 		});
-
-		pythonProcess.on("error", (err) => {
-			logger.error("Python process failed to start", { error: err });
-			reject(err); // Reject if there's an error starting the process
+	} else {
+		logger.info("Python code executed successfully", {
+			sessionId,
+			result,
 		});
-	});
+	}
+
+	return result;
 };
 
 router.post("/execute", async (req: Request, res: Response) => {
@@ -291,6 +313,9 @@ router.post("/execute", async (req: Request, res: Response) => {
 		filePath,
 		nodeId,
 		sessionId,
+		profile,
+		memoize,
+		trace,
 	}: CodeExecutionRequest = req.body;
 
 	if (!code) {
@@ -374,8 +399,20 @@ router.post("/execute", async (req: Request, res: Response) => {
 		`${currentRunNumber - 1}`,
 	);
 
+	// Top-level names the fragment reads, so a cold worker only loads those
+	// from the previous state up front
+	let dependencies: string[] | null = null;
+	try {
+		const schedule = await getAnalyzerDaemon(pythonPath).schedule([code], {
+			configuration: await readConfiguration(prevExecutionDir),
+		});
+		dependencies = schedule.names[0]?.consumed ?? null;
+	} catch (error) {
+		logger.error("Error analyzing code dependencies", { error });
+	}
+
 	return res.send({
-		...(await executeCode(code, pythonPath, sessionKey, executionDir, prevExecutionDir)),
+		...(await executeCode(code, pythonPath, sessionKey, executionDir, prevExecutionDir, dependencies, profile ?? false, memoize ?? false, trace ?? false)),
 		metaNodeData: metaNodeData,
 	});
 });
@@ -386,6 +423,10 @@ router.post("/execute-many", async (req: Request, res: Response) => {
 		language,
 		filePath,
 		sessionId,
+		profile,
+		memoize,
+		trace,
+		parallel,
 	}: CodeManyExecutionRequest = req.body;
 
 	if (!fileIdCodeList) {
@@ -437,94 +478,530 @@ router.post("/execute-many", async (req: Request, res: Response) => {
 	const executionsDir = path.join(sessionDir, "executions");
 
     // Run all of the code snippets
-    await executeMultiple(fileIdCodeList, pythonPath, sessionKey, executionsDir);
+    await executeMultiple(fileIdCodeList, pythonPath, sessionKey, executionsDir, undefined, profile ?? false, memoize ?? false, trace ?? false, parallel ?? false);
 
     return res.status(200).send({ message: "All code snippets executed successfully" });
 });
 
-export const executeMultiple = async (fileIdCodeList: FileIdCodeList, languageBinPath: string, sessionId: string, executionsDir: string, prevExecutionDir?: string) => {
+// Maximum number of fragments executed at the same time by executeMultiple
+const MAX_PARALLEL_EXECUTIONS = Math.max(1, os.cpus().length);
+
+const sessionMergeScriptPath = path.join(
+	__dirname,
+	"../scripts/python",
+	"session_merge.py",
+);
+
+interface MergeStep {
+	dir: string;
+	from?: string;
+	defined: string[] | null;
+	consumed: string[] | null;
+	out?: string;
+}
+
+/**
+ * Fold the states of fragments that ran concurrently into a base state
+ * (see session_merge.py)
+ *
+ * @param {string} languageBinPath - The Python binary
+ * @param {string | null} base - The execution directory the states are merged into
+ * @param {MergeStep[]} steps - The executions to merge, in execution order
+ */
+const mergeStates = (
+	languageBinPath: string,
+	base: string | null,
+	steps: MergeStep[],
+): Promise<void> => {
+	return new Promise((resolve, reject) => {
+		const pythonProcess = spawn(languageBinPath, [sessionMergeScriptPath]);
+		let stderr = "";
+		pythonProcess.stderr.on("data", (data) => {
+			stderr += data.toString();
+		});
+		pythonProcess.on("close", (code) => {
+			if (code === 0) {
+				resolve();
+			} else {
+				reject(new Error(`Merging session states failed: ${stderr}`));
+			}
+		});
+		pythonProcess.on("error", reject);
+		pythonProcess.stdin.end(JSON.stringify({ base, steps }));
+	});
+};
+
+/**
+ * Run tasks with at most `limit` of them in flight
+ */
+const runWithLimit = async (
+	tasks: (() => Promise<unknown>)[],
+	limit: number,
+): Promise<void> => {
+	let next = 0;
+	const worker = async () => {
+		while (next < tasks.length) {
+			const task = tasks[next++];
+			await task();
+		}
+	};
+	await Promise.all(
+		Array.from({ length: Math.min(limit, tasks.length) }, worker),
+	);
+};
+
+const toScheduleElements = (
+	fileIdCodeList: FileIdCodeList,
+): ScheduleElement[] => {
+	return fileIdCodeList.elements.map((element) =>
+		typeof element.data === "string"
+			? element.data
+			: toScheduleElements(element.data as FileIdCodeList),
+	);
+};
+
+/**
+ * Execute one element of a FileIdCodeList on top of the state of another execution
+ */
+const executeElement = async (
+	element: IdCodeTuple,
+	languageBinPath: string,
+	sessionId: string,
+	executionDir: string,
+	prevExecutionDir: string,
+	dependencies: string[] | null = null,
+	profile: boolean = false,
+	memoize: boolean = false,
+	trace: boolean = false,
+	parallel: boolean = false,
+) => {
+	await fs.ensureDir(executionDir);
+
+	if (typeof element.data === "string") {
+		// It's a code snippet, execute it
+		await executeCode(element.data, languageBinPath, sessionId, executionDir, prevExecutionDir, dependencies, profile, memoize, trace);
+		return;
+	}
+
+	// It's a nested FileIdCodeList, recursively execute it
+	const fileIdList = element.data as FileIdCodeList;
+	const subExecutionDir = path.join(executionDir, "executions");
+	await fs.ensureDir(subExecutionDir);
+	await executeMultiple(fileIdList, languageBinPath, sessionId, subExecutionDir, prevExecutionDir, profile, memoize, trace, parallel);
+	const subExecutionConfigPath = path.join(subExecutionDir, "config.json");
+	const subExecutionConfig: SessionConfig = await fs.readJSON(subExecutionConfigPath);
+
+	// Aggregate all the files and configurations from the sub-executions
+	// Configurations file (take from the most recent sub execution)
+	const lastSubExecutionDir = path.join(subExecutionDir, `${subExecutionConfig.path.length}`);
+	await fs.copyFile(path.join(lastSubExecutionDir, "configuration.json"), path.join(executionDir, "configuration.json"));
+	// State file (take from the most recent sub execution)
+	await copyState(lastSubExecutionDir, executionDir);
+	// Metrics, Stdout, stderr files
+	const allSubExecutionDirs = await getSubDirectories(subExecutionDir);
+	let stdout = "";
+	let stderr = "";
+	let totalExecutionTime = 0;
+	const phases: { [phase: string]: number } = {};
+	let restoredFromDisk = false;
+	let peakRss: number | null = null;
+	let storedBytes = 0;
+	for (const subExecution of allSubExecutionDirs.sort()) {
+		// Metrics
+		const subExecutionMetricsPath = path.join(subExecutionDir, subExecution, "metrics.json");
+		const subExecutionMetrics: CodeExecutionMetrics = await fs.readJSON(subExecutionMetricsPath);
+		totalExecutionTime += subExecutionMetrics.executionTime;
+		for (const [phase, time] of Object.entries(subExecutionMetrics.phases ?? {})) {
+			phases[phase] = (phases[phase] ?? 0) + time;
+		}
+		restoredFromDisk ||= subExecutionMetrics.restoredFromDisk ?? false;
+		if (subExecutionMetrics.peakRss != null) {
+			peakRss = Math.max(peakRss ?? 0, subExecutionMetrics.peakRss);
+		}
+		storedBytes += subExecutionMetrics.storedBytes ?? 0;
+		// Stdout
+		const subExecutionStdoutPath = path.join(subExecutionDir, subExecution, "std.out");
+		const subExecutionStdout = await fs.readFile(subExecutionStdoutPath, "utf8");
+		stdout += subExecutionStdout;
+		// Stderr
+		const subExecutionStderrPath = path.join(subExecutionDir, subExecution, "std.err");
+		const subExecutionStderr = await fs.readFile(subExecutionStderrPath, "utf8");
+		stderr += subExecutionStderr;
+	}
+	// Write the aggregated files
+	const lastSubExecutionMetrics: CodeExecutionMetrics = await fs.readJSON(
+		path.join(lastSubExecutionDir, "metrics.json"),
+	);
+	const metrics: CodeExecutionMetrics = {
+		executionTime: totalExecutionTime,
+		sessionId: sessionId,
+		phases,
+		restoredFromDisk,
+		peakRss,
+		stateSize: lastSubExecutionMetrics.stateSize,
+		storedBytes,
+	};
+	const metricsPath = path.join(executionDir, "metrics.json");
+	await fs.writeJSON(metricsPath, metrics);
+	const stdoutPath = path.join(executionDir, "std.out");
+	await fs.writeFile(stdoutPath, stdout);
+	const stderrPath = path.join(executionDir, "std.err");
+	await fs.writeFile(stderrPath, stderr);
+};
+
+/**
+ * Execute every element of a FileIdCodeList, appending them to the session path
+ *
+ * * With `parallel`, fragments the analyzer shows to be independent run
+ * * concurrently, level by level. Their states are merged before the next
+ * * level starts, and each execution directory ends up with the state after
+ * * its position in the path, as if the elements had run one after another.
+ * * Otherwise the elements run in order.
+ */
+export const executeMultiple = async (fileIdCodeList: FileIdCodeList, languageBinPath: string, sessionId: string, executionsDir: string, prevExecutionDir?: string, profile: boolean = false, memoize: boolean = false, trace: boolean = false, parallel: boolean = false) => {
     // Create executions directory if it doesn't exist
     if (!fs.existsSync(executionsDir)) {
 		await fs.mkdir(executionsDir, { recursive: true });
 	}
-    
-    // Recursively execute all the code snippets
-    for (const element of fileIdCodeList.elements) {
-        // Update the specific session path file
-        const currentRunNumber = await addPathToSession(element.id, executionsDir, fileIdCodeList.filePath);
-
-        // Create the run directory
-        const executionDir = path.join(executionsDir, `${currentRunNumber}`);
-        const pExecutionDir = prevExecutionDir !== undefined && currentRunNumber === 1 ? prevExecutionDir : path.join(
-            executionsDir,
-            `${currentRunNumber - 1}`,
-        );
-        fs.ensureDir(executionDir);
-
-        if (typeof element.data === 'string') {
-            // It's a code snippet, execute it
-            await executeCode(element.data, languageBinPath, sessionId, executionDir, pExecutionDir);
-        } else {
-            // It's a nested FileIdCodeList, recursively execute it
-            const fileIdList = element.data as FileIdCodeList
-            const subExecutionDir = path.join(executionDir, "executions");
-            await fs.ensureDir(subExecutionDir);
-            // const subExecutionConfig: SessionConfig  = {
-                //     path: fileIdList.elements.map((element) => element.id),
-                //     timestamp: Date.now(),
-                //     filePath: fileIdList.filePath,
-                // };
-                // await fs.writeJSON(subExecutionConfigPath, subExecutionConfig);
-            await executeMultiple(fileIdList, languageBinPath, sessionId, path.join(executionsDir, `${currentRunNumber}`, "executions"), path.join(executionsDir, `${currentRunNumber-1}`));
-            const subExecutionConfigPath = path.join(subExecutionDir, "config.json");
-            const subExecutionConfig: SessionConfig = await fs.readJSON(subExecutionConfigPath);
-
-            // Aggregate all the files and configurations from the sub-executions
-            // Configurations file (take from the most recent sub execution)
-            const lastSubExecutionDir = path.join(subExecutionDir, `${subExecutionConfig.path.length}`);
-            await fs.copyFile(path.join(lastSubExecutionDir, "configuration.json"), path.join(executionDir, "configuration.json"));
-            // State file (take from the most recent sub execution)
-            await fs.copyFile(path.join(lastSubExecutionDir, "state.pkl"), path.join(executionDir, "state.pkl"));
-            // Metrics, Stdout, stderr files
-            const allSubExecutionDirs = await getSubDirectories(subExecutionDir);
-            let stdout = "";
-            let stderr = "";
-            let totalExecutionTime = 0;
-            for (const subExecution of allSubExecutionDirs.sort()) {
-                // Metrics
-                const subExecutionMetricsPath = path.join(subExecutionDir, subExecution, "metrics.json");
-                const subExecutionMetrics: CodeExecutionMetrics = await fs.readJSON(subExecutionMetricsPath);
-                totalExecutionTime += subExecutionMetrics.executionTime;
-                // Stdout
-                const subExecutionStdoutPath = path.join(subExecutionDir, subExecution, "std.out");
-                const subExecutionStdout = await fs.readFile(subExecutionStdoutPath, "utf8");
-                stdout += subExecutionStdout;
-                // Stderr
-                const subExecutionStderrPath = path.join(subExecutionDir, subExecution, "std.err");
-                const subExecutionStderr = await fs.readFile(subExecutionStderrPath, "utf8");
-                stderr += subExecutionStderr;
+    const elements = fileIdCodeList.elements;
+    if (elements.length === 0) {
+        return;
+    }
+
+    // Update the specific session path file, so run numbers follow the path order
+    const runNumbers: number[] = [];
+    for (const element of elements) {
+        runNumbers.push(await addPathToSession(element.id, executionsDir, fileIdCodeList.filePath));
+    }
+    const executionDirs = runNumbers.map((runNumber) => path.join(executionsDir, `${runNumber}`));
+    const firstRunNumber = runNumbers[0];
+    const baseDir = prevExecutionDir !== undefined && firstRunNumber === 1 ? prevExecutionDir : path.join(
+        executionsDir,
+        `${firstRunNumber - 1}`,
+    );
+
+    let schedule: ExecutionSchedule | null = null;
+    if (elements.length > 1) {
+        try {
+            schedule = await getAnalyzerDaemon(languageBinPath).schedule(toScheduleElements(fileIdCodeList), {
+                configuration: await readConfiguration(baseDir),
+            });
+        } catch (error) {
+            logger.error("Error scheduling executions, running them in order", { error });
+        }
+    }
+
+    if (!parallel || schedule === null || schedule.levels.length === elements.length) {
+        // Nothing runs concurrently
+        let pExecutionDir = baseDir;
+        for (let i = 0; i < elements.length; i++) {
+            await executeElement(elements[i], languageBinPath, sessionId, executionDirs[i], pExecutionDir, schedule?.names[i]?.consumed ?? null, profile, memoize, trace, parallel);
+            pExecutionDir = executionDirs[i];
+        }
+        return;
+    }
+
+    const names = schedule.names;
+    const levelBaseDir = await fs.mkdtemp(path.join(os.tmpdir(), "igc-levels-"));
+    try {
+        // The state each element ran on top of
+        const fromDirs: string[] = new Array(elements.length);
+        let levelBase = baseDir;
+        for (let l = 0; l < schedule.levels.length; l++) {
+            const level = schedule.levels[l];
+            await runWithLimit(
+                level.map((i) => () => {
+                    fromDirs[i] = levelBase;
+                    return executeElement(elements[i], languageBinPath, sessionId, executionDirs[i], levelBase, names[i]?.consumed ?? null, profile, memoize, trace, parallel);
+                }),
+                MAX_PARALLEL_EXECUTIONS,
+            );
+            if (l < schedule.levels.length - 1) {
+                const nextLevelBase = path.join(levelBaseDir, `${l}`);
+                await mergeStates(
+                    languageBinPath,
+                    levelBase,
+                    level.map((i, j) => ({
+                        dir: executionDirs[i],
+                        defined: names[i]?.defined ?? null,
+                        consumed: names[i]?.consumed ?? null,
+                        out: j === level.length - 1 ? nextLevelBase : undefined,
+                    })),
+                );
+                levelBase = nextLevelBase;
             }
-            // Write the aggregated files
-            const metrics = {
-                executionTime: totalExecutionTime,
-                sessionId: sessionId,
-            };
-            const metricsPath = path.join(executionDir, "metrics.json");
-            await fs.writeJSON(metricsPath, metrics);
-            const stdoutPath = path.join(executionDir, "std.out");
-            await fs.writeFile(stdoutPath, stdout);
-            const stderrPath = path.join(executionDir, "std.err");
-            await fs.writeFile(stderrPath, stderr);
         }
+
+        // Rewrite every execution with the state after its position in the path
+        await mergeStates(
+            languageBinPath,
+            baseDir,
+            elements.map((_, i) => ({
+                dir: executionDirs[i],
+                from: fromDirs[i],
+                defined: names[i]?.defined ?? null,
+                consumed: names[i]?.consumed ?? null,
+                out: executionDirs[i],
+            })),
+        );
+    } finally {
+        await fs.remove(levelBaseDir);
     }
 }
 
+router.post("/rerun", async (req: Request, res: Response) => {
+	const {
+		fileIdCodeList,
+		codes,
+		scopes,
+		language,
+		filePath,
+		sessionId,
+		memoize,
+		trace,
+	}: CodeRerunRequest = req.body;
+
+	if (!fileIdCodeList || !codes) {
+		logger.error("No code was provided in the request");
+		return res.status(400).send({ error: "No code provided" });
+	}
+	if (!filePath || !sessionId) {
+		logger.error("No file path or session id was provided in the request");
+		return res.status(400).send({ error: "No path provided" });
+	}
+
+	// Currently only python is supported. Change this to support different languages
+	if (language !== "python") {
+		logger.error("Unsupported language", { language });
+		return res.status(400).send({ error: "Unsupported language" });
+	}
+
+	const pythonPath = await checkPythonInstallation();
+	if (!pythonPath) {
+		logger.error("Python is not installed");
+		return res.status(500).send({ error: "Python is not installed" });
+	}
+
+	const executionsDir = path.join(
+		filePath,
+		"../.sessions",
+		path.basename(filePath),
+		sessionId,
+		"executions",
+	);
+	const configPath = path.join(executionsDir, "config.json");
+	if (!fs.existsSync(configPath)) {
+		logger.error("Session has no executions", { sessionId });
+		return res.status(400).send({ error: "Session has no executions" });
+	}
+	const sessionPath: string[] = (await fs.readJSON(configPath)).path;
+	const elements = fileIdCodeList.elements;
+	if (
+		elements.length !== sessionPath.length ||
+		elements.some((element, i) => element.id !== sessionPath[i])
+	) {
+		logger.error("Execution data does not match the session path", {
+			sessionId,
+		});
+		return res
+			.status(400)
+			.send({ error: "Execution data does not match the session path" });
+	}
+
+	// Code each position ran with last time (and the globals it used, if
+	// traced), and the names in the final state
+	const previousCodes: (string | null)[] = [];
+	const previousTraces: (FragmentTrace | null)[] = [];
+	for (let i = 1; i <= sessionPath.length; i++) {
+		const codePath = path.join(executionsDir, `${i}`, "code.py");
+		previousCodes.push(
+			fs.existsSync(codePath) ? await fs.readFile(codePath, "utf8") : null,
+		);
+		const tracePath = path.join(executionsDir, `${i}`, TRACE_FILE);
+		previousTraces.push(
+			fs.existsSync(tracePath) ? await fs.readJSON(tracePath) : null,
+		);
+	}
+	const lastExecutionDir = path.join(executionsDir, `${sessionPath.length}`);
+	const lastConfigPath = path.join(lastExecutionDir, "configuration.json");
+	const stateSymbols = fs.existsSync(lastConfigPath)
+		? Object.keys(await fs.readJSON(lastConfigPath))
+		: undefined;
+
+	try {
+		const plan = await getAnalyzerDaemon(pythonPath).planRerun({
+			codes,
+			scopes,
+			path: sessionPath,
+			previousCodes,
+			executed: elements.map((element) =>
+				typeof element.data === "string" ? element.data : null,
+			),
+			previousTraces,
+			stateSymbols,
+			cacheDir: path.join(filePath, "../.analysis_cache"),
+		});
+		if (plan.mode !== "incremental" || plan.rerun.length === 0) {
+			return res.send(plan);
+		}
+
+		// Run the planned positions in order on top of the final state, which
+		// leaves the final state of a full re-run. Their execution directories
+		// are overwritten in place, so the states the clean positions after
+		// them ran on are kept aside first.
+		const rerun = new Set(plan.rerun);
+		const firstRerun = plan.rerun[0];
+		const workDir = await fs.mkdtemp(path.join(os.tmpdir(), "igc-rerun-"));
+		try {
+			const schedule = await getAnalyzerDaemon(pythonPath).schedule(
+				toScheduleElements(fileIdCodeList),
+			);
+			const baseDir = path.join(workDir, "base");
+			await fs.copy(lastExecutionDir, baseDir);
+			const previousDirs: string[] = [];
+			for (const position of plan.rerun) {
+				const previousDir = path.join(workDir, "previous", `${position + 1}`);
+				await fs.ensureDir(previousDir);
+				await copyState(path.join(executionsDir, `${position + 1}`), previousDir);
+				previousDirs[position] = previousDir;
+			}
+
+			const fromDirs: string[] = [];
+			let prevExecutionDir = baseDir;
+			for (const position of plan.rerun) {
+				const executionDir = path.join(executionsDir, `${position + 1}`);
+				await fs.remove(path.join(executionDir, STATE_FILE));
+				await fs.remove(path.join(executionDir, LEGACY_STATE_FILE));
+				await fs.remove(path.join(executionDir, "configuration.json"));
+				await executeCode(
+					elements[position].data as string,
+					pythonPath,
+					sessionId,
+					executionDir,
+					prevExecutionDir,
+					null,
+					false,
+					memoize ?? false,
+					trace ?? false,
+				);
+				fromDirs[position] = prevExecutionDir;
+				prevExecutionDir = executionDir;
+			}
+
+			// Rebuild the state after each position from the first re-run one,
+			// from the state before it and what the position changed (see
+			// executeMultiple), so every execution keeps the state at its
+			// position in the path
+			const stateDirs = sessionPath.map((_, i) =>
+				path.join(workDir, "states", `${i + 1}`),
+			);
+			const steps: MergeStep[] = [];
+			for (let i = firstRerun; i < sessionPath.length - 1; i++) {
+				// The state the position ran on: the re-run before it, or its
+				// predecessor as it was before the re-run
+				let from: string | undefined = fromDirs[i];
+				if (!rerun.has(i) && i > 0) {
+					from = previousDirs[i - 1] ?? path.join(executionsDir, `${i}`);
+				}
+				steps.push({
+					dir: path.join(executionsDir, `${i + 1}`),
+					from,
+					defined: schedule.names[i]?.defined ?? null,
+					consumed: schedule.names[i]?.consumed ?? null,
+					out: stateDirs[i],
+				});
+			}
+			if (steps.length > 0) {
+				await mergeStates(
+					pythonPath,
+					firstRerun === 0 ? null : path.join(executionsDir, `${firstRerun}`),
+					steps,
+				);
+			}
+			for (let i = firstRerun; i < sessionPath.length - 1; i++) {
+				const executionDir = path.join(executionsDir, `${i + 1}`);
+				await fs.remove(path.join(executionDir, LEGACY_STATE_FILE));
+				await copyState(stateDirs[i], executionDir);
+				await fs.copyFile(
+					path.join(stateDirs[i], "configuration.json"),
+					path.join(executionDir, "configuration.json"),
+				);
+			}
+			if (prevExecutionDir !== lastExecutionDir) {
+				await fs.remove(path.join(lastExecutionDir, LEGACY_STATE_FILE));
+				await copyState(prevExecutionDir, lastExecutionDir);
+				await fs.copyFile(
+					path.join(prevExecutionDir, "configuration.json"),
+					path.join(lastExecutionDir, "configuration.json"),
+				);
+			}
+		} finally {
+			await fs.remove(workDir);
+		}
+		res.send(plan);
+	} catch (error) {
+		logger.error("Error re-running session", { error });
+		res.status(500).send({ error: error });
+	}
+});
+
+router.post("/configuration-page", async (req: Request, res: Response) => {
+	const {
+		filePath,
+		sessionId,
+		execution,
+		name,
+		path: valuePath,
+		offset,
+		limit,
+	}: ConfigurationPageRequest = req.body;
+
+	if (!filePath || !sessionId || !Number.isInteger(execution) || !name) {
+		logger.error("Incomplete configuration page request");
+		return res.status(400).send({
+			error: "filePath, sessionId, execution and name are required",
+		});
+	}
+
+	const pythonPath = await checkPythonInstallation();
+	if (!pythonPath) {
+		logger.error("Python is not installed");
+		return res.status(500).send({ error: "Python is not installed" });
+	}
+
+	const executionDir = path.join(
+		filePath,
+		"../.sessions",
+		path.basename(filePath),
+		sessionId,
+		"executions",
+		`${execution}`,
+	);
+	try {
+		const page = await getPythonWorkerPool(pythonPath).expand({
+			state: path.join(executionDir, STATE_FILE),
+			name,
+			path: valuePath,
+			offset,
+			limit,
+		});
+		res.send(page);
+	} catch (error) {
+		logger.error("Error expanding configuration value", { error });
+		res.status(500).send({ error: `${error}` });
+	}
+});
+
 const analyzeCode = async ({
 	code,
 	language,
+	key,
+	scope,
 }: {
 	code: string;
 	language: string;
+	key?: string;
+	scope?: string;
 }): Promise<CodeAnalysisResponse> => {
 	if (language !== "python") {
 		console.error("Unsupported language", { language });
@@ -537,69 +1014,220 @@ const analyzeCode = async ({
 		throw new Error("Python is not installed");
 	}
 
-	const analysisScriptPath = path.join(
-		__dirname,
-		"../scripts/python",
-		"analyze_code.py",
-	);
+	return getAnalyzerDaemon(pythonPath).analyze(code, { key, scope });
+};
 
-	return new Promise((resolve, reject) => {
-		const pythonProcess = spawn(pythonPath, [analysisScriptPath]);
+router.post("/analyze", async (req: Request, res: Response) => {
+	const { code, language, key, scope }: CodeAnalysisRequest = req.body;
 
+	if (!code) {
+		logger.error("No code provided in the request");
+		return res.status(400).send({ error: "No code provided" });
+	}
+
+	if (language !== "python") {
+		logger.error("Unsupported language", { language });
+		return res.status(400).send({ error: "Unsupported language" });
+	}
+
+	try {
+		const result = await analyzeCode({ code, language, key, scope });
+		res.send(result);
+	} catch (error) {
+		logger.error("Error analyzing code", { error });
+		res.status(500).send({ error: error });
+	}
+});
+
+router.post("/analyze-many", async (req: Request, res: Response) => {
+	const { codes, language, filePath, scopes }: CodeManyAnalysisRequest =
+		req.body;
+
+	if (!codes) {
+		logger.error("No code provided in the request");
+		return res.status(400).send({ error: "No code provided" });
+	}
+
+	if (language !== "python") {
+		logger.error("Unsupported language", { language });
+		return res.status(400).send({ error: "Unsupported language" });
+	}
+
+	const pythonPath = await checkPythonInstallation();
+	if (!pythonPath) {
+		logger.error("Python is not installed");
+		return res.status(500).send({ error: "Python is not installed" });
+	}
+
+	// Persist the analysis cache next to the .sessions directory of the graph
+	const cacheDir = filePath
+		? path.join(filePath, "../.analysis_cache")
+		: undefined;
+
+	try {
+		const result = await getAnalyzerDaemon(pythonPath).analyzeMany(codes, {
+			cacheDir,
+			file: filePath,
+			scopes,
+		});
+		res.send(result);
+	} catch (error) {
+		logger.error("Error analyzing code", { error });
+		res.status(500).send({ error: error });
+	}
+});
+
+const igcImportScriptPath = path.join(
+	__dirname,
+	"../scripts/python",
+	"igc_import.py",
+);
+
+const sessionGcScriptPath = path.join(
+	__dirname,
+	"../scripts/python",
+	"session_gc.py",
+);
+
+/**
+ * Run a Python script printing its result as JSON
+ *
+ * @param {string} languageBinPath - The Python binary
+ * @param {string[]} args - The script and its arguments
+ * @param {string} action - What the script does, for the error message
+ * @returns {Promise<T>} - The result printed by the script
+ */
+const runJsonScript = <T>(
+	languageBinPath: string,
+	args: string[],
+	action: string,
+): Promise<T> => {
+	return new Promise((resolve, reject) => {
+		const pythonProcess = spawn(languageBinPath, args);
 		let stdout = "";
 		let stderr = "";
-
-		pythonProcess.stdout.on("data", (data: Buffer) => {
+		pythonProcess.stdout.on("data", (data) => {
 			stdout += data.toString();
 		});
-
-		pythonProcess.stderr.on("data", (data: Buffer) => {
+		pythonProcess.stderr.on("data", (data) => {
 			stderr += data.toString();
 		});
-
-		pythonProcess.on("close", (code: number) => {
-			if (code !== 0) {
-				console.error("Error executing Python code", { error: stderr });
-				reject(new Error(stderr));
-				return;
-			}
-
-			try {
-				const analysisResult = JSON.parse(stdout);
-				resolve(analysisResult);
-			} catch (e) {
-				console.error("Error reading analysis result", { error: e });
-				reject(new Error(`Error reading analysis result: ${e}`));
+		pythonProcess.on("close", (code) => {
+			if (code === 0) {
+				resolve(JSON.parse(stdout));
+			} else {
+				reject(new Error(`${action} failed: ${stderr}`));
 			}
 		});
-
-		if (pythonProcess.stdin) {
-			pythonProcess.stdin.write(code);
-			pythonProcess.stdin.end();
-		} else {
-			reject(new Error("Failed to write to Python process stdin"));
-		}
+		pythonProcess.on("error", reject);
 	});
 };
 
-router.post("/analyze", async (req: Request, res: Response) => {
-	const { code, language }: CodeAnalysisRequest = req.body;
+router.post("/import-python", async (req: Request, res: Response) => {
+	const { sources, outputDir }: PythonImportRequest = req.body;
 
-	if (!code) {
-		logger.error("No code provided in the request");
-		return res.status(400).send({ error: "No code provided" });
+	if (!sources || sources.length === 0 || !outputDir) {
+		logger.error("No sources or output directory provided in the request");
+		return res
+			.status(400)
+			.send({ error: "No sources or output directory provided" });
 	}
 
-	if (language !== "python") {
-		logger.error("Unsupported language", { language });
-		return res.status(400).send({ error: "Unsupported language" });
+	const pythonPath = await checkPythonInstallation();
+	if (!pythonPath) {
+		logger.error("Python is not installed");
+		return res.status(500).send({ error: "Python is not installed" });
 	}
 
 	try {
-		const result = await analyzeCode({ code, language });
+		const result = await runJsonScript<PythonImportResponse>(
+			pythonPath,
+			[igcImportScriptPath, ...sources, "--out", outputDir],
+			"Importing Python modules",
+		);
 		res.send(result);
 	} catch (error) {
-		logger.error("Error analyzing code", { error });
+		logger.error("Error importing Python modules", { error });
+		res.status(500).send({ error: `${error}` });
+	}
+});
+
+router.post("/compact-sessions", async (req: Request, res: Response) => {
+	const { filePath, compress, dryRun }: SessionCompactionRequest = req.body;
+
+	if (!filePath) {
+		logger.error("No file path was provided in the request");
+		return res.status(400).send({ error: "No path provided" });
+	}
+
+	const sessionsDir = path.join(
+		filePath,
+		"../.sessions",
+		path.basename(filePath),
+	);
+	if (!fs.existsSync(sessionsDir)) {
+		return res.status(404).send({ error: "No sessions found" });
+	}
+
+	const pythonPath = await checkPythonInstallation();
+	if (!pythonPath) {
+		logger.error("Python is not installed");
+		return res.status(500).send({ error: "Python is not installed" });
+	}
+
+	const args = [sessionGcScriptPath, sessionsDir];
+	if (compress) {
+		args.push("--compress");
+	}
+	if (dryRun) {
+		args.push("--dry-run");
+	}
+	try {
+		const result = await runJsonScript<SessionCompactionResponse>(
+			pythonPath,
+			args,
+			"Compacting sessions",
+		);
+		logger.info("Compacted sessions", { filePath, result });
+		res.send(result);
+	} catch (error) {
+		logger.error("Error compacting sessions", { error });
+		res.status(500).send({ error: `${error}` });
+	}
+});
+
+router.get("/symbol-index", async (req: Request, res: Response) => {
+	const filePath = req.query.filePath as string;
+	if (!filePath) {
+		logger.error("No file path was provided in the request");
+		return res.status(400).send({ error: "No path provided" });
+	}
+
+	const pythonPath = await checkPythonInstallation();
+	if (!pythonPath) {
+		logger.error("Python is not installed");
+		return res.status(500).send({ error: "Python is not installed" });
+	}
+
+	try {
+		res.send(await getAnalyzerDaemon(pythonPath).symbolIndex(filePath));
+	} catch (error) {
+		logger.error("Error reading symbol index", { error });
+		res.status(500).send({ error: error });
+	}
+});
+
+router.get("/analyze-cache-stats", async (_: Request, res: Response) => {
+	const pythonPath = await checkPythonInstallation();
+	if (!pythonPath) {
+		logger.error("Python is not installed");
+		return res.status(500).send({ error: "Python is not installed" });
+	}
+
+	try {
+		res.send(await getAnalyzerDaemon(pythonPath).cacheStats());
+	} catch (error) {
+		logger.error("Error reading analysis cache stats", { error });
 		res.status(500).send({ error: error });
 	}
 });
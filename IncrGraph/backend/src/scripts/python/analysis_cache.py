@@ -0,0 +1,104 @@
+import os
+import json
+import hashlib
+from collections import OrderedDict
+
+from analyze_code import ANALYZER_VERSION, analyze_code
+
+DEFAULT_MAX_ENTRIES = 4096
+
+# Directory created next to the `.sessions` directory of an .igc file
+CACHE_DIR_NAME = ".analysis_cache"
+
+def cache_key(code):
+    """Content address of an analysis: the source text plus the analyzer version."""
+    return hashlib.sha256(f"{ANALYZER_VERSION}\0{code}".encode("utf-8")).hexdigest()
+
+class AnalysisCache:
+    """
+    Memoizes `analyze_code` results by content hash.
+
+    Entries are kept in memory as serialized JSON in least-recently-used order
+    and bounded by `max_entries`. When a directory is given, results are also
+    written to (and read back from) `<directory>/<key[:2]>/<key>.json`, so they
+    survive restarts of the analyzer.
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, directory=None):
+        self.max_entries = max_entries
+        self.directory = directory
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _disk_path(self, key, directory):
+        return os.path.join(directory, key[:2], f"{key}.json")
+
+    def _remember(self, key, serialized):
+        self.entries[key] = serialized
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def get(self, code, directory=None):
+        """Return a fresh copy of the cached result for `code`, or None."""
+        key = cache_key(code)
+        serialized = self.entries.get(key)
+        if serialized is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return json.loads(serialized)
+
+        directory = directory or self.directory
+        if directory is not None:
+            try:
+                with open(self._disk_path(key, directory)) as f:
+                    serialized = f.read()
+                result = json.loads(serialized)
+            except (OSError, ValueError):
+                pass
+            else:
+                self._remember(key, serialized)
+                self.disk_hits += 1
+                return result
+
+        self.misses += 1
+        return None
+
+    def put(self, code, result, directory=None):
+        key = cache_key(code)
+        serialized = json.dumps(result)
+        self._remember(key, serialized)
+
+        directory = directory or self.directory
+        if directory is not None:
+            path = self._disk_path(key, directory)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            temp_path = f"{path}.{os.getpid()}.tmp"
+            with open(temp_path, "w") as f:
+                f.write(serialized)
+            os.replace(temp_path, path)
+
+    def analyze(self, code, directory=None):
+        """`analyze_code` with memoization. Syntax errors are not cached."""
+        result = self.get(code, directory)
+        if result is None:
+            result = analyze_code(code)
+            self.put(code, result, directory)
+        return result
+
+    def stats(self):
+        return {
+            "entries": len(self.entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+    def clear(self):
+        self.entries.clear()
@@ -0,0 +1,79 @@
+import io
+import json
+import tempfile
+import unittest
+from unittest import mock
+
+import analysis_cache
+from analysis_cache import AnalysisCache, cache_key
+from analyze_code import analyze_code, analyze_many, serve
+
+class TestAnalysisCache(unittest.TestCase):
+
+    def test_hit_and_miss_counters(self):
+        cache = AnalysisCache()
+        first = cache.analyze("x = y")
+        second = cache.analyze("x = y")
+        self.assertEqual(first, analyze_code("x = y"))
+        self.assertEqual(first, second)
+        self.assertEqual(cache.stats()["hits"], 1)
+        self.assertEqual(cache.stats()["misses"], 1)
+
+    def test_results_are_independent_copies(self):
+        cache = AnalysisCache()
+        cache.analyze("x = y")["dependencies"]["variables"].append("z")
+        self.assertEqual(cache.analyze("x = y")["dependencies"]["variables"], ["y"])
+
+    def test_lru_eviction(self):
+        cache = AnalysisCache(max_entries=2)
+        cache.analyze("a = 1")
+        cache.analyze("b = 2")
+        cache.analyze("a = 1")
+        cache.analyze("c = 3")
+        self.assertEqual(cache.stats()["evictions"], 1)
+        self.assertIsNotNone(cache.get("a = 1"))
+        self.assertIsNone(cache.get("b = 2"))
+
+    def test_key_includes_analyzer_version(self):
+        key = cache_key("x = 1")
+        with mock.patch.object(analysis_cache, "ANALYZER_VERSION", "other"):
+            self.assertNotEqual(cache_key("x = 1"), key)
+
+    def test_syntax_errors_are_not_cached(self):
+        cache = AnalysisCache()
+        with self.assertRaises(SyntaxError):
+            cache.analyze("def foo(")
+        self.assertEqual(cache.stats()["entries"], 0)
+
+    def test_disk_persistence(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            AnalysisCache(directory=cache_dir).analyze("import os")
+            cache = AnalysisCache(directory=cache_dir)
+            self.assertEqual(cache.get("import os"), analyze_code("import os"))
+            self.assertEqual(cache.stats()["disk_hits"], 1)
+            self.assertEqual(cache.stats()["misses"], 0)
+
+    def test_analyze_many_uses_cache(self):
+        cache = AnalysisCache()
+        codes = {"0": "x = 1", "1": "y = x", "2": "def foo("}
+        first = analyze_many(codes, cache=cache)
+        second = analyze_many(codes, cache=cache)
+        self.assertEqual(first, second)
+        self.assertEqual(list(second), ["0", "1", "2"])
+        self.assertEqual(cache.stats()["hits"], 2)
+
+    def test_serve_cache_stats(self):
+        cache = AnalysisCache()
+        requests = [
+            {"id": 1, "code": "x = 1"},
+            {"id": 2, "code": "x = 1"},
+            {"id": 3, "op": "cache_stats"},
+        ]
+        stdout = io.StringIO()
+        serve(io.StringIO("".join(json.dumps(r) + "\n" for r in requests)), stdout, cache)
+        responses = [json.loads(line) for line in stdout.getvalue().splitlines()]
+        self.assertEqual(responses[2]["result"]["hits"], 1)
+        self.assertEqual(responses[2]["result"]["misses"], 1)
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,321 @@
+"""
+Benchmarks of the Python analyzer.
+
+By default, compare the per-call latency of the two ways the backend can run
+the analyzer:
+
+* spawn:  a fresh interpreter per analysis (the original `/analyze` behaviour)
+* daemon: one long-lived `analyze_code.py --serve` process
+
+The snippets are taken from the code fragments stored in `content/*.igc`.
+
+With --suite, measure `analyze_code` itself in this process instead, on
+synthetic sources of growing size (deeply nested blocks, long runs of
+assignments, wide classes, long import lists) and on the fragments of
+`content/*.igc`. Each case reports analyses per second, the cost per AST
+node and the peak memory allocated by one analysis. --output saves the
+results as JSON, and --compare prints the change from a saved run, e.g. of
+another commit. --baseline times the analyzer of another git revision
+against the current one on the same cases, alternating between them so both
+see the same machine load.
+
+Usage: python analyze_code.bench.py [--content DIR] [--rounds N]
+       python analyze_code.bench.py --suite [--sizes N [N ...]] [--min-time S]
+                                    [--output FILE] [--compare FILE]
+       python analyze_code.bench.py --suite --baseline REVISION [--sizes N [N ...]]
+"""
+import argparse
+import ast
+import glob
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+import types
+
+from analyze_code import analyze_code
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+ANALYZER_PATH = os.path.join(SCRIPT_DIR, "analyze_code.py")
+DEFAULT_CONTENT_DIR = os.path.join(SCRIPT_DIR, "../../../../../content")
+
+def load_snippets(content_dir):
+    snippets = []
+    for igc_path in sorted(glob.glob(os.path.join(content_dir, "**", "*.igc"), recursive=True)):
+        with open(igc_path) as f:
+            graph = json.load(f)
+        for node in graph.get("nodes", []):
+            code = node.get("data", {}).get("codeData", {}).get("code")
+            if code is not None:
+                snippets.append(code)
+    return snippets
+
+def bench_spawn(snippets, rounds):
+    timings = []
+    for _ in range(rounds):
+        for code in snippets:
+            start = time.perf_counter()
+            subprocess.run([sys.executable, ANALYZER_PATH], input=code, capture_output=True, text=True)
+            timings.append(time.perf_counter() - start)
+    return timings
+
+def bench_daemon(snippets, rounds):
+    timings = []
+    process = subprocess.Popen(
+        [sys.executable, ANALYZER_PATH, "--serve"],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    try:
+        request_id = 0
+        for _ in range(rounds):
+            for code in snippets:
+                request_id += 1
+                start = time.perf_counter()
+                process.stdin.write(json.dumps({"id": request_id, "code": code}) + "\n")
+                process.stdin.flush()
+                response = json.loads(process.stdout.readline())
+                timings.append(time.perf_counter() - start)
+                assert response["id"] == request_id
+    finally:
+        process.stdin.close()
+        process.wait()
+    return timings
+
+def report(name, timings):
+    timings_ms = sorted(t * 1000 for t in timings)
+    p95 = timings_ms[int(len(timings_ms) * 0.95) - 1] if len(timings_ms) > 1 else timings_ms[0]
+    print(
+        f"{name:<8} calls={len(timings_ms):<6} mean={statistics.mean(timings_ms):8.3f}ms "
+        f"median={statistics.median(timings_ms):8.3f}ms p95={p95:8.3f}ms "
+        f"throughput={len(timings) / sum(timings):10.1f} calls/s"
+    )
+
+# Synthetic sources, each made of about `size` statements
+
+def nested_source(size, depth=20):
+    """Blocks of functions, conditionals and loops nested `depth` deep."""
+    lines = []
+    for block in range(max(1, size // depth)):
+        lines.append(f"def block_{block}(arg):")
+        for level in range(1, depth):
+            indent = "    " * level
+            header = ["if arg > {level}:", "for i_{level} in range(arg):", "while arg < {level}:"][level % 3]
+            lines.append(indent + f"value_{level} = arg + {level}")
+            lines.append(indent + header.format(level=level))
+        lines.append("    " * depth + "result = helper(arg, value_1)")
+    return "\n".join(lines) + "\n"
+
+def assignments_source(size):
+    """A long run of module-level assignments, calls and augmented assignments."""
+    lines = ["total = 0"]
+    for i in range(1, size):
+        lines.append([
+            f"v{i} = v{i - 1} + {i}" if i > 1 else "v1 = total",
+            f"total += v{i - 1}" if i > 1 else "total += 1",
+            f"item{i} = Item(v{i - 1}, {i})" if i > 1 else "item1 = Item(0, 1)",
+            f"item{i - 1}.update(total)" if i > 1 else "total = len([total])",
+        ][i % 4])
+    return "\n".join(lines) + "\n"
+
+def wide_class_source(size):
+    """One class with `size` methods reading attributes and globals."""
+    lines = ["class Wide(Base):", "    scale = 2"]
+    for i in range(size):
+        lines.append(f"    def method_{i}(self, value):")
+        lines.append(f"        self.field_{i} = transform(value) * self.scale + OFFSET")
+        lines.append(f"        return self.method_{max(i - 1, 0)}(value)")
+    lines.append("wide = Wide()")
+    lines.append("wide.method_0(1)")
+    return "\n".join(lines) + "\n"
+
+def imports_source(size):
+    """A long list of plain, dotted, aliased and from-imports."""
+    lines = []
+    for i in range(size):
+        lines.append([
+            f"import module_{i}",
+            f"import package_{i}.sub as alias_{i}",
+            f"from package_{i}.sub import name_{i}, other_{i} as renamed_{i}",
+        ][i % 3])
+    return "\n".join(lines) + "\n"
+
+GENERATORS = {
+    "nested": nested_source,
+    "assignments": assignments_source,
+    "wide_class": wide_class_source,
+    "imports": imports_source,
+}
+
+def node_count(sources):
+    return sum(sum(1 for _ in ast.walk(ast.parse(code))) for code in sources)
+
+def load_baseline(revision):
+    """The `analyze_code` module as of a git revision."""
+    source = subprocess.run(
+        ["git", "show", f"{revision}:./analyze_code.py"], cwd=SCRIPT_DIR, capture_output=True, text=True, check=True
+    ).stdout
+    module = types.ModuleType("baseline_analyze_code")
+    exec(compile(source, f"{revision}:analyze_code.py", "exec"), module.__dict__)
+    return module
+
+def analysis_time(sources, min_time):
+    """Median seconds to analyze all of `sources`, over at least three passes and `min_time` seconds."""
+    timings = []
+    while len(timings) < 3 or sum(timings) < min_time:
+        start = time.perf_counter()
+        for code in sources:
+            analyze_code(code)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+def peak_memory(sources):
+    """Peak bytes allocated while analyzing any one of `sources`."""
+    peak = 0
+    for code in sources:
+        tracemalloc.start()
+        try:
+            analyze_code(code)
+            peak = max(peak, tracemalloc.get_traced_memory()[1])
+        finally:
+            tracemalloc.stop()
+    return peak
+
+def bench_case(sources, min_time):
+    seconds = analysis_time(sources, min_time)
+    nodes = node_count(sources)
+    return {
+        "sources": len(sources),
+        "nodes": nodes,
+        "opsPerSecond": len(sources) / seconds,
+        "nodeMicroseconds": seconds * 1e6 / nodes,
+        "peakBytes": peak_memory(sources),
+    }
+
+def suite_cases(sizes, content_dir):
+    cases = {}
+    for name, generate in GENERATORS.items():
+        for size in sizes:
+            cases[f"{name}-{size}"] = [generate(size)]
+    snippets = load_snippets(content_dir)
+    if snippets:
+        cases["content"] = snippets
+    return cases
+
+def run_suite(sizes, content_dir, min_time):
+    results = {}
+    for name, sources in suite_cases(sizes, content_dir).items():
+        results[name] = bench_case(sources, min_time)
+        print_case(name, results[name])
+    return results
+
+def analysis_error(analyze, code):
+    """The error `analyze` raises on `code`, or None."""
+    try:
+        analyze(code)
+    except Exception as e:
+        return f"{type(e).__name__}: {e}"
+    return None
+
+def run_baseline(revision, sizes, content_dir, min_time):
+    """
+    Compare the best time of `analyze_code` with that of `revision` on every
+    suite case. Sources either analyzer fails on are reported and left out of
+    the timing, and a case is reported as failed if none is left.
+    """
+    baseline = load_baseline(revision)
+    analyzers = (("baseline", baseline.analyze_code), ("current", analyze_code))
+    print(f"Compared with the analyzer of {revision}:")
+    for name, all_sources in suite_cases(sizes, content_dir).items():
+        sources = []
+        errors = {}
+        for code in all_sources:
+            failed = False
+            for label, analyze in analyzers:
+                error = analysis_error(analyze, code)
+                if error is not None:
+                    errors[label, error] = errors.get((label, error), 0) + 1
+                    failed = True
+            if not failed:
+                sources.append(code)
+        for (label, error), count in errors.items():
+            print(f"{name:<20} {count} of {len(all_sources)} sources failed on the {label} analyzer: {error}")
+        if not sources:
+            print(f"{name:<20} failed")
+            continue
+        timings = {"baseline": [], "current": []}
+        while len(timings["current"]) < 5 or sum(timings["current"]) < min_time:
+            for label, analyze in analyzers:
+                start = time.perf_counter()
+                for code in sources:
+                    analyze(code)
+                timings[label].append(time.perf_counter() - start)
+        before = min(timings["baseline"])
+        after = min(timings["current"])
+        print(f"{name:<20} baseline={before * 1000:9.3f}ms current={after * 1000:9.3f}ms change={after / before - 1:+7.1%}")
+
+def print_case(name, result, previous=None):
+    line = (
+        f"{name:<20} nodes={result['nodes']:<8} ops/s={result['opsPerSecond']:10.1f} "
+        f"per-node={result['nodeMicroseconds']:7.3f}us peak={result['peakBytes'] / 2**20:8.2f}MiB"
+    )
+    if previous is not None:
+        line += (
+            f"  per-node {result['nodeMicroseconds'] / previous['nodeMicroseconds'] - 1:+7.1%}"
+            f" peak {result['peakBytes'] / previous['peakBytes'] - 1:+7.1%}"
+        )
+    print(line)
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=SCRIPT_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the analyzer: daemon latency, or throughput and scaling with --suite.")
+    parser.add_argument("--content", default=DEFAULT_CONTENT_DIR, help="Directory containing .igc files")
+    parser.add_argument("--rounds", type=int, default=3, help="Number of passes over all snippets")
+    parser.add_argument("--suite", action="store_true", help="Measure analyze_code on synthetic and .igc sources")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000], help="Statements per synthetic source")
+    parser.add_argument("--min-time", type=float, default=0.5, help="Minimum seconds spent timing each case")
+    parser.add_argument("--output", help="Save the suite results to this JSON file")
+    parser.add_argument("--compare", help="Suite results JSON file to compare with")
+    parser.add_argument("--baseline", metavar="REVISION", help="Git revision whose analyzer to time against the current one")
+    args = parser.parse_args()
+
+    if args.suite and args.baseline:
+        run_baseline(args.baseline, args.sizes, args.content, args.min_time)
+        sys.exit()
+    if args.suite:
+        results = run_suite(args.sizes, args.content, args.min_time)
+        if args.compare:
+            with open(args.compare) as f:
+                previous = json.load(f)
+            print(f"\nCompared with {args.compare} ({previous.get('commit') or 'unknown commit'}):")
+            for name, result in results.items():
+                if name in previous["cases"]:
+                    print_case(name, result, previous["cases"][name])
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump(
+                    {"commit": git_commit(), "python": platform.python_version(), "cases": results},
+                    f,
+                    indent=4,
+                )
+        sys.exit()
+
+    snippets = load_snippets(args.content)
+    if not snippets:
+        sys.exit(f"No code fragments found in {args.content}")
+    print(f"{len(snippets)} snippets x {args.rounds} rounds")
+
+    report("spawn", bench_spawn(snippets, args.rounds))
+    report("daemon", bench_daemon(snippets, args.rounds))
@@ -1,184 +1,871 @@
+import os
 import ast
 import json
 import builtins
+from concurrent.futures import ProcessPoolExecutor
 
-def analyze_code(code):
-    tree = ast.parse(code)
+# Bump whenever the analysis output changes so cached results are invalidated
+ANALYZER_VERSION = "5"
 
-    dependencies = {
-        "variables": set(),
-        "functions": set(),
-        "classes": set(),
-        "modules": set(),
-    }
-    new_definitions = {"variables": set(), "functions": set(), "classes": set()}
-    variable_types = {}
-    newly_defined_type_variables = {}
-
-    class DependencyVisitor(ast.NodeVisitor):
-        def __init__(self):
-            super().__init__()
-            self.current_scope = [set()]
-            self.current_class = None
-            self.builtins = set(dir(builtins))
-
-        def visit_Name(self, node):
-            if isinstance(node.ctx, ast.Load):
-                if (
-                    node.id not in self.builtins
-                    and node.id not in self.current_scope[-1]
-                    and node.id not in new_definitions["variables"]
-                    and node.id not in new_definitions["functions"]
-                    and node.id not in new_definitions["classes"]
-                    and not self.child_of_call(node)
-                ):
-                    dependencies["variables"].add(f"{node.id}")
-            elif isinstance(node.ctx, ast.Store):
-                # Check for previously defined variable types
-                if node.id in variable_types:
-                    newly_defined_type_variables[node.id] = variable_types[node.id]
-                else:
-                    new_definitions["variables"].add(f"{node.id}")
-                self.current_scope[-1].add(node.id)
-
-        def child_of_call(self, node):
-            parent = getattr(node, 'parent', None)
-            if isinstance(parent, ast.Call) and parent.func.id == node.id:
-                return True
-            return False
-
-        def visit_FunctionDef(self, node):
-            func_name = f"{self.current_class}.{node.name}" if self.current_class else node.name
-            new_definitions["functions"].add(func_name)
-            self.current_scope.append({arg.arg for arg in node.args.args})
-            self.generic_visit(node)
-            self.current_scope.pop()
-
-        def visit_ClassDef(self, node):
-            self.current_class = node.name
-            new_definitions["classes"].add(node.name)
-            self.current_scope.append(set())
-            self.generic_visit(node)
-            self.current_scope.pop()
-            self.current_class = None
-
-        def visit_Import(self, node):
-            for alias in node.names:
-                dependencies["modules"].add(alias.name.split(".")[0])
-                new_definitions["variables"].add(alias.asname or alias.name.split(".")[0])
-
-        def visit_ImportFrom(self, node):
-            dependencies["modules"].add(node.module.split(".")[0])
-            for alias in node.names:
-                new_definitions["variables"].add(alias.asname or alias.name)
-
-        def visit_Assign(self, node):
-            if isinstance(node.value, ast.Call) and isinstance(node.value.func, ast.Name):
-                # Track variable types
-                for target in node.targets:
-                    if isinstance(target, ast.Name):
-                        variable_types[target.id] = node.value.func.id
-            elif isinstance(node.value, ast.Name):
-                # Track variable types
-                for target in node.targets:
-                    if isinstance(target, ast.Name):
-                        variable_types[target.id] = f"<{node.value.id}>"
-                
-            self.visit(node.value)
+# Below this many fragments the cost of starting worker processes outweighs the gain
+PARALLEL_THRESHOLD = 256
+
+BUILTIN_NAMES = frozenset(dir(builtins))
+
+# Kinds of new definitions, as the bits of `AnalysisState.defined`
+DEFINITION_KINDS = {"variables": 1, "functions": 2, "classes": 4, "attributes": 8}
+CALLABLE_KINDS = DEFINITION_KINDS["functions"] | DEFINITION_KINDS["classes"]
+
+# Methods of the builtin containers that change the container in place
+MUTATING_METHODS = frozenset({
+    "add", "append", "clear", "discard", "extend", "insert", "pop", "popitem",
+    "remove", "reverse", "setdefault", "sort", "update",
+})
+
+class AnalysisState:
+    """
+    Module-level facts accumulated while analyzing top-level statements in order.
+
+    The visitor never touches this state directly. It records operations (see
+    `DependencyVisitor.ops`) that are applied here afterwards, so the recorded
+    operations of an unchanged statement can be replayed without walking it again.
+
+    Operations only change the result through the `add_*`/`remove_*` methods,
+    which subclasses can extend to follow the changes.
+
+    Variables used only through their attributes are also reported as the
+    attribute paths read ("attributes" dependencies, e.g. "task.title") and
+    changed ("attributes" definitions, e.g. "tracker.tasks"), so a change of
+    one attribute can be told from a change of the whole object. Once a
+    variable is used as a whole (passed, called, printed, ...), its paths are
+    dropped: it depends on all of it, and its changes are not followed.
+    """
+
+    def __init__(self):
+        self.dependencies = {
+            "variables": set(),
+            "functions": set(),
+            "classes": set(),
+            "modules": set(),
+            "attributes": set(),
+        }
+        self.new_definitions = {"variables": set(), "functions": set(), "classes": set(), "attributes": set()}
+        # Name -> DEFINITION_KINDS bits of the new_definitions sets holding it
+        self.defined = {}
+        self.variable_types = {}
+        self.newly_defined_type_variables = {}
+        # Names bound by module-level assignments and for loops
+        self.module_scope = set()
+        # Names used as a whole, not only through their attributes
+        self.whole_reads = set()
+
+    def apply(self, ops):
+        for op, args in ops:
+            op(self, *args)
+
+    def is_defined(self, name):
+        return name in self.defined
+
+    def add_dependency(self, kind, name):
+        self.dependencies[kind].add(name)
+
+    def remove_dependency(self, kind, name):
+        self.dependencies[kind].remove(name)
+
+    def add_definition(self, kind, name):
+        self.new_definitions[kind].add(name)
+        self.defined[name] = self.defined.get(name, 0) | DEFINITION_KINDS[kind]
+
+    def remove_definition(self, kind, name):
+        self.new_definitions[kind].remove(name)
+        kinds = self.defined[name] & ~DEFINITION_KINDS[kind]
+        if kinds:
+            self.defined[name] = kinds
+        else:
+            del self.defined[name]
+
+    def add_typed_definition(self, name, var_type):
+        self.newly_defined_type_variables[name] = var_type
+
+    def remove_typed_definition(self, name):
+        del self.newly_defined_type_variables[name]
+
+    def require(self, kind, name):
+        self.add_dependency(kind, name)
+
+    def bound(self, name, module_level):
+        """Whether a module-level use of `name` refers to a value the fragment bound before."""
+        return module_level and (name in self.module_scope or self.is_defined(name))
+
+    def read(self, name, module_level):
+        if self.bound(name, module_level):
+            return
+        self.add_dependency("variables", name)
+        self.read_whole(name)
+
+    def read_whole(self, name):
+        if name in self.whole_reads:
+            return
+        self.whole_reads.add(name)
+        prefix = f"{name}."
+        for path in [path for path in self.dependencies["attributes"] if path.startswith(prefix)]:
+            self.remove_dependency("attributes", path)
+        for path in [path for path in self.new_definitions["attributes"] if path.startswith(prefix)]:
+            self.remove_definition("attributes", path)
+
+    def read_attribute(self, name, attr, module_level):
+        if self.bound(name, module_level):
+            return
+        self.add_dependency("variables", name)
+        if name not in self.whole_reads:
+            self.add_dependency("attributes", f"{name}.{attr}")
+
+    def write_attribute(self, name, attr, module_level):
+        if self.bound(name, module_level):
+            return
+        self.add_dependency("variables", name)
+        # Attributes of a name the fragment defines are part of its definition
+        if name not in self.whole_reads and not self.is_defined(name):
+            self.add_definition("attributes", f"{name}.{attr}")
+
+    def define(self, kind, name):
+        self.add_definition(kind, name)
+
+    def bind(self, name):
+        self.module_scope.add(name)
+
+    def load(self, name, module_level):
+        if module_level and name in self.module_scope:
+            return
+        self.read_whole(name)
+        if not self.is_defined(name):
+            self.add_dependency("variables", name)
+
+    def store(self, name, module_level):
+        # Check for previously defined variable types
+        if name in self.variable_types:
+            self.add_typed_definition(name, self.variable_types[name])
+        else:
+            self.add_definition("variables", name)
+        if module_level:
+            self.module_scope.add(name)
+
+    def set_type(self, name, var_type):
+        self.variable_types[name] = var_type
+
+    def call(self, name, module_level, has_args):
+        if module_level and name in self.module_scope:
+            return
+        if self.defined.get(name, 0) & CALLABLE_KINDS:
+            return
+        if name[0].isupper():
+            self.add_dependency("classes", name)
+            if has_args:
+                self.add_dependency("functions", f"{name}.__init__")
+        else:
+            self.add_dependency("functions", name)
+
+    def method_call(self, name, attr, module_level):
+        # The method may use any attribute
+        self.read_whole(name)
+        var_type = self.variable_types.get(name)
+        if var_type:
+            if f"{var_type}.{attr}" not in self.new_definitions["functions"]:
+                self.add_dependency("functions", f"{var_type}.{attr}")
+        elif self.bound(name, module_level):
+            return
+        else:
+            if f"<{name}>.{attr}" not in self.new_definitions["functions"]:
+                self.add_dependency("variables", name)
+                self.add_dependency("functions", f"<{name}>.{attr}")
+
+    def delete(self, name):
+        # Deleting a name the fragment did not bind needs its value
+        if name not in self.module_scope and not self.is_defined(name):
+            self.add_dependency("variables", name)
+        kinds = self.defined.get(name, 0)
+        # Only the first kind the name is defined as is deleted
+        for kind, bit in DEFINITION_KINDS.items():
+            if kinds & bit:
+                self.remove_definition(kind, name)
+                break
+        if name in self.newly_defined_type_variables:
+            self.remove_typed_definition(name)
+        if name in self.variable_types:
+            self.variable_types.pop(name)
+
+    def result(self):
+        new_definitions = {k: set(v) for k, v in self.new_definitions.items()}
+        for var, var_type in self.newly_defined_type_variables.items():
+            new_definitions["variables"].add(f"{var}[{var_type}]")
+
+        dependencies = {k: list(v) for k, v in self.dependencies.items()}
+        new_definitions = {k: list(v) for k, v in new_definitions.items()}
+
+        return {"dependencies": dependencies, "new_definitions": new_definitions}
+
+# Kinds of nested scopes
+FUNCTION_SCOPE = "function"
+CLASS_SCOPE = "class"
+COMPREHENSION_SCOPE = "comprehension"
+
+class Scope:
+    """
+    A function, lambda, comprehension or class body, linked to the enclosing scope.
+
+    As in the compiler, a name bound anywhere in a function or comprehension
+    is local to all of it, so the names such a scope uses are only resolved
+    when it ends. Class bodies look names up in order, and are not visible
+    from the scopes nested in them.
+    """
+
+    __slots__ = ("kind", "name", "outer", "names", "globals", "nonlocals", "uses")
+
+    def __init__(self, kind, outer, names=(), name=None):
+        self.kind = kind
+        # Class name, for class bodies
+        self.name = name
+        self.outer = outer
+        # Names bound in the scope
+        self.names = set(names)
+        self.globals = set()
+        self.nonlocals = set()
+        # (name, op, args) of the uses of names not resolved yet
+        self.uses = []
+
+def parameter_names(args):
+    names = [arg.arg for arg in args.posonlyargs]
+    names.extend(arg.arg for arg in args.args)
+    names.extend(arg.arg for arg in args.kwonlyargs)
+    if args.vararg is not None:
+        names.append(args.vararg.arg)
+    if args.kwarg is not None:
+        names.append(args.kwarg.arg)
+    return names
+
+class DependencyVisitor(ast.NodeVisitor):
+    """
+    Walks one top-level statement at a time and records, in `ops`, every
+    operation the statement performs on the module-level `AnalysisState`.
+
+    Nested scopes (functions, lambdas, comprehensions, class bodies) are
+    resolved while walking, since they cannot be affected by other
+    statements: the names they bind stay local unless declared `global`, and
+    only their uses of module-level names are recorded.
+
+    Each node is visited once, with no annotations left on the tree: the
+    context a node needs (the innermost scope, the call it is an argument
+    of) is held by the visitor while walking.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.ops = []
+        # Innermost nested scope, None at module level
+        self.scope = None
+        self.builtins = BUILTIN_NAMES
+        # Node type -> visitor method
+        self.visitors = {}
+
+    def record(self, stmt):
+        self.ops = []
+        self.visit(stmt)
+        return self.ops
+
+    def visit(self, node):
+        # Look up the visitor method once per node type rather than once per node
+        node_type = type(node)
+        visitor = self.visitors.get(node_type)
+        if visitor is None:
+            visitor = getattr(self, f"visit_{node_type.__name__}", None)
+            if visitor is None:
+                # Nodes without fields (expression contexts, operators) hold nothing to visit
+                visitor = self.generic_visit if node_type._fields else self.skip
+            self.visitors[node_type] = visitor
+        visitor(node)
+
+    def generic_visit(self, node):
+        visit = self.visit
+        for field in node._fields:
+            value = getattr(node, field, None)
+            if isinstance(value, list):
+                for item in value:
+                    if isinstance(item, ast.AST):
+                        visit(item)
+            elif isinstance(value, ast.AST):
+                visit(value)
+
+    def skip(self, node):
+        pass
+
+    # Constants hold no names
+    visit_Constant = skip
+
+    def visit_all(self, nodes):
+        visit = self.visit
+        for node in nodes:
+            visit(node)
+
+    # Name resolution
+
+    def use(self, name, op, args):
+        """Record `op` for a use of `name` in the current scope, if it resolves to a module-level name."""
+        scope = self.scope
+        if scope is None or name in scope.globals:
+            self.ops.append((op, args))
+            return
+        if scope.kind is CLASS_SCOPE:
+            if name in scope.names:
+                return
+            scope = enclosing_scope(scope.outer)
+            if scope is None:
+                self.ops.append((op, args))
+                return
+        scope.uses.append((name, op, args))
+
+    def enter_scope(self, kind, names=(), name=None):
+        self.scope = Scope(kind, self.scope, names, name)
+
+    def exit_scope(self):
+        scope = self.scope
+        self.scope = scope.outer
+        if scope.kind is CLASS_SCOPE:
+            # Already resolved
+            return
+        outer = enclosing_scope(scope.outer)
+        for use in scope.uses:
+            name = use[0]
+            if name in scope.globals:
+                self.ops.append(use[1:])
+            elif name in scope.names or name in scope.nonlocals:
+                continue
+            elif outer is None:
+                self.ops.append(use[1:])
+            else:
+                outer.uses.append(use)
+
+    def store_in(self, scope, name):
+        if scope is None:
+            self.ops.append((AnalysisState.store, (name, True)))
+        elif name in scope.globals:
+            self.ops.append((AnalysisState.store, (name, False)))
+        else:
+            scope.names.add(name)
+
+    def store(self, name):
+        self.store_in(self.scope, name)
+
+    def bind(self, name):
+        # Binding of a loop or exception variable, which is not a new definition
+        if self.scope is None:
+            self.ops.append((AnalysisState.bind, (name,)))
+        else:
+            self.store(name)
+
+    def bind_target(self, target):
+        if isinstance(target, ast.Name):
+            self.bind(target.id)
+        elif isinstance(target, (ast.Tuple, ast.List)):
+            for elt in target.elts:
+                self.bind_target(elt)
+        elif isinstance(target, ast.Starred):
+            self.bind_target(target.value)
+        else:
+            # Attributes and subscripts
+            self.visit(target)
+
+    def is_module_binding(self, name):
+        return self.scope is None or name in self.scope.globals
+
+    def visit_Name(self, node):
+        name = node.id
+        scope = self.scope
+        if isinstance(node.ctx, ast.Load):
+            if name in self.builtins:
+                return
+            if scope is None:
+                self.ops.append((AnalysisState.load, (name, True)))
+            else:
+                self.use(name, AnalysisState.load, (name, False))
+        elif isinstance(node.ctx, ast.Store):
+            if scope is None:
+                self.ops.append((AnalysisState.store, (name, True)))
+            else:
+                self.store_in(scope, name)
+        elif scope is not None and name not in scope.globals:
+            # `del` makes the name local too
+            scope.names.add(name)
+
+    def require_unscoped(self, name):
+        # Name use that only counts as a dependency if it is not bound in the current scope
+        if self.scope is None:
+            self.ops.append((AnalysisState.read, (name, True)))
+        else:
+            self.use(name, AnalysisState.read, (name, False))
+
+    def attribute_op(self, op, name, attr):
+        if name in self.builtins:
+            return
+        if self.scope is None:
+            self.ops.append((op, (name, attr, True)))
+        else:
+            self.use(name, op, (name, attr, False))
+
+    def write_through(self, node):
+        """Record the change of the attribute path at the root of `node` (e.g. `t.tasks` for `t.tasks[0].done`), if any."""
+        while isinstance(node, (ast.Attribute, ast.Subscript)):
+            value = node.value
+            if isinstance(node, ast.Attribute) and isinstance(value, ast.Name):
+                self.attribute_op(AnalysisState.write_attribute, value.id, node.attr)
+                return
+            node = value
+
+    def visit_Global(self, node):
+        if self.scope is not None:
+            self.scope.globals.update(node.names)
+
+    def visit_Nonlocal(self, node):
+        if self.scope is not None:
+            self.scope.nonlocals.update(node.names)
+
+    # Scopes
+
+    def visit_signature(self, args):
+        # Defaults and annotations are evaluated in the enclosing scope
+        self.visit_all(args.defaults)
+        self.visit_all([default for default in args.kw_defaults if default is not None])
+        for arg in (*args.posonlyargs, *args.args, args.vararg, *args.kwonlyargs, args.kwarg):
+            if arg is not None and arg.annotation is not None:
+                self.visit(arg.annotation)
+
+    def visit_FunctionDef(self, node):
+        self.visit_all(node.decorator_list)
+        self.visit_signature(node.args)
+        if node.returns is not None:
+            self.visit(node.returns)
+        scope = self.scope
+        if scope is None:
+            self.ops.append((AnalysisState.define, ("functions", node.name)))
+        elif scope.kind is CLASS_SCOPE and scope.outer is None:
+            # Methods of module-level classes
+            self.ops.append((AnalysisState.define, ("functions", f"{scope.name}.{node.name}")))
+            scope.names.add(node.name)
+        else:
+            self.store(node.name)
+        self.enter_scope(FUNCTION_SCOPE, parameter_names(node.args))
+        self.visit_all(node.body)
+        self.exit_scope()
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+
+    def visit_Lambda(self, node):
+        self.visit_signature(node.args)
+        self.enter_scope(FUNCTION_SCOPE, parameter_names(node.args))
+        self.visit(node.body)
+        self.exit_scope()
+
+    def visit_ClassDef(self, node):
+        self.visit_all(node.decorator_list)
+        self.visit_all(node.bases)
+        for keyword in node.keywords:
+            self.visit(keyword.value)
+        if self.scope is None:
+            self.ops.append((AnalysisState.define, ("classes", node.name)))
+        else:
+            self.store(node.name)
+        self.enter_scope(CLASS_SCOPE, name=node.name)
+        self.visit_all(node.body)
+        self.exit_scope()
+
+    def visit_comprehension_scope(self, node, *parts):
+        generators = node.generators
+        # The first iterable is evaluated in the enclosing scope
+        self.visit(generators[0].iter)
+        self.enter_scope(COMPREHENSION_SCOPE)
+        for i, generator in enumerate(generators):
+            if i:
+                self.visit(generator.iter)
+            self.visit(generator.target)
+            self.visit_all(generator.ifs)
+        self.visit_all(parts)
+        self.exit_scope()
+
+    def visit_ListComp(self, node):
+        self.visit_comprehension_scope(node, node.elt)
+
+    visit_SetComp = visit_ListComp
+    visit_GeneratorExp = visit_ListComp
+
+    def visit_DictComp(self, node):
+        self.visit_comprehension_scope(node, node.key, node.value)
+
+    def visit_NamedExpr(self, node):
+        self.visit(node.value)
+        # Comprehensions bind the target in the scope around them
+        scope = self.scope
+        while scope is not None and scope.kind is COMPREHENSION_SCOPE:
+            scope = scope.outer
+        self.store_in(scope, node.target.id)
+
+    # Statements
+
+    def visit_Import(self, node):
+        scope = self.scope
+        for alias in node.names:
+            module = alias.name.split(".")[0]
+            self.ops.append((AnalysisState.require, ("modules", module)))
+            name = alias.asname or module
+            if scope is None or name in scope.globals:
+                self.ops.append((AnalysisState.define, ("variables", name)))
+            else:
+                scope.names.add(name)
+
+    def visit_ImportFrom(self, node):
+        # `from . import x` names no module
+        if node.module is not None:
+            self.ops.append((AnalysisState.require, ("modules", node.module.split(".")[0])))
+        scope = self.scope
+        for alias in node.names:
+            name = alias.asname or alias.name
+            if scope is None or name in scope.globals:
+                self.ops.append((AnalysisState.define, ("variables", name)))
+            else:
+                scope.names.add(name)
+
+    def visit_Assign(self, node):
+        value = node.value
+        var_type = None
+        if isinstance(value, ast.Call) and isinstance(value.func, ast.Name):
+            var_type = value.func.id
+        elif isinstance(value, ast.Name):
+            var_type = f"<{value.id}>"
+        if var_type is not None:
+            # Track the types of module-level variables
             for target in node.targets:
-                self.visit(target)
+                if isinstance(target, ast.Name) and self.is_module_binding(target.id):
+                    self.ops.append((AnalysisState.set_type, (target.id, var_type)))
 
-        def visit_AugAssign(self, node):
-            if isinstance(node.target, ast.Name) and node.target.id not in self.current_scope[-1]:
-                dependencies["variables"].add(f"{node.target.id}")
+        self.visit(node.value)
+        for target in node.targets:
+            self.visit(target)
+
+    def visit_AnnAssign(self, node):
+        self.visit(node.annotation)
+        if node.value is not None:
             self.visit(node.value)
             self.visit(node.target)
+        elif isinstance(node.target, ast.Name):
+            # An annotation alone binds nothing, but makes the name local to a function
+            if self.scope is not None and node.target.id not in self.scope.globals:
+                self.scope.names.add(node.target.id)
+        else:
+            self.visit(node.target)
 
-        def visit_Call(self, node):
-            if isinstance(node.func, ast.Name):
-                if (
-                    node.func.id not in self.builtins
-                    and node.func.id not in self.current_scope[-1]
-                    and (node.func.id not in new_definitions["functions"] and node.func.id not in new_definitions["classes"])
-                ):
-                    if node.func.id[0].isupper():
-                        dependencies["classes"].add(node.func.id)
-                        if len(node.args) != 0:
-                            dependencies["functions"].add(f"{node.func.id}.__init__")
+    def visit_AugAssign(self, node):
+        target = node.target
+        if isinstance(target, ast.Name):
+            self.require_unscoped(target.id)
+        elif isinstance(target, ast.Attribute) and isinstance(target.value, ast.Name):
+            self.attribute_op(AnalysisState.read_attribute, target.value.id, target.attr)
+        self.visit(node.value)
+        self.visit(node.target)
 
+    def visit_Call(self, node):
+        func = node.func
+        if isinstance(func, ast.Name):
+            if func.id not in self.builtins:
+                if self.scope is None:
+                    self.ops.append((AnalysisState.call, (func.id, True, len(node.args) != 0)))
+                else:
+                    self.use(func.id, AnalysisState.call, (func.id, False, len(node.args) != 0))
+            # The called name is covered by the call, including when it is
+            # passed to itself as an argument
+            for arg in node.args:
+                if not (isinstance(arg, ast.Name) and arg.id == func.id):
+                    self.visit(arg)
+        else:
+            if isinstance(func, ast.Attribute):
+                if isinstance(func.value, ast.Name):
+                    name = func.value.id
+                    if name not in self.builtins:
+                        if self.scope is None:
+                            self.ops.append((AnalysisState.method_call, (name, func.attr, True)))
+                        else:
+                            self.use(name, AnalysisState.method_call, (name, func.attr, False))
+                elif func.attr in MUTATING_METHODS:
+                    # `t.tasks.append(x)` changes `t.tasks`
+                    self.write_through(func.value)
+            self.visit(func)
+            self.visit_all(node.args)
+        for keyword in node.keywords:
+            self.visit(keyword.value)
+
+    def visit_Attribute(self, node):
+        value = node.value
+        if isinstance(value, ast.Name):
+            if isinstance(node.ctx, ast.Load):
+                self.attribute_op(AnalysisState.read_attribute, value.id, node.attr)
+            else:
+                self.attribute_op(AnalysisState.write_attribute, value.id, node.attr)
+            return
+        if not isinstance(node.ctx, ast.Load):
+            # `t.tasks.last = x` changes `t.tasks`
+            self.write_through(value)
+        self.visit(value)
+
+    # Common expressions, without visiting their contexts and operators
+
+    def visit_BinOp(self, node):
+        self.visit(node.left)
+        self.visit(node.right)
+
+    def visit_Subscript(self, node):
+        if not isinstance(node.ctx, ast.Load):
+            # `t.tasks[0] = x` changes `t.tasks`
+            self.write_through(node.value)
+        self.visit(node.value)
+        self.visit(node.slice)
+
+    def visit_Expr(self, node):
+        self.visit(node.value)
+
+    def visit_For(self, node):
+        self.visit(node.iter)
+        self.bind_target(node.target)
+        self.visit_all(node.body)
+        self.visit_all(node.orelse)
+
+    visit_AsyncFor = visit_For
+
+    def visit_ExceptHandler(self, node):
+        if node.type is not None:
+            self.visit(node.type)
+        if node.name is not None:
+            # Unbound again when the handler ends
+            self.bind(node.name)
+        self.visit_all(node.body)
+
+    def visit_MatchAs(self, node):
+        if node.pattern is not None:
+            self.visit(node.pattern)
+        if node.name is not None:
+            self.store(node.name)
+
+    def visit_MatchStar(self, node):
+        if node.name is not None:
+            self.store(node.name)
+
+    def visit_MatchMapping(self, node):
+        self.visit_all(node.keys)
+        self.visit_all(node.patterns)
+        if node.rest is not None:
+            self.store(node.rest)
+
+    def visit_Delete(self, node):
+        for target in node.targets:
+            if isinstance(target, ast.Name) and self.scope is None:
+                self.ops.append((AnalysisState.delete, (target.id,)))
+            self.visit(target)
+
+def enclosing_scope(scope):
+    """The first of `scope` and its enclosing scopes that nested scopes can see into (class bodies are skipped)."""
+    while scope is not None and scope.kind is CLASS_SCOPE:
+        scope = scope.outer
+    return scope
+
+def record_statements(statements):
+    """Return the recorded operations of each statement, in order."""
+    visitor = DependencyVisitor()
+    return [visitor.record(stmt) for stmt in statements]
+
+def analyze_code(code):
+    tree = ast.parse(code)
+
+    state = AnalysisState()
+    for ops in record_statements(tree.body):
+        state.apply(ops)
+
+    return state.result()
+
+def describe_error(e):
+    return f"{type(e).__name__}: {e}"
+
+def analyze_code_or_error(code):
+    try:
+        return analyze_code(code)
+    except Exception as e:
+        return {"error": describe_error(e)}
+
+def analyze_many(codes, max_workers=None, parallel_threshold=PARALLEL_THRESHOLD, cache=None, cache_dir=None):
+    """
+    Analyze many code fragments in one call.
+
+    `codes` maps an id (e.g. a node id) to its source. The result maps the same
+    ids to the analysis result, or to {"error": ...} for fragments that could
+    not be analyzed. Large batches are fanned out across a process pool.
+    With an `AnalysisCache`, only fragments missing from the cache are analyzed.
+    """
+    if cache is not None:
+        results = {}
+        misses = {}
+        for code_id, code in codes.items():
+            result = cache.get(code, cache_dir)
+            if result is None:
+                misses[code_id] = code
+            else:
+                results[code_id] = result
+        for code_id, result in analyze_many(misses, max_workers, parallel_threshold).items():
+            if "error" not in result:
+                cache.put(misses[code_id], result, cache_dir)
+            results[code_id] = result
+        return {code_id: results[code_id] for code_id in codes}
+
+    ids = list(codes)
+    if max_workers == 1 or len(ids) < parallel_threshold:
+        return {code_id: analyze_code_or_error(codes[code_id]) for code_id in ids}
+
+    workers = max_workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        chunksize = max(1, len(ids) // (workers * 4))
+        results = executor.map(analyze_code_or_error, [codes[code_id] for code_id in ids], chunksize=chunksize)
+        return dict(zip(ids, results))
+
+def iter_code_nodes(graph):
+    """Yield (node id, codeData) for every node of a parsed .igc graph that holds code."""
+    for node in graph.get("nodes", []):
+        code_data = node.get("data", {}).get("codeData", {})
+        if code_data.get("code") is not None:
+            yield node["id"], code_data
+
+def load_igc_fragments(igc_path):
+    """Return {node id: code} for every node of an .igc graph that holds code."""
+    with open(igc_path) as f:
+        graph = json.load(f)
+    return {node_id: code_data["code"] for node_id, code_data in iter_code_nodes(graph)}
+
+def handle_request(request, cache=None, incremental=None, indexes=None, ops=None):
+    """
+    Answer a single daemon request.
+
+    {"id": ..., "code": ...} analyzes one fragment, {"id": ..., "codes": {...}}
+    analyzes a batch keyed by node id. Either may carry a "cache_dir" for the
+    on-disk cache. A single fragment may carry a "key" of the form
+    "<file>#<node id>" (and the node's "scope"), so edits of that node are
+    re-analyzed incrementally and reflected in the symbol index of the file.
+    A batch carrying a "file" (and "scopes") replaces that file's index.
+
+    {"id": ..., "op": "cache_stats"} reports the cache counters and
+    {"id": ..., "op": "symbol_index", "file": ...} returns a file's index.
+    Other operations are looked up in `ops`, {name: function(request)}.
+    """
+    request_id = request.get("id")
+    cache_dir = request.get("cache_dir")
+    try:
+        op = request.get("op")
+        if op == "cache_stats":
+            if cache is None:
+                raise ValueError("The analysis cache is disabled")
+            return {"id": request_id, "result": cache.stats()}
+        if op == "symbol_index":
+            if indexes is None:
+                raise ValueError("Symbol indexing is disabled")
+            return {"id": request_id, "result": indexes[request["file"]].to_json()}
+        if op is not None:
+            if ops is None or op not in ops:
+                raise ValueError(f"Unknown operation: {op}")
+            return {"id": request_id, "result": ops[op](request)}
+
+        if "codes" in request:
+            codes = request["codes"]
+            results = analyze_many(codes, cache=cache, cache_dir=cache_dir)
+            if indexes is not None and "file" in request:
+                index = indexes[request["file"]]
+                scopes = request.get("scopes") or {}
+                for node_id in set(index.nodes) - set(codes):
+                    index.remove_node(node_id)
+                for node_id, result in results.items():
+                    if "error" in result:
+                        index.remove_node(node_id)
                     else:
-                        dependencies["functions"].add(node.func.id)
-            elif isinstance(node.func, ast.Attribute):
-                if (
-                    isinstance(node.func.value, ast.Name)
-                    and node.func.value.id not in self.builtins
-                ):
-                    var_type = variable_types.get(node.func.value.id)
-                    if var_type:
-                        if f"{var_type}.{node.func.attr}" not in new_definitions["functions"]:
-                            dependencies["functions"].add(f"{var_type}.{node.func.attr}")
-                    else:
-                        if f"<{node.func.value.id}>.{node.func.attr}" not in new_definitions["functions"]:
-                            dependencies["variables"].add(f"{node.func.value.id}")
-                            dependencies["functions"].add(f"<{node.func.value.id}>.{node.func.attr}")
-            self.generic_visit(node)
-
-        def visit_Attribute(self, node):
-            if isinstance(node.value, ast.Name) and node.value.id not in self.builtins and node.value.id not in self.current_scope[-1]:
-                dependencies["variables"].add(f"{node.value.id}")
-            self.generic_visit(node)
-
-        def visit_For(self, node):
-            if isinstance(node.target, ast.Name):
-                self.current_scope[-1].add(node.target.id)
-            elif isinstance(node.target, ast.Tuple):
-                for elt in node.target.elts:
-                    if isinstance(elt, ast.Name):
-                        self.current_scope[-1].add(elt.id)
-            self.visit(node.iter)
-            for stmt in node.body:
-                self.visit(stmt)
-
-        def visit_While(self, node):
-            self.visit(node.test)
-            for n in node.body:
-                self.visit(n)
-            for n in node.orelse:
-                self.visit(n)
-
-        def visit_Delete(self, node):
-            for target in node.targets:
-                if isinstance(target, ast.Name):
-                    if target.id in new_definitions["variables"]:
-                        new_definitions["variables"].remove(f"{target.id}")
-                    elif target.id in new_definitions["functions"]:
-                        new_definitions["functions"].remove(f"{target.id}")
-                    elif target.id in new_definitions["classes"]:
-                        new_definitions["classes"].remove(f"{target.id}")
-                    if target.id in newly_defined_type_variables:
-                        newly_defined_type_variables.pop(target.id)
-                    if target.id in variable_types:
-                        variable_types.pop(target.id)
-                self.visit(target)
-
-        def generic_visit(self, node):
-            for child in ast.iter_child_nodes(node):
-                child.parent = node
-            super().generic_visit(node)
-
-    DependencyVisitor().visit(tree)
-
-    for var, var_type in newly_defined_type_variables.items():
-        new_definitions["variables"].add(f"{var}[{var_type}]")
-
-    dependencies = {k: list(v) for k, v in dependencies.items()}
-    new_definitions = {k: list(v) for k, v in new_definitions.items()}
-
-    return {"dependencies": dependencies, "new_definitions": new_definitions}
+                        index.update_node(node_id, result, scopes.get(node_id))
+            return {"id": request_id, "result": results}
+
+        code = request["code"]
+        key = request.get("key")
+        result = cache.get(code, cache_dir) if cache is not None else None
+        if result is None:
+            if incremental is not None and key is not None:
+                result = incremental.analyze(key, code)
+            else:
+                result = analyze_code(code)
+            if cache is not None:
+                cache.put(code, result, cache_dir)
+        if indexes is not None and key is not None and "#" in key:
+            file, node_id = key.rsplit("#", 1)
+            indexes[file].update_node(node_id, result, request.get("scope"))
+        return {"id": request_id, "result": result}
+    except Exception as e:
+        return {"id": request_id, "error": describe_error(e)}
+
+def serve(stdin, stdout, cache=None, incremental=None, indexes=None, ops=None):
+    """
+    Long-lived analyzer mode.
+
+    Reads newline-delimited JSON requests from stdin and writes one JSON
+    response line per request, so a single warm interpreter can serve every
+    analysis instead of paying start-up costs on each call.
+    """
+    for line in stdin:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            request = json.loads(line)
+        except json.JSONDecodeError as e:
+            response = {"id": None, "error": f"Invalid request: {e}"}
+        else:
+            response = handle_request(request, cache, incremental, indexes, ops)
+        stdout.write(json.dumps(response) + "\n")
+        stdout.flush()
 
 if __name__ == "__main__":
     import sys
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Analyze the dependencies and definitions of Python code.")
+    parser.add_argument("--serve", action="store_true", help="Serve newline-delimited JSON requests from stdin until EOF")
+    parser.add_argument("--igc", metavar="PATH", help="Analyze every code fragment of an .igc graph, keyed by node id")
+    parser.add_argument("--stream", action="store_true", help="Analyze stdin one top-level statement at a time, writing JSON lines")
+    parser.add_argument("--workers", type=int, default=None, help="Maximum worker processes for --igc (1 disables the pool)")
+    parser.add_argument("--cache-size", type=int, default=None, help="Maximum in-memory cache entries (0 disables the cache)")
+    parser.add_argument("--cache-dir", default=None, help="Directory for the on-disk analysis cache")
+    args = parser.parse_args()
+
+    from collections import defaultdict
+    from analysis_cache import AnalysisCache, DEFAULT_MAX_ENTRIES
+    from incremental_analysis import IncrementalAnalyzerPool
+    from dependency_index import SymbolIndex
+    from execution_planner import handle_plan_request
+    from execution_scheduler import handle_schedule_request
+    from type_propagation import handle_types_request
+
+    cache = None
+    if args.cache_size != 0:
+        cache = AnalysisCache(args.cache_size or DEFAULT_MAX_ENTRIES, args.cache_dir)
 
-    code = sys.stdin.read()
-    result = analyze_code(code)
-    print(json.dumps(result))
+    if args.serve:
+        ops = {
+            "plan": lambda request: handle_plan_request(request, cache),
+            "schedule": lambda request: handle_schedule_request(request, cache),
+            "types": lambda request: handle_types_request(request, cache),
+        }
+        serve(sys.stdin, sys.stdout, cache, IncrementalAnalyzerPool(), defaultdict(SymbolIndex), ops)
+    elif args.stream:
+        from streaming_analysis import stream_analysis
+        stream_analysis(sys.stdin.readline, sys.stdout.write, sys.stdout.flush)
+    elif args.igc:
+        print(json.dumps(analyze_many(load_igc_fragments(args.igc), max_workers=args.workers, cache=cache)))
+    else:
+        code = sys.stdin.read()
+        result = analyze_code(code)
+        print(json.dumps(result))
@@ -1,5 +1,11 @@
+import io
+import os
+import ast
+import json
+import symtable
+import tempfile
 import unittest
-from analyze_code import analyze_code
+from analyze_code import DependencyVisitor, analyze_code, analyze_many, load_igc_fragments, serve
 
 def sort_analysis_result(result):
     for key in result['dependencies']:
@@ -19,8 +25,9 @@ class TestAnalyzeCode(unittest.TestCase):
                 "functions": [],
                 "classes": [],
                 "modules": [],
+                "attributes": [],
             },
-            "new_definitions": {"variables": [], "functions": [], "classes": []},
+            "new_definitions": {"variables": [], "functions": [], "classes": [], "attributes": []},
         }
         result = analyze_code(code)
         self.assertEqual(sort_analysis_result(result), expected_output)
@@ -33,8 +40,9 @@ class TestAnalyzeCode(unittest.TestCase):
                 "functions": [],
                 "classes": [],
                 "modules": [],
+                "attributes": [],
             },
-            "new_definitions": {"variables": [], "functions": [], "classes": []},
+            "new_definitions": {"variables": [], "functions": [], "classes": [], "attributes": []},
         }
         try:
             result = analyze_code(code)
@@ -51,8 +59,9 @@ class TestAnalyzeCode(unittest.TestCase):
                 "functions": [],
                 "classes": [],
                 "modules": [],
+                "attributes": [],
             },
-            "new_definitions": {"variables": ["x"], "functions": [], "classes": []},
+            "new_definitions": {"variables": ["x"], "functions": [], "classes": [], "attributes": []},
         }
         result = analyze_code(code)
         self.assertEqual(sort_analysis_result(result), expected_output)
@@ -65,8 +74,9 @@ class TestAnalyzeCode(unittest.TestCase):
                 "functions": [],
                 "classes": [],
                 "modules": [],
+                "attributes": [],
             },
-            "new_definitions": {"variables": ["x", "y", "z"], "functions": [], "classes": []},
+            "new_definitions": {"variables": ["x", "y", "z"], "functions": [], "classes": [], "attributes": []},
         }
         result = analyze_code(code)
         self.assertEqual(sort_analysis_result(result), expected_output)
@@ -79,8 +89,9 @@ class TestAnalyzeCode(unittest.TestCase):
                 "functions": [],
                 "classes": [],
                 "modules": [],
+                "attributes": [],
             },
-            "new_definitions": {"variables": ["x", "y"], "functions": [], "classes": []},
+            "new_definitions": {"variables": ["x", "y"], "functions": [], "classes": [], "attributes": []},
         }
         result = analyze_code(code)
         self.assertEqual(sort_analysis_result(result), expected_output)
@@ -93,8 +104,9 @@ class TestAnalyzeCode(unittest.TestCase):
                 "functions": [],
                 "classes": [],
                 "modules": [],
+                "attributes": [],
             },
-            "new_definitions": {"variables": [], "functions": ["foo"], "classes": []},
+            "new_definitions": {"variables": [], "functions": ["foo"], "classes": [], "attributes": []},
         }
         result = analyze_code(code)
         self.assertEqual(sort_analysis_result(result), expected_output)
@@ -107,8 +119,9 @@ class TestAnalyzeCode(unittest.TestCase):
                 "functions": [],
                 "classes": [],
                 "modules": [],
+                "attributes": [],
             },
-            "new_definitions": {"variables": [], "functions": ["foo"], "classes": []},
+            "new_definitions": {"variables": [], "functions": ["foo"], "classes": [], "attributes": []},
         }
         result = analyze_code(code)
         self.assertEqual(sort_analysis_result(result), expected_output)
@@ -121,8 +134,9 @@ class TestAnalyzeCode(unittest.TestCase):
                 "functions": [],
                 "classes": [],
                 "modules": [],
+                "attributes": [],
             },
-            "new_definitions": {"variables": [], "functions": [], "classes": ["MyClass"]},
+            "new_definitions": {"variables": [], "functions": [], "classes": ["MyClass"], "attributes": []},
         }
         result = analyze_code(code)
         self.assertEqual(sort_analysis_result(result), expected_output)
@@ -135,8 +149,9 @@ class TestAnalyzeCode(unittest.TestCase):
                 "functions": [],
                 "classes": [],
                 "modules": [],
+                "attributes": [],
             },
-            "new_definitions": {"variables": [], "functions": ["MyClass.method"], "classes": ["MyClass"]},
+            "new_definitions": {"variables": [], "functions": ["MyClass.method"], "classes": ["MyClass"], "attributes": []},
         }
         result = analyze_code(code)
         self.assertEqual(sort_analysis_result(result), expected_output)
@@ -149,8 +164,9 @@ class TestAnalyzeCode(unittest.TestCase):
                 "functions": [],
                 "classes": [],
                 "modules": [],
+                "attributes": [],
             },
-            "new_definitions": {"variables": [], "functions": ["MyClass.method"], "classes": ["MyClass"]},
+            "new_definitions": {"variables": [], "functions": ["MyClass.method"], "classes": ["MyClass"], "attributes": []},
         }
         result = analyze_code(code)
         self.assertEqual(sort_analysis_result(result), expected_output)
@@ -163,8 +179,9 @@ class TestAnalyzeCode(unittest.TestCase):
                 "functions": [],
                 "classes": [],
                 "modules": [],
+                "attributes": [],
             },
-            "new_definitions": {"variables": [], "functions": [], "classes": []},
+            "new_definitions": {"variables": [], "functions": [], "classes": [], "attributes": []},
         }
         result = analyze_code(code)
         self.assertEqual(sort_analysis_result(result), expected_output)
@@ -178,8 +195,9 @@ class TestAnalyzeCode(unittest.TestCase):
                 "functions": [],
                 "classes": [],
                 "modules": [],
+                "attributes": [],
             },
-            "new_definitions": {"variables": [], "functions": [], "classes": []},
+            "new_definitions": {"variables": [], "functions": [], "classes": [], "attributes": []},
         }
         result = analyze_code(code)
         self.assertEqual(sort_analysis_result(result), expected_output)
@@ -192,8 +210,9 @@ class TestAnalyzeCode(unittest.TestCase):
                 "functions": ["foo"],
                 "classes": [],
                 "modules": [],
+                "attributes": [],
             },
-            "new_definitions": {"variables": [], "functions": [], "classes": []},
+            "new_definitions": {"variables": [], "functions": [], "classes": [], "attributes": []},
         }
         result = analyze_code(code)
         self.assertEqual(sort_analysis_result(result), expected_output)
@@ -206,8 +225,9 @@ class TestAnalyzeCode(unittest.TestCase):
                 "functions": ["foo"],
                 "classes": [],
                 "modules": [],
+                "attributes": [],
             },
-            "new_definitions": {"variables": ["result[foo]"], "functions": [], "classes": []},
+            "new_definitions": {"variables": ["result[foo]"], "functions": [], "classes": [], "attributes": []},
         }
         result = analyze_code(code)
         self.assertEqual(sort_analysis_result(result), expected_output)
@@ -220,8 +240,9 @@ class TestAnalyzeCode(unittest.TestCase):
                 "functions": ["Animal.__init__"],
                 "classes": ["Animal"],
                 "modules": [],
+                "attributes": [],
             },
-            "new_definitions": {"variables": [], "functions": [], "classes": []},
+            "new_definitions": {"variables": [], "functions": [], "classes": [], "attributes": []},
         }
         result = analyze_code(code)
         self.assertEqual(sort_analysis_result(result), expected_output)
@@ -234,8 +255,9 @@ class TestAnalyzeCode(unittest.TestCase):
                 "functions": ["Animal.__init__"],
                 "classes": ["Animal"],
                 "modules": [],
+                "attributes": [],
             },
-            "new_definitions": {"variables": ["animal[Animal]"], "functions": [], "classes": []},
+            "new_definitions": {"variables": ["animal[Animal]"], "functions": [], "classes": [], "attributes": []},
         }
         result = analyze_code(code)
         self.assertEqual(sort_analysis_result(result), expected_output)
@@ -248,8 +270,9 @@ class TestAnalyzeCode(unittest.TestCase):
                 "functions": ["Animal.__init__", "Animal.getName"],
                 "classes": ["Animal"],
                 "modules": [],
+                "attributes": [],
             },
-            "new_definitions": {"variables": ["animal[Animal]"], "functions": [], "classes": []},
+            "new_definitions": {"variables": ["animal[Animal]"], "functions": [], "classes": [], "attributes": []},
         }
         result = analyze_code(code)
         self.assertEqual(sort_analysis_result(result), expected_output)
@@ -262,8 +285,9 @@ class TestAnalyzeCode(unittest.TestCase):
                 "functions": ["<animal>.getName"],
                 "classes": [],
                 "modules": [],
+                "attributes": [],
             },
-            "new_definitions": {"variables": [], "functions": [], "classes": []},
+            "new_definitions": {"variables": [], "functions": [], "classes": [], "attributes": []},
         }
         result = analyze_code(code)
         self.assertEqual(sort_analysis_result(result), expected_output)
@@ -276,8 +300,9 @@ class TestAnalyzeCode(unittest.TestCase):
                 "functions": ["Animal.__init__", "Dog.__init__", "Dog.getName"],
                 "classes": ["Animal", "Dog"],
                 "modules": [],
+                "attributes": [],
             },
-            "new_definitions": {"variables": ["animal[Dog]"], "functions": [], "classes": []},
+            "new_definitions": {"variables": ["animal[Dog]"], "functions": [], "classes": [], "attributes": []},
         }
         result = analyze_code(code)
         self.assertEqual(sort_analysis_result(result), expected_output)
@@ -290,8 +315,9 @@ class TestAnalyzeCode(unittest.TestCase):
                 "functions": ["Animal.__init__", "Animal.getName", "Dog.__init__"],
                 "classes": ["Animal", "Dog"],
                 "modules": [],
+                "attributes": [],
             },
-            "new_definitions": {"variables": ["animal[Dog]"], "functions": [], "classes": []},
+            "new_definitions": {"variables": ["animal[Dog]"], "functions": [], "classes": [], "attributes": []},
         }
         result = analyze_code(code)
         self.assertEqual(sort_analysis_result(result), expected_output)
@@ -304,8 +330,9 @@ class TestAnalyzeCode(unittest.TestCase):
                 "functions": ["<x>.getName", "Animal.__init__"],
                 "classes": ["Animal"],
                 "modules": [],
+                "attributes": [],
             },
-            "new_definitions": {"variables": ["animal[<x>]"], "functions": [], "classes": []},
+            "new_definitions": {"variables": ["animal[<x>]"], "functions": [], "classes": [], "attributes": []},
         }
         result = analyze_code(code)
         self.assertEqual(sort_analysis_result(result), expected_output)
@@ -318,8 +345,9 @@ class TestAnalyzeCode(unittest.TestCase):
                 "functions": [],
                 "classes": [],
                 "modules": ["os"],
+                "attributes": [],
             },
-            "new_definitions": {"variables": ["os"], "functions": [], "classes": []},
+            "new_definitions": {"variables": ["os"], "functions": [], "classes": [], "attributes": []},
         }
         result = analyze_code(code)
         self.assertEqual(sort_analysis_result(result), expected_output)
@@ -332,8 +360,9 @@ class TestAnalyzeCode(unittest.TestCase):
                 "functions": [],
                 "classes": [],
                 "modules": ["os"],
+                "attributes": [],
             },
-            "new_definitions": {"variables": ["special_os"], "functions": [], "classes": []},
+            "new_definitions": {"variables": ["special_os"], "functions": [], "classes": [], "attributes": []},
         }
         result = analyze_code(code)
         self.assertEqual(sort_analysis_result(result), expected_output)
@@ -346,8 +375,24 @@ class TestAnalyzeCode(unittest.TestCase):
                 "functions": [],
                 "classes": [],
                 "modules": ["urllib"],
+                "attributes": [],
             },
-            "new_definitions": {"variables": ["request"], "functions": [], "classes": []},
+            "new_definitions": {"variables": ["request"], "functions": [], "classes": [], "attributes": []},
+        }
+        result = analyze_code(code)
+        self.assertEqual(sort_analysis_result(result), expected_output)
+
+    def test_relative_import_dependency(self):
+        code = "from . import sibling\nfrom .package.module import f"
+        expected_output = {
+            "dependencies": {
+                "variables": [],
+                "functions": [],
+                "classes": [],
+                "modules": ["package"],
+                "attributes": [],
+            },
+            "new_definitions": {"variables": ["f", "sibling"], "functions": [], "classes": [], "attributes": []},
         }
         result = analyze_code(code)
         self.assertEqual(sort_analysis_result(result), expected_output)
@@ -360,8 +405,9 @@ class TestAnalyzeCode(unittest.TestCase):
                 "functions": [],
                 "classes": [],
                 "modules": ["urllib"],
+                "attributes": [],
             },
-            "new_definitions": {"variables": ["req"], "functions": [], "classes": []},
+            "new_definitions": {"variables": ["req"], "functions": [], "classes": [], "attributes": []},
         }
         result = analyze_code(code)
         self.assertEqual(sort_analysis_result(result), expected_output)
@@ -375,8 +421,9 @@ class TestAnalyzeCode(unittest.TestCase):
                 "functions": [],
                 "classes": [],
                 "modules": [],
+                "attributes": [],
             },
-            "new_definitions": {"variables": ["x"], "functions": [], "classes": []},
+            "new_definitions": {"variables": ["x"], "functions": [], "classes": [], "attributes": []},
         }
         result = analyze_code(code)
         self.assertEqual(sort_analysis_result(result), expected_output)
@@ -389,8 +436,9 @@ class TestAnalyzeCode(unittest.TestCase):
                 "functions": [],
                 "classes": [],
                 "modules": [],
+                "attributes": [],
             },
-            "new_definitions": {"variables": [], "functions": ["foo"], "classes": []},
+            "new_definitions": {"variables": [], "functions": ["foo"], "classes": [], "attributes": []},
         }
         result = analyze_code(code)
         self.assertEqual(sort_analysis_result(result), expected_output)
@@ -403,8 +451,9 @@ class TestAnalyzeCode(unittest.TestCase):
                 "functions": [],
                 "classes": [],
                 "modules": [],
+                "attributes": [],
             },
-            "new_definitions": {"variables": ["animal[Animal]"], "functions": ["Animal.__init__"], "classes": ["Animal"]},
+            "new_definitions": {"variables": ["animal[Animal]"], "functions": ["Animal.__init__"], "classes": ["Animal"], "attributes": []},
         }
         result = analyze_code(code)
         self.assertEqual(sort_analysis_result(result), expected_output)
@@ -417,8 +466,9 @@ class TestAnalyzeCode(unittest.TestCase):
                 "functions": [],
                 "classes": [],
                 "modules": [],
+                "attributes": [],
             },
-            "new_definitions": {"variables": ["animal[Animal]"], "functions": [], "classes": ["Animal"]},
+            "new_definitions": {"variables": ["animal[Animal]"], "functions": [], "classes": ["Animal"], "attributes": []},
         }
         result = analyze_code(code)
         self.assertEqual(sort_analysis_result(result), expected_output)
@@ -432,8 +482,9 @@ class TestAnalyzeCode(unittest.TestCase):
                 "functions": [],
                 "classes": [],
                 "modules": [],
+                "attributes": [],
             },
-            "new_definitions": {"variables": ["x"], "functions": [], "classes": []},
+            "new_definitions": {"variables": ["x"], "functions": [], "classes": [], "attributes": []},
         }
         result = analyze_code(code)
         self.assertEqual(sort_analysis_result(result), expected_output)
@@ -446,8 +497,9 @@ class TestAnalyzeCode(unittest.TestCase):
                 "functions": [],
                 "classes": [],
                 "modules": [],
+                "attributes": [],
             },
-            "new_definitions": {"variables": ["x"], "functions": [], "classes": []},
+            "new_definitions": {"variables": ["x"], "functions": [], "classes": [], "attributes": []},
         }
         result = analyze_code(code)
         self.assertEqual(sort_analysis_result(result), expected_output)
@@ -460,8 +512,9 @@ class TestAnalyzeCode(unittest.TestCase):
                 "functions": [],
                 "classes": [],
                 "modules": [],
+                "attributes": [],
             },
-            "new_definitions": {"variables": ["x"], "functions": [], "classes": []},
+            "new_definitions": {"variables": ["x"], "functions": [], "classes": [], "attributes": []},
         }
         result = analyze_code(code)
         self.assertEqual(sort_analysis_result(result), expected_output)
@@ -474,8 +527,9 @@ class TestAnalyzeCode(unittest.TestCase):
                 "functions": ["foo"],
                 "classes": [],
                 "modules": [],
+                "attributes": [],
             },
-            "new_definitions": {"variables": [], "functions": ["foo"], "classes": []},
+            "new_definitions": {"variables": [], "functions": ["foo"], "classes": [], "attributes": []},
         }
         result = analyze_code(code)
         self.assertEqual(sort_analysis_result(result), expected_output)
@@ -488,8 +542,9 @@ class TestAnalyzeCode(unittest.TestCase):
                 "functions": ["Animal.__init__"],
                 "classes": ["Animal"],
                 "modules": [],
+                "attributes": [],
             },
-            "new_definitions": {"variables": ["animal[Animal]"], "functions": ["Animal.__init__"], "classes": ["Animal"]},
+            "new_definitions": {"variables": ["animal[Animal]"], "functions": ["Animal.__init__"], "classes": ["Animal"], "attributes": []},
         }
         result = analyze_code(code)
         self.assertEqual(sort_analysis_result(result), expected_output)
@@ -503,8 +558,9 @@ class TestAnalyzeCode(unittest.TestCase):
                 "functions": [],
                 "classes": ["Animal"],
                 "modules": [],
+                "attributes": [],
             },
-            "new_definitions": {"variables": ["animal[Animal]"], "functions": [], "classes": []},
+            "new_definitions": {"variables": ["animal[Animal]"], "functions": [], "classes": [], "attributes": []},
         }
         result = analyze_code(code)
         self.assertEqual(sort_analysis_result(result), expected_output)
@@ -517,8 +573,9 @@ class TestAnalyzeCode(unittest.TestCase):
                 "functions": ["Animal.__init__"],
                 "classes": ["Animal"],
                 "modules": [],
+                "attributes": [],
             },
-            "new_definitions": {"variables": ["animal[Animal]"], "functions": [], "classes": []},
+            "new_definitions": {"variables": ["animal[Animal]"], "functions": [], "classes": [], "attributes": []},
         }
         result = analyze_code(code)
         self.assertEqual(sort_analysis_result(result), expected_output)
@@ -531,8 +588,9 @@ class TestAnalyzeCode(unittest.TestCase):
                 "functions": [],
                 "classes": [],
                 "modules": [],
+                "attributes": [],
             },
-            "new_definitions": {"variables": [], "functions": [], "classes": []},
+            "new_definitions": {"variables": [], "functions": [], "classes": [], "attributes": []},
         }
         result = analyze_code(code)
         self.assertEqual(sort_analysis_result(result), expected_output)
@@ -545,8 +603,9 @@ class TestAnalyzeCode(unittest.TestCase):
                 "functions": [],
                 "classes": [],
                 "modules": [],
+                "attributes": [],
             },
-            "new_definitions": {"variables": [], "functions": [], "classes": []},
+            "new_definitions": {"variables": [], "functions": [], "classes": [], "attributes": []},
         }
         result = analyze_code(code)
         self.assertEqual(sort_analysis_result(result), expected_output)
@@ -559,8 +618,9 @@ class TestAnalyzeCode(unittest.TestCase):
                 "functions": [],
                 "classes": [],
                 "modules": [],
+                "attributes": [],
             },
-            "new_definitions": {"variables": [], "functions": [], "classes": []},
+            "new_definitions": {"variables": [], "functions": [], "classes": [], "attributes": []},
         }
         result = analyze_code(code)
         self.assertEqual(sort_analysis_result(result), expected_output)
@@ -573,8 +633,9 @@ class TestAnalyzeCode(unittest.TestCase):
                 "functions": [],
                 "classes": [],
                 "modules": [],
+                "attributes": [],
             },
-            "new_definitions": {"variables": ["i"], "functions": [], "classes": []},
+            "new_definitions": {"variables": ["i"], "functions": [], "classes": [], "attributes": []},
         }
         result = analyze_code(code)
         self.assertEqual(sort_analysis_result(result), expected_output)
@@ -588,8 +649,9 @@ class TestAnalyzeCode(unittest.TestCase):
                 "functions": [],
                 "classes": [],
                 "modules": [],
+                "attributes": [],
             },
-            "new_definitions": {"variables": ["i", "j"], "functions": [], "classes": []},
+            "new_definitions": {"variables": ["i", "j"], "functions": [], "classes": [], "attributes": []},
         }
         result = analyze_code(code)
         self.assertEqual(sort_analysis_result(result), expected_output)
@@ -603,8 +665,9 @@ class TestAnalyzeCode(unittest.TestCase):
                 "functions": [],
                 "classes": [],
                 "modules": [],
+                "attributes": [],
             },
-            "new_definitions": {"variables": ["obj[MyClass]"], "functions": ["MyClass.method"], "classes": ["MyClass"]},
+            "new_definitions": {"variables": ["obj[MyClass]"], "functions": ["MyClass.method"], "classes": ["MyClass"], "attributes": []},
         }
         result = analyze_code(code)
         self.assertEqual(sort_analysis_result(result), expected_output)
@@ -618,8 +681,9 @@ class TestAnalyzeCode(unittest.TestCase):
                 "functions": [],
                 "classes": [],
                 "modules": [],
+                "attributes": [],
             },
-            "new_definitions": {"variables": [], "functions": ["add_code_to_class"], "classes": []},
+            "new_definitions": {"variables": [], "functions": ["add_code_to_class"], "classes": [], "attributes": []},
         }
         result = analyze_code(code)
         self.assertEqual(sort_analysis_result(result), expected_output)
@@ -633,8 +697,9 @@ class TestAnalyzeCode(unittest.TestCase):
                 "functions": [],
                 "classes": [],
                 "modules": [],
+                "attributes": [],
             },
-            "new_definitions": {"variables": ["i"], "functions": [], "classes": []},
+            "new_definitions": {"variables": ["i"], "functions": [], "classes": [], "attributes": []},
         }
         result = analyze_code(code)
         self.assertEqual(sort_analysis_result(result), expected_output)
@@ -648,8 +713,9 @@ class TestAnalyzeCode(unittest.TestCase):
                 "functions": [],
                 "classes": [],
                 "modules": [],
+                "attributes": [],
             },
-            "new_definitions": {"variables": ["i"], "functions": [], "classes": []},
+            "new_definitions": {"variables": ["i"], "functions": [], "classes": [], "attributes": []},
         }
         result = analyze_code(code)
         self.assertEqual(sort_analysis_result(result), expected_output)
@@ -663,8 +729,9 @@ class TestAnalyzeCode(unittest.TestCase):
                 "functions": [],
                 "classes": [],
                 "modules": [],
+                "attributes": [],
             },
-            "new_definitions": {"variables": ["i"], "functions": [], "classes": []},
+            "new_definitions": {"variables": ["i"], "functions": [], "classes": [], "attributes": []},
         }
         result = analyze_code(code)
         self.assertEqual(sort_analysis_result(result), expected_output)
@@ -678,8 +745,9 @@ class TestAnalyzeCode(unittest.TestCase):
                 "functions": [],
                 "classes": [],
                 "modules": [],
+                "attributes": [],
             },
-            "new_definitions": {"variables": [], "functions": [], "classes": []},
+            "new_definitions": {"variables": [], "functions": [], "classes": [], "attributes": []},
         }
         result = analyze_code(code)
         self.assertEqual(sort_analysis_result(result), expected_output)
@@ -693,8 +761,9 @@ class TestAnalyzeCode(unittest.TestCase):
                 "functions": [],
                 "classes": [],
                 "modules": [],
+                "attributes": [],
             },
-            "new_definitions": {"variables": [], "functions": [], "classes": []},
+            "new_definitions": {"variables": [], "functions": [], "classes": [], "attributes": []},
         }
         result = analyze_code(code)
         self.assertEqual(sort_analysis_result(result), expected_output)
@@ -708,8 +777,9 @@ class TestAnalyzeCode(unittest.TestCase):
                 "functions": [],
                 "classes": [],
                 "modules": [],
+                "attributes": [],
             },
-            "new_definitions": {"variables": ["a[A]"], "functions": [], "classes": ["A"]},
+            "new_definitions": {"variables": ["a[A]"], "functions": [], "classes": ["A"], "attributes": []},
         }
         result = analyze_code(code)
         self.assertEqual(sort_analysis_result(result), expected_output)
@@ -723,8 +793,9 @@ class TestAnalyzeCode(unittest.TestCase):
                 "functions": [],
                 "classes": [],
                 "modules": [],
+                "attributes": [],
             },
-            "new_definitions": {"variables": ["lst"], "functions": [], "classes": []},
+            "new_definitions": {"variables": ["lst"], "functions": [], "classes": [], "attributes": []},
         }
         result = analyze_code(code)
         self.assertEqual(sort_analysis_result(result), expected_output)
@@ -738,8 +809,9 @@ class TestAnalyzeCode(unittest.TestCase):
                 "functions": [],
                 "classes": [],
                 "modules": [],
+                "attributes": [],
             },
-            "new_definitions": {"variables": [], "functions": ["foo"], "classes": []},
+            "new_definitions": {"variables": [], "functions": ["foo"], "classes": [], "attributes": []},
         }
         result = analyze_code(code)
         self.assertEqual(sort_analysis_result(result), expected_output)
@@ -753,8 +825,9 @@ class TestAnalyzeCode(unittest.TestCase):
                 "functions": [],
                 "classes": [],
                 "modules": [],
+                "attributes": [],
             },
-            "new_definitions": {"variables": [], "functions": [], "classes": []},
+            "new_definitions": {"variables": [], "functions": [], "classes": [], "attributes": []},
         }
         result = analyze_code(code)
         self.assertEqual(sort_analysis_result(result), expected_output)
@@ -768,8 +841,9 @@ class TestAnalyzeCode(unittest.TestCase):
                 "functions": [],
                 "classes": [],
                 "modules": [],
+                "attributes": [],
             },
-            "new_definitions": {"variables": [], "functions": [], "classes": []},
+            "new_definitions": {"variables": [], "functions": [], "classes": [], "attributes": []},
         }
         result = analyze_code(code)
         self.assertEqual(sort_analysis_result(result), expected_output)
@@ -783,11 +857,348 @@ class TestAnalyzeCode(unittest.TestCase):
                 "functions": [],
                 "classes": [],
                 "modules": [],
+                "attributes": [],
             },
-            "new_definitions": {"variables": ["lst"], "functions": [], "classes": []},
+            "new_definitions": {"variables": ["lst"], "functions": [], "classes": [], "attributes": []},
         }
         result = analyze_code(code)
         self.assertEqual(sort_analysis_result(result), expected_output)
 
+    # Test case for deleting names bound by earlier fragments
+    def test_del_external_names(self):
+        code = "del x\ny = 1\ndel y\nif flag:\n    del z"
+        expected_output = {
+            "dependencies": {
+                "variables": ["flag", "x", "z"],
+                "functions": [],
+                "classes": [],
+                "modules": [],
+                "attributes": [],
+            },
+            "new_definitions": {"variables": [], "functions": [], "classes": [], "attributes": []},
+        }
+        result = analyze_code(code)
+        self.assertEqual(sort_analysis_result(result), expected_output)
+
+    # Test case for a function passed to itself, keyword arguments and calls of call results
+    def test_call_arguments(self):
+        code = "f(f, g, key=h)\nmake()(value)"
+        expected_output = {
+            "dependencies": {
+                "variables": ["g", "h", "value"],
+                "functions": ["f", "make"],
+                "classes": [],
+                "modules": [],
+                "attributes": [],
+            },
+            "new_definitions": {"variables": [], "functions": [], "classes": [], "attributes": []},
+        }
+        result = analyze_code(code)
+        self.assertEqual(sort_analysis_result(result), expected_output)
+
+    # Scopes: comprehension variables stay in the comprehension
+    def test_scope_comprehension_variables(self):
+        code = "squares = [i * i for i in range(n)]\nlookup = {k: v for k, v in items}"
+        expected_output = {
+            "dependencies": {
+                "variables": ["items", "n"],
+                "functions": [],
+                "classes": [],
+                "modules": [],
+                "attributes": [],
+            },
+            "new_definitions": {"variables": ["lookup", "squares"], "functions": [], "classes": [], "attributes": []},
+        }
+        result = analyze_code(code)
+        self.assertEqual(sort_analysis_result(result), expected_output)
+
+    # Scopes: every kind of lambda parameter is local
+    def test_scope_lambda_parameters(self):
+        code = "key = lambda item, *rest, reverse=False, **kw: (item[0], order, rest)"
+        expected_output = {
+            "dependencies": {
+                "variables": ["order"],
+                "functions": [],
+                "classes": [],
+                "modules": [],
+                "attributes": [],
+            },
+            "new_definitions": {"variables": ["key"], "functions": [], "classes": [], "attributes": []},
+        }
+        result = analyze_code(code)
+        self.assertEqual(sort_analysis_result(result), expected_output)
+
+    # Scopes: function locals, nested functions and local imports are not definitions
+    def test_scope_function_locals(self):
+        code = "def f(a, *args, b=default, **kw):\n    total = a + b + offset\n    import json\n    def inner():\n        return total + scale\n    return json.dumps(inner())"
+        expected_output = {
+            "dependencies": {
+                "variables": ["default", "offset", "scale"],
+                "functions": [],
+                "classes": [],
+                "modules": ["json"],
+                "attributes": [],
+            },
+            "new_definitions": {"variables": [], "functions": ["f"], "classes": [], "attributes": []},
+        }
+        result = analyze_code(code)
+        self.assertEqual(sort_analysis_result(result), expected_output)
+
+    # Scopes: `global` names are defined, `nonlocal` names are not
+    def test_scope_global_and_nonlocal(self):
+        code = "def reset():\n    global counter\n    counter = 0\n\ndef make():\n    count = 0\n    def inc():\n        nonlocal count\n        count += step\n    return inc"
+        expected_output = {
+            "dependencies": {
+                "variables": ["step"],
+                "functions": [],
+                "classes": [],
+                "modules": [],
+                "attributes": [],
+            },
+            "new_definitions": {"variables": ["counter"], "functions": ["make", "reset"], "classes": [], "attributes": []},
+        }
+        result = analyze_code(code)
+        self.assertEqual(sort_analysis_result(result), expected_output)
+
+    # Scopes: an assignment expression in a comprehension binds in the enclosing scope
+    def test_scope_named_expression(self):
+        code = "if any((last := x) > limit for x in values):\n    print(last)"
+        expected_output = {
+            "dependencies": {
+                "variables": ["limit", "values"],
+                "functions": [],
+                "classes": [],
+                "modules": [],
+                "attributes": [],
+            },
+            "new_definitions": {"variables": ["last"], "functions": [], "classes": [], "attributes": []},
+        }
+        result = analyze_code(code)
+        self.assertEqual(sort_analysis_result(result), expected_output)
+
+    # Scopes: class attributes are only visible in the class body
+    def test_scope_class_attributes(self):
+        code = "class A(Base):\n    size = 3\n    double = size * 2\n    def m(self):\n        return size"
+        expected_output = {
+            "dependencies": {
+                "variables": ["Base", "size"],
+                "functions": [],
+                "classes": [],
+                "modules": [],
+                "attributes": [],
+            },
+            "new_definitions": {"variables": [], "functions": ["A.m"], "classes": ["A"], "attributes": []},
+        }
+        result = analyze_code(code)
+        self.assertEqual(sort_analysis_result(result), expected_output)
+
+    # Scopes: decorators and defaults are evaluated outside of the function
+    def test_scope_decorators_and_defaults(self):
+        code = "@decorate(option)\ndef f(x=default):\n    return x"
+        expected_output = {
+            "dependencies": {
+                "variables": ["default", "option"],
+                "functions": ["decorate"],
+                "classes": [],
+                "modules": [],
+                "attributes": [],
+            },
+            "new_definitions": {"variables": [], "functions": ["f"], "classes": [], "attributes": []},
+        }
+        result = analyze_code(code)
+        self.assertEqual(sort_analysis_result(result), expected_output)
+
+    def test_scope_method_calls_on_bound_names(self):
+        code = "lst = []\nlst.append(1)\nimport json\njson.dumps(lst)\nitems.append(2)"
+        expected_output = {
+            "dependencies": {
+                "variables": ["items"],
+                "functions": ["<items>.append"],
+                "classes": [],
+                "modules": ["json"],
+                "attributes": [],
+            },
+            "new_definitions": {"variables": ["json", "lst"], "functions": [], "classes": [], "attributes": []},
+        }
+        result = analyze_code(code)
+        self.assertEqual(sort_analysis_result(result), expected_output)
+
+    def test_scope_method_calls_on_with_targets(self):
+        code = "with open(path) as fh:\n    text = fh.read()\nlog.write(text)"
+        expected_output = {
+            "dependencies": {
+                "variables": ["log", "path"],
+                "functions": ["<log>.write"],
+                "classes": [],
+                "modules": [],
+                "attributes": [],
+            },
+            "new_definitions": {"variables": ["fh", "text"], "functions": [], "classes": [], "attributes": []},
+        }
+        result = analyze_code(code)
+        self.assertEqual(sort_analysis_result(result), expected_output)
+
+    # Every dependency found is a global reference for the compiler
+    def test_scope_dependencies_are_global_references(self):
+        code = (
+            "import os\nclass A(Base):\n    size = 3\n    items = [size for _ in range(n)]\n"
+            "    def m(self, k=size):\n        v = [w for w in self.items if w > cutoff]\n        return helper(v, k)\n"
+            "def g():\n    x = 1\n    def h():\n        nonlocal x\n        x = lookup(x)\n    return h\n"
+            "total = sum(y for y in values if (found := y) > limit)\nprint(os.sep, found)"
+        )
+        global_names = set()
+        tables = [symtable.symtable(code, "<fragment>", "exec")]
+        while tables:
+            table = tables.pop()
+            tables.extend(table.get_children())
+            for symbol in table.get_symbols():
+                if symbol.is_referenced() and (symbol.is_global() or table.get_type() == "module"):
+                    global_names.add(symbol.get_name())
+        dependencies = analyze_code(code)["dependencies"]
+        found = {name for kind, names in dependencies.items() if kind != "attributes" for name in names}
+        # A comprehension in a class body does not see the class attributes
+        self.assertEqual(found, {"os", "Base", "size", "n", "cutoff", "helper", "lookup", "values", "limit"})
+        self.assertLessEqual(found, global_names)
+
+    # Attributes: paths read and changed, for variables only used through their attributes
+    def test_attribute_paths(self):
+        code = (
+            "print(task.title)\ntracker.tasks.append(task.title)\ntracker.count += 1\n"
+            "tracker.log[0] = ''\ndel tracker.old\nconfig.debug = True"
+        )
+        expected_output = {
+            "dependencies": {
+                "variables": ["config", "task", "tracker"],
+                "functions": [],
+                "classes": [],
+                "modules": [],
+                "attributes": ["task.title", "tracker.count", "tracker.log", "tracker.tasks"],
+            },
+            "new_definitions": {
+                "variables": [],
+                "functions": [],
+                "classes": [],
+                "attributes": ["config.debug", "tracker.count", "tracker.log", "tracker.old", "tracker.tasks"],
+            },
+        }
+        result = analyze_code(code)
+        self.assertEqual(sort_analysis_result(result), expected_output)
+
+    # Attributes: a variable used as a whole, or defined by the fragment, has no paths
+    def test_attribute_paths_of_whole_variables(self):
+        code = "task.done = True\nsave(task)\ntracker.name\ntracker.add(task)\nlog = Log()\nlog.level = 1\nos.path.join(a)"
+        expected_output = {
+            "dependencies": {
+                "variables": ["a", "os", "task", "tracker"],
+                "functions": ["<tracker>.add", "save"],
+                "classes": ["Log"],
+                "modules": [],
+                "attributes": ["os.path"],
+            },
+            "new_definitions": {"variables": ["log[Log]"], "functions": [], "classes": [], "attributes": []},
+        }
+        result = analyze_code(code)
+        self.assertEqual(sort_analysis_result(result), expected_output)
+
+    # Attributes: uses in function bodies are reported, those of local names are not
+    def test_attribute_paths_in_functions(self):
+        code = "def reset(self):\n    self.items = []\n    settings.dirty = settings.count > limit"
+        expected_output = {
+            "dependencies": {
+                "variables": ["limit", "settings"],
+                "functions": [],
+                "classes": [],
+                "modules": [],
+                "attributes": ["settings.count"],
+            },
+            "new_definitions": {"variables": [], "functions": ["reset"], "classes": [], "attributes": ["settings.dirty"]},
+        }
+        result = analyze_code(code)
+        self.assertEqual(sort_analysis_result(result), expected_output)
+
+    def test_tree_is_not_annotated(self):
+        tree = ast.parse("def f(a):\n    return g(a)\nf(1)")
+        for stmt in tree.body:
+            DependencyVisitor().record(stmt)
+        self.assertFalse(any(hasattr(node, "parent") for node in ast.walk(tree)))
+
+class TestServe(unittest.TestCase):
+
+    def run_serve(self, lines):
+        stdout = io.StringIO()
+        serve(io.StringIO("".join(line + "\n" for line in lines)), stdout)
+        return [json.loads(line) for line in stdout.getvalue().splitlines()]
+
+    def test_serve_multiple_requests(self):
+        responses = self.run_serve([
+            json.dumps({"id": 1, "code": "x = 1"}),
+            json.dumps({"id": "b", "code": "print(y)"}),
+        ])
+        self.assertEqual([response["id"] for response in responses], [1, "b"])
+        self.assertEqual(responses[0]["result"], analyze_code("x = 1"))
+        self.assertEqual(responses[1]["result"]["dependencies"]["variables"], ["y"])
+
+    def test_serve_skips_blank_lines(self):
+        responses = self.run_serve(["", json.dumps({"id": 1, "code": ""}), "   "])
+        self.assertEqual(len(responses), 1)
+
+    def test_serve_reports_syntax_error(self):
+        responses = self.run_serve([
+            json.dumps({"id": 1, "code": "def foo("}),
+            json.dumps({"id": 2, "code": "x = 1"}),
+        ])
+        self.assertTrue(responses[0]["error"].startswith("SyntaxError"))
+        self.assertIn("result", responses[1])
+
+    def test_serve_reports_invalid_json(self):
+        responses = self.run_serve(["not json"])
+        self.assertIsNone(responses[0]["id"])
+        self.assertIn("Invalid request", responses[0]["error"])
+
+class TestAnalyzeMany(unittest.TestCase):
+    codes = {
+        "0": "import pandas as pd",
+        "1": "df = pd.DataFrame()",
+        "2": "def foo(x):\n    return bar(x)",
+        "3": "def foo(",
+    }
+
+    def test_analyze_many_matches_analyze_code(self):
+        results = analyze_many(self.codes)
+        self.assertEqual(list(results), ["0", "1", "2", "3"])
+        for node_id in ["0", "1", "2"]:
+            self.assertEqual(results[node_id], analyze_code(self.codes[node_id]))
+
+    def test_analyze_many_reports_errors_per_fragment(self):
+        results = analyze_many(self.codes)
+        self.assertTrue(results["3"]["error"].startswith("SyntaxError"))
+
+    def test_analyze_many_process_pool(self):
+        self.assertEqual(
+            analyze_many(self.codes, max_workers=2, parallel_threshold=1),
+            analyze_many(self.codes, max_workers=1),
+        )
+
+    def test_load_igc_fragments(self):
+        graph = {
+            "nodes": [
+                {"id": "start", "type": "StartNode", "data": {"label": "Start"}},
+                {"id": "0", "type": "CodeFragmentNode", "data": {"codeData": {"code": "x = 1"}}},
+                {"id": "1", "type": "MethodNode", "data": {"codeData": {"code": "def f(self):\n    pass", "scope": "A"}}},
+            ],
+            "edges": [],
+        }
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            igc_path = os.path.join(tmp_dir, "graph.igc")
+            with open(igc_path, "w") as f:
+                json.dump(graph, f)
+            self.assertEqual(load_igc_fragments(igc_path), {"0": "x = 1", "1": "def f(self):\n    pass"})
+
+    def test_serve_batch_request(self):
+        stdout = io.StringIO()
+        serve(io.StringIO(json.dumps({"id": 7, "codes": {"a": "x = 1"}}) + "\n"), stdout)
+        response = json.loads(stdout.getvalue())
+        self.assertEqual(response, {"id": 7, "result": {"a": analyze_code("x = 1")}})
+
 if __name__ == "__main__":
     unittest.main(verbosity=2)
@@ -0,0 +1,179 @@
+import json
+from collections import defaultdict
+
+from analyze_code import analyze_many, iter_code_nodes
+
+# Symbol of a change to some attribute of a name, e.g. "tracker.*". It is
+# defined along with the attribute path changed (e.g. "tracker.tasks") and
+# consumed by the nodes using the name as a whole. The nodes only using some
+# attributes of the name consume their paths and the name itself, so they do
+# not depend on changes to its other attributes.
+ANY_ATTRIBUTE = "*"
+
+# Kinds of the names whose attributes may be changed by other nodes
+OBJECT_KINDS = ("variables", "classes")
+
+def symbol_name(definition):
+    # Typed variables are reported as "name[Type]"
+    return definition.split("[", 1)[0]
+
+def path_root(path):
+    return path.split(".", 1)[0]
+
+def is_attribute_change(symbol):
+    return symbol.endswith(f".{ANY_ATTRIBUTE}")
+
+def apply_scope(result, scope):
+    """Qualify the definitions of a method node with its class, as the frontend does."""
+    dependencies = {kind: list(names) for kind, names in result["dependencies"].items()}
+    if scope not in dependencies["classes"]:
+        dependencies["classes"].append(scope)
+    # Attribute paths start with a module-level name
+    new_definitions = {
+        kind: list(names) if kind == "attributes" else [f"{scope}.{name}" for name in names]
+        for kind, names in result["new_definitions"].items()
+    }
+    return {**result, "dependencies": dependencies, "new_definitions": new_definitions}
+
+def defined_symbols(result):
+    symbols = set()
+    for kind, names in result["new_definitions"].items():
+        if kind == "attributes":
+            symbols.update(names)
+            symbols.update(f"{path_root(path)}.{ANY_ATTRIBUTE}" for path in names)
+        else:
+            symbols.update(symbol_name(name) for name in names)
+    return frozenset(symbols)
+
+def consumed_symbols(result):
+    dependencies = result["dependencies"]
+    attributes = dependencies.get("attributes", ())
+    partial = {path_root(path) for path in (*attributes, *result["new_definitions"].get("attributes", ()))}
+    symbols = set(attributes)
+    for kind, names in dependencies.items():
+        # Modules are provided by the environment, not by other nodes
+        if kind in ("modules", "attributes"):
+            continue
+        symbols.update(names)
+        if kind in OBJECT_KINDS:
+            symbols.update(f"{name}.{ANY_ATTRIBUTE}" for name in names if name not in partial)
+    return frozenset(symbols)
+
+class SymbolIndex:
+    """
+    Graph-level join of the analyzer output of every node.
+
+    Maps each symbol to the nodes that define it and the nodes that consume it.
+    Symbols are names, and attribute paths for the variables some nodes only
+    use through their attributes (see `ANY_ATTRIBUTE`). Nodes can be updated
+    one at a time; only the symbols whose membership changed are touched.
+    """
+
+    def __init__(self):
+        self.definers = defaultdict(set)
+        self.consumers = defaultdict(set)
+        # node id -> (defined symbols, consumed symbols)
+        self.nodes = {}
+
+    @classmethod
+    def from_results(cls, results, scopes=None):
+        """Build an index from {node id: analysis result}, e.g. the output of `analyze_many`."""
+        index = cls()
+        scopes = scopes or {}
+        for node_id, result in results.items():
+            if "error" not in result:
+                index.update_node(node_id, result, scopes.get(node_id))
+        return index
+
+    def _link(self, table, symbols, node_id):
+        for symbol in symbols:
+            table[symbol].add(node_id)
+
+    def _unlink(self, table, symbols, node_id):
+        for symbol in symbols:
+            nodes = table[symbol]
+            nodes.discard(node_id)
+            if not nodes:
+                del table[symbol]
+
+    def update_node(self, node_id, result, scope=None):
+        """Add or replace the analysis result of a node."""
+        if scope:
+            result = apply_scope(result, scope)
+        defined = defined_symbols(result)
+        consumed = consumed_symbols(result)
+
+        old_defined, old_consumed = self.nodes.get(node_id, (frozenset(), frozenset()))
+        self._unlink(self.definers, old_defined - defined, node_id)
+        self._link(self.definers, defined - old_defined, node_id)
+        self._unlink(self.consumers, old_consumed - consumed, node_id)
+        self._link(self.consumers, consumed - old_consumed, node_id)
+        self.nodes[node_id] = (defined, consumed)
+
+    def add_names(self, node_id, defined=(), consumed=()):
+        """Add symbols a node was seen to define or consume (e.g. when traced) to those of its analysis."""
+        old_defined, old_consumed = self.nodes.get(node_id, (frozenset(), frozenset()))
+        defined = frozenset(defined) - old_defined
+        consumed = frozenset(consumed) - old_consumed
+        self._link(self.definers, defined, node_id)
+        self._link(self.consumers, consumed, node_id)
+        self.nodes[node_id] = (old_defined | defined, old_consumed | consumed)
+
+    def remove_node(self, node_id):
+        defined, consumed = self.nodes.pop(node_id, (frozenset(), frozenset()))
+        self._unlink(self.definers, defined, node_id)
+        self._unlink(self.consumers, consumed, node_id)
+
+    def defined_by(self, node_id):
+        return self.nodes.get(node_id, (frozenset(), frozenset()))[0]
+
+    def consumed_by(self, node_id):
+        return self.nodes.get(node_id, (frozenset(), frozenset()))[1]
+
+    def defining_nodes(self, symbol):
+        return frozenset(self.definers.get(symbol, ()))
+
+    def consuming_nodes(self, symbol):
+        return frozenset(self.consumers.get(symbol, ()))
+
+    def providers(self, node_id):
+        """{symbol: nodes defining it} for every symbol the node consumes from other nodes."""
+        providers = {}
+        for symbol in self.consumed_by(node_id):
+            nodes = self.definers.get(symbol, set()) - {node_id}
+            if nodes:
+                providers[symbol] = nodes
+        return providers
+
+    def dependents(self, node_id):
+        """{symbol: nodes consuming it} for every symbol the node defines for other nodes."""
+        dependents = {}
+        for symbol in self.defined_by(node_id):
+            nodes = self.consumers.get(symbol, set()) - {node_id}
+            if nodes:
+                dependents[symbol] = nodes
+        return dependents
+
+    def edges(self):
+        """(consumer, definer, symbols) for every pair of nodes linked by at least one symbol."""
+        edges = defaultdict(set)
+        for symbol, consumers in self.consumers.items():
+            for definer in self.definers.get(symbol, ()):
+                for consumer in consumers:
+                    if consumer != definer:
+                        edges[(consumer, definer)].add(symbol)
+        return [(consumer, definer, sorted(symbols)) for (consumer, definer), symbols in edges.items()]
+
+    def to_json(self):
+        return {
+            "definers": {symbol: sorted(nodes) for symbol, nodes in self.definers.items()},
+            "consumers": {symbol: sorted(nodes) for symbol, nodes in self.consumers.items()},
+        }
+
+def index_igc(igc_path, cache=None):
+    """Analyze every code node of an .igc graph and index the results."""
+    with open(igc_path) as f:
+        graph = json.load(f)
+    code_data = dict(iter_code_nodes(graph))
+    results = analyze_many({node_id: data["code"] for node_id, data in code_data.items()}, cache=cache)
+    return SymbolIndex.from_results(results, {node_id: data.get("scope") for node_id, data in code_data.items()})
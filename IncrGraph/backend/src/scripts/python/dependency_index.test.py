@@ -0,0 +1,107 @@
+import io
+import os
+import json
+import tempfile
+import unittest
+from collections import defaultdict
+
+from analyze_code import analyze_code, serve
+from dependency_index import SymbolIndex, apply_scope, index_igc
+
+class TestSymbolIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.index = SymbolIndex.from_results({
+            "0": analyze_code("import pandas as pd"),
+            "1": analyze_code("df = pd.DataFrame()"),
+            "2": analyze_code("class Task:\n    def __init__(self, title):\n        self.title = title"),
+            "3": analyze_code("task = Task('a')\nprint(df)"),
+            "4": {"error": "SyntaxError: invalid syntax"},
+        })
+
+    def test_definers_and_consumers(self):
+        self.assertEqual(self.index.defining_nodes("pd"), {"0"})
+        self.assertEqual(self.index.defining_nodes("Task.__init__"), {"2"})
+        self.assertEqual(self.index.consuming_nodes("df"), {"3"})
+        self.assertEqual(self.index.consuming_nodes("Task.__init__"), {"3"})
+        self.assertEqual(self.index.defining_nodes("missing"), set())
+
+    def test_typed_variables_define_plain_name(self):
+        self.assertEqual(self.index.defining_nodes("task"), {"3"})
+
+    def test_error_results_are_skipped(self):
+        self.assertNotIn("4", self.index.nodes)
+
+    def test_providers_and_dependents(self):
+        self.assertEqual(self.index.providers("3"), {"df": {"1"}, "Task": {"2"}, "Task.__init__": {"2"}})
+        self.assertEqual(self.index.dependents("0"), {"pd": {"1"}})
+
+    def test_update_node_is_incremental(self):
+        self.index.update_node("1", analyze_code("frame = pd.DataFrame()"))
+        self.assertEqual(self.index.defining_nodes("df"), set())
+        self.assertNotIn("df", self.index.definers)
+        self.assertEqual(self.index.defining_nodes("frame"), {"1"})
+        self.assertEqual(self.index.consuming_nodes("pd"), {"1"})
+
+    def test_remove_node(self):
+        self.index.remove_node("2")
+        self.assertEqual(self.index.defining_nodes("Task"), set())
+        self.assertEqual(self.index.consuming_nodes("Task"), {"3"})
+
+    def test_edges(self):
+        edges = {(consumer, definer): symbols for consumer, definer, symbols in self.index.edges()}
+        self.assertEqual(edges[("3", "2")], ["Task", "Task.__init__"])
+        self.assertEqual(edges[("1", "0")], ["pd"])
+
+    def test_attribute_paths(self):
+        index = SymbolIndex.from_results({
+            "0": analyze_code("tracker = Tracker()"),
+            "1": analyze_code("tracker.tasks.append(task)"),
+            "2": analyze_code("tracker.name = 'work'"),
+            "3": analyze_code("print(tracker.name)"),
+            "4": analyze_code("print(tracker)"),
+        })
+        # Replacing the object or changing the attribute read, but not another one
+        self.assertEqual(index.providers("3"), {"tracker": {"0"}, "tracker.name": {"2"}})
+        self.assertEqual(index.dependents("1"), {"tracker.*": {"4"}})
+        self.assertEqual(index.providers("4"), {"tracker": {"0"}, "tracker.*": {"1", "2"}})
+
+    def test_apply_scope(self):
+        result = apply_scope(analyze_code("def get_data(self):\n    return self._data"), "Model")
+        self.assertEqual(result["new_definitions"]["functions"], ["Model.get_data"])
+        self.assertEqual(result["dependencies"]["classes"], ["Model"])
+
+    def test_index_igc(self):
+        graph = {
+            "nodes": [
+                {"id": "0", "type": "ClassNode", "data": {"codeData": {"code": "class Model:\n    pass"}}},
+                {"id": "1", "type": "MethodNode", "data": {"codeData": {"code": "def get_data(self):\n    return 1", "scope": "Model"}}},
+                {"id": "2", "type": "CodeFragmentNode", "data": {"codeData": {"code": "model = Model()\nmodel.get_data()"}}},
+            ],
+            "edges": [],
+        }
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            igc_path = os.path.join(tmp_dir, "graph.igc")
+            with open(igc_path, "w") as f:
+                json.dump(graph, f)
+            index = index_igc(igc_path)
+        self.assertEqual(index.defining_nodes("Model.get_data"), {"1"})
+        self.assertEqual(index.providers("2"), {"Model": {"0"}, "Model.get_data": {"1"}})
+
+    def test_serve_keeps_index_current(self):
+        indexes = defaultdict(SymbolIndex)
+        requests = [
+            {"id": 1, "codes": {"0": "x = 1", "1": "y = x", "2": "z = 0"}, "file": "g.igc"},
+            {"id": 2, "code": "w = 1", "key": "g.igc#0"},
+            {"id": 3, "codes": {"0": "w = 1", "1": "y = w"}, "file": "g.igc"},
+            {"id": 4, "op": "symbol_index", "file": "g.igc"},
+        ]
+        stdout = io.StringIO()
+        serve(io.StringIO("".join(json.dumps(r) + "\n" for r in requests)), stdout, indexes=indexes)
+        self.assertEqual(indexes["g.igc"].defining_nodes("w"), {"0"})
+        self.assertEqual(indexes["g.igc"].defining_nodes("x"), set())
+        responses = [json.loads(line) for line in stdout.getvalue().splitlines()]
+        self.assertEqual(responses[3]["result"], {"definers": {"w": ["0"], "y": ["1"]}, "consumers": {"w": ["1"], "w.*": ["1"]}})
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,164 @@
+"""
+Memoized fragment executions.
+
+A fragment whose code and inputs are the same as in an earlier run leaves
+the same state, so its run can be replayed instead of executed: the globals
+it changed are set to the objects it stored then, and its output and the
+configuration of these globals are reused. The objects are already in the
+graph's store (see `state_store`), so a replay only reads and writes
+manifests.
+
+The inputs of a run are the globals it may read: the global names of its
+code, followed through the functions and classes it uses (their code may
+read other globals) and through the globals the stored objects reference.
+Each is identified by its manifest entry, i.e. the hash of its pickle.
+
+Runs are recorded in `.sessions/<graph>/memo/<code hash>.json`, keeping the
+most recent runs of each code. Only runs that did not fail are recorded.
+Fragments whose result depends on anything but their inputs (files, the
+clock, random numbers, the state of imported modules) must not be
+memoized, which is why executions only use the memo on request.
+"""
+import os
+import json
+import types
+import hashlib
+import tempfile
+
+from state_store import entry_targets, read_manifest, state_exists, write_manifest
+
+MEMO_DIR = "memo"
+# Runs kept per code
+MAX_RUNS = 8
+
+def memo_dir_for(store):
+    """The memo directory of the graph whose object store is `store`."""
+    return os.path.join(os.path.dirname(store.directory), MEMO_DIR)
+
+def state_entries(state_in, store=None):
+    """
+    The manifest entries of the state at `state_in` (none for a missing
+    state), or None when runs on top of it cannot be memoized in `store`.
+    Without `store`, the entries of a state in any store are returned.
+    """
+    if os.path.exists(state_in):
+        state_store, entries = read_manifest(state_in)
+        return entries if store is None or state_store.directory == store.directory else None
+    # Legacy full session pickles have no entries to compare
+    return None if state_exists(state_in) else {}
+
+def code_digest(code):
+    return hashlib.sha256(code.encode()).hexdigest()
+
+def code_objects(value):
+    """The code objects run when `value`, a global, is used."""
+    if isinstance(value, types.MethodType):
+        value = value.__func__
+    if isinstance(value, types.FunctionType):
+        return [value.__code__]
+    if not isinstance(value, type) and type(value).__module__ == "__main__":
+        # Instances run the methods of their class
+        value = type(value)
+    if not isinstance(value, type):
+        return []
+    codes = []
+    for cls in value.__mro__:
+        if cls.__module__ != "__main__":
+            continue
+        for attribute in vars(cls).values():
+            if isinstance(attribute, (staticmethod, classmethod)):
+                attribute = attribute.__func__
+            functions = [attribute.fget, attribute.fset, attribute.fdel] if isinstance(attribute, property) else [attribute]
+            codes.extend(function.__code__ for function in functions if isinstance(function, types.FunctionType))
+    return codes
+
+def global_reads(code, namespace):
+    """
+    The names `code` may read from `namespace`, directly or through the
+    functions and classes of `namespace` it uses. Attribute names are
+    included, as the bytecode does not tell them apart.
+    """
+    names = set()
+    pending = [code]
+    seen = set()
+    while pending:
+        current = pending.pop()
+        if id(current) in seen:
+            continue
+        seen.add(id(current))
+        for name in current.co_names:
+            if name not in names:
+                names.add(name)
+                pending.extend(code_objects(namespace.get(name)))
+        pending.extend(const for const in current.co_consts if isinstance(const, types.CodeType))
+    return names
+
+def input_keys(names, entries):
+    """{name: manifest entry, or None if missing} of `names` and of the globals their objects reference."""
+    keys = {}
+    pending = list(names)
+    while pending:
+        name = pending.pop()
+        if name in keys:
+            continue
+        entry = entries.get(name)
+        keys[name] = entry
+        if entry is not None:
+            pending.extend(entry_targets(entry))
+    return keys
+
+def read_runs(path):
+    try:
+        with open(path) as f:
+            return json.load(f)["runs"]
+    except (OSError, ValueError, KeyError):
+        return []
+
+def write_runs(path, runs):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+    with os.fdopen(fd, "w") as f:
+        json.dump({"runs": runs}, f)
+    os.replace(tmp, path)
+
+def record_run(memo_dir, code, reads, entries_in, entries_out, output, error, configuration):
+    """Record a run of `code` that read `reads` from the state `entries_in` and left `entries_out`."""
+    changed = {name: entry for name, entry in entries_out.items() if entries_in.get(name) != entry}
+    run = {
+        "inputs": input_keys(reads, entries_in),
+        "changed": changed,
+        "removed": sorted(name for name in entries_in if name not in entries_out),
+        "output": output,
+        "error": error,
+        # The other globals are described as in the state a replay runs on
+        "changed_configuration": {name: configuration[name] for name in changed if name in configuration},
+    }
+    path = os.path.join(memo_dir, f"{code_digest(code)}.json")
+    runs = [other for other in read_runs(path) if other["inputs"] != run["inputs"]]
+    write_runs(path, [run] + runs[:MAX_RUNS - 1])
+
+def find_run(memo_dir, code, entries_in, store):
+    """A recorded run of `code` whose inputs match the state `entries_in` and whose objects are all stored, or None."""
+    path = os.path.join(memo_dir, f"{code_digest(code)}.json")
+    for run in read_runs(path):
+        # Runs recorded with the whole configuration would describe stale globals
+        if "changed_configuration" not in run:
+            continue
+        if all(entries_in.get(name) == entry for name, entry in run["inputs"].items()) and all(
+            store.has(entry["hash"]) for entry in run["changed"].values() if "hash" in entry
+        ):
+            # Runs in use are kept by `session_gc.py`
+            os.utime(path)
+            return run
+    return None
+
+def replay_run(run, entries_in, configuration_in, store, state_out, config_out):
+    """Write the state and configuration a recorded run left on top of `entries_in` and `configuration_in`."""
+    entries = {name: entry for name, entry in entries_in.items() if name not in run["removed"]}
+    entries.update(run["changed"])
+    write_manifest(state_out, store, entries)
+    configuration = {name: value for name, value in configuration_in.items() if name not in run["removed"]}
+    configuration.update(run["changed_configuration"])
+    with open(config_out, "w") as f:
+        json.dump(configuration, f)
+    return entries
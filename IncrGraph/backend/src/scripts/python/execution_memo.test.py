@@ -0,0 +1,116 @@
+import os
+import json
+import time
+import tempfile
+import unittest
+
+from execution_memo import MEMO_DIR, code_digest, global_reads
+from execution_worker import ExecutionWorker, as_main, new_main
+from session_gc import collect_garbage
+from state_store import load_state
+
+class TestExecutionMemo(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.sessions_dir = os.path.join(self.tmp.name, ".sessions", "graph.igc")
+
+    def paths(self, n):
+        directory = os.path.join(self.sessions_dir, "session", "executions", str(n))
+        os.makedirs(directory, exist_ok=True)
+        return os.path.join(directory, "state.json"), os.path.join(directory, "configuration.json")
+
+    def run_fragment(self, code, previous, n, memoize=True):
+        # A new worker each time, so nothing is kept live between runs
+        state_in = self.paths(previous)[0] if previous is not None else ""
+        return ExecutionWorker().run(code, state_in, *self.paths(n), memoize=memoize)
+
+    def read_configuration(self, n):
+        with open(self.paths(n)[1]) as f:
+            return json.load(f)
+
+    def load(self, n):
+        main = new_main()
+        with as_main(main):
+            load_state(main, self.paths(n)[0])
+        return main.__dict__
+
+    def test_global_reads(self):
+        namespace = new_main().__dict__
+        exec(
+            "scale = 2\ndef f(v):\n    return v * scale + helper()\ndef helper():\n    return offset\n"
+            "class A:\n    @property\n    def p(self):\n        return f(1)\n    def m(self):\n        return limit\n"
+            "class B(A):\n    pass\nb = B()",
+            namespace,
+        )
+        reads = global_reads(compile("b.p", "<fragment>", "exec"), namespace)
+        self.assertEqual(reads, {"b", "p", "f", "scale", "helper", "offset", "limit"})
+
+    def test_replay(self):
+        self.run_fragment("x = 1\ny = 10\ndef f(v):\n    return v + y", None, 1)
+        code = "z = f(x)\ndel y\nprint(z)"
+        first = self.run_fragment(code, 1, 2)
+        self.assertNotIn("memoized", first["metrics"])
+        configuration = self.read_configuration(2)
+
+        replayed = self.run_fragment(code, 1, 3)
+        self.assertTrue(replayed["metrics"]["memoized"])
+        self.assertEqual(replayed["output"], "11\n")
+        self.assertEqual(replayed["metrics"]["stateSize"], first["metrics"]["stateSize"])
+        self.assertEqual(self.read_configuration(3), configuration)
+        namespace = self.load(3)
+        self.assertEqual(namespace["z"], 11)
+        self.assertNotIn("y", namespace)
+        self.assertEqual(namespace["f"].__code__.co_names, ("y",))
+
+    def test_changed_inputs_run_again(self):
+        self.run_fragment("x = 1\ny = 10\ndef f(v):\n    return v + y\nunused = 0", None, 1)
+        code = "z = f(x)\nprint(z)"
+        self.run_fragment(code, 1, 2)
+        # `y` is only read through `f`
+        for n, change in ((3, "y = 20"), (5, "x = 2"), (7, "unused = 1")):
+            self.run_fragment(change, 1, n)
+            result = self.run_fragment(code, n, n + 1)
+            self.assertEqual(result["metrics"].get("memoized", False), n == 7, change)
+        self.assertEqual(self.run_fragment(code, 3, 9)["output"], "21\n")
+        self.assertTrue(self.run_fragment(code, 5, 10)["metrics"]["memoized"])
+
+    def test_replay_describes_the_incoming_state(self):
+        self.run_fragment("a = 1\nb = 2", None, 1)
+        self.run_fragment("c = a + 1", 1, 2)
+        self.run_fragment("a = 1\nb = 99", None, 3)
+        self.assertTrue(self.run_fragment("c = a + 1", 3, 4)["metrics"]["memoized"])
+        self.assertEqual(self.read_configuration(4), {"a": 1, "b": 99, "c": 2})
+
+    def test_failures_and_unrequested_runs_are_not_recorded(self):
+        self.run_fragment("x = 1", None, 1)
+        for _ in range(2):
+            result = self.run_fragment("y = x\nraise ValueError", 1, 2)
+            self.assertTrue(result["failed"])
+        self.run_fragment("y = x", 1, 2, memoize=False)
+        self.assertNotIn("memoized", self.run_fragment("y = x", 1, 2)["metrics"])
+        self.assertTrue(self.run_fragment("y = x", 1, 2)["metrics"]["memoized"])
+
+    def test_memoized_objects_are_kept(self):
+        self.run_fragment("x = 1", None, 1)
+        code = "data = list(range(x, 1000))"
+        self.run_fragment(code, 1, 2)
+        # The execution holding the state of the recorded run is deleted
+        with open(os.path.join(self.sessions_dir, "session", "executions", "config.json"), "w") as f:
+            json.dump({"path": ["a"]}, f)
+        stats = collect_garbage(self.sessions_dir, grace_period=0)
+        self.assertEqual((stats["prunedExecutions"], stats["removedObjects"]), (1, 0))
+        self.assertTrue(self.run_fragment(code, 1, 2)["metrics"]["memoized"])
+        self.assertEqual(self.load(2)["data"][0], 1)
+
+        # Runs not used for long expire, with their objects
+        memo_file = os.path.join(self.sessions_dir, MEMO_DIR, f"{code_digest(code)}.json")
+        os.utime(memo_file, (time.time() - 3600, time.time() - 3600))
+        os.remove(self.paths(2)[0])
+        stats = collect_garbage(self.sessions_dir, grace_period=0, memo_max_age=60)
+        self.assertEqual((stats["expiredMemos"], stats["removedObjects"]), (1, 1))
+        self.assertNotIn("memoized", self.run_fragment(code, 1, 2)["metrics"])
+
+if __name__ == "__main__":
+    unittest.main()
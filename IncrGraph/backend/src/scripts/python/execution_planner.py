@@ -0,0 +1,293 @@
+import ast
+
+from analyze_code import analyze_many
+from dependency_index import (
+    ANY_ATTRIBUTE,
+    SymbolIndex,
+    apply_scope,
+    consumed_symbols,
+    defined_symbols,
+    is_attribute_change,
+)
+from execution_scheduler import called_names, mutated_names
+from type_propagation import propagate_types, request_types
+
+def full_plan(path, reason):
+    return {"mode": "full", "rerun": list(range(len(path))), "skipped": [], "changed": [], "reason": reason}
+
+def parse(code):
+    try:
+        return ast.parse(code)
+    except (SyntaxError, ValueError):
+        return None
+
+def callable_effects(stmt):
+    """(globals it may change, names it calls) for a function, class or method statement."""
+    declared = {name for node in ast.walk(stmt) if isinstance(node, ast.Global) for name in node.names}
+    local = {node.arg for node in ast.walk(stmt) if isinstance(node, ast.arg)}
+    local |= {node.id for node in ast.walk(stmt) if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Store)}
+    calls = {
+        node.func.id for node in ast.walk(stmt)
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name)
+    }
+    return declared | (mutated_names(stmt) - (local - declared)), calls
+
+def changes_self(stmt):
+    # A method changing the object it is called on in place
+    args = stmt.args.posonlyargs + stmt.args.args
+    return bool(args) and args[0].arg in mutated_names(stmt)
+
+def function_effects(codes, scopes):
+    """
+    Effects of the functions, classes and methods defined by `codes`
+    {node id: code}, as (effects, methods). `effects` maps the module-level
+    names and the methods ("Tracker.add") to the globals they may change:
+    those they declare, the outer names they change in place and the
+    effects of the functions they call. `methods` are the methods not
+    changing the object they are called on.
+    """
+    effects = {}
+    calls = {}
+    methods = set()
+    for node_id, code in codes.items():
+        tree = parse(code)
+        if tree is None:
+            continue
+        scope = scopes.get(node_id)
+        for stmt in tree.body:
+            if not isinstance(stmt, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                continue
+            members = [(f"{scope}.{stmt.name}" if scope else stmt.name, stmt)]
+            if isinstance(stmt, ast.ClassDef) and not scope:
+                members += [
+                    (f"{stmt.name}.{member.name}", member) for member in stmt.body
+                    if isinstance(member, (ast.FunctionDef, ast.AsyncFunctionDef))
+                ]
+            for name, member in members:
+                effects[name], calls[name] = callable_effects(member)
+                if "." in name and not changes_self(member):
+                    methods.add(name)
+    changed = True
+    while changed:
+        changed = False
+        for name, called in calls.items():
+            for callee in called & effects.keys():
+                if not effects[callee] <= effects[name]:
+                    effects[name] |= effects[callee]
+                    changed = True
+    return effects, methods
+
+def changed_in_place(code, result, defined, effects, methods):
+    """
+    Names a fragment analyzed as `result` may change in place without the
+    analyzer reporting it: outer values it calls methods on, assigns items
+    of or passes to calls, and the globals changed by the session functions
+    and methods it calls. Changes through attributes are already reported
+    as attribute changes. A call on a variable of a known type resolved to
+    one of the `methods` not changing their object (see `type_propagation`)
+    does not change it.
+    """
+    tree = parse(code)
+    if tree is None or "error" in result:
+        return set()
+    consumed = {symbol for symbol in consumed_symbols(result) if "." not in symbol}
+    functions = result["dependencies"]["functions"]
+    untyped = {function[1:].partition(">.")[0] for function in functions if function.startswith("<")}
+    resolved = [function.rpartition(".") for function in functions if not function.startswith("<")]
+    kept = {method for _, _, method in resolved} - {
+        method for class_name, _, method in resolved if f"{class_name}.{method}" not in methods
+    }
+
+    def keeps_receiver(name, method):
+        return name not in untyped and method in kept
+
+    names = {
+        name for name in mutated_names(tree, keeps_receiver)
+        if name in consumed and f"{name}.{ANY_ATTRIBUTE}" not in defined
+    }
+    for name in called_names(tree) | set(functions):
+        names |= effects.get(name, set())
+    return names
+
+def dirty_positions(path, index, edited):
+    """
+    Walk `path` and return (dirty positions, changed symbols).
+
+    A position is dirty when it runs an edited node or consumes a symbol
+    changed by an earlier dirty position. A clean position redefining a
+    changed symbol shadows the change for the positions after it.
+    """
+    changed = set()
+    all_changed = set()
+    dirty = []
+    for position, node_id in enumerate(path):
+        defined = index.defined_by(node_id)
+        if node_id in edited or changed & index.consumed_by(node_id):
+            dirty.append(position)
+            changed |= defined
+            all_changed |= defined
+        else:
+            # A change of another attribute does not undo the change
+            changed -= {symbol for symbol in defined if not is_attribute_change(symbol)}
+    return dirty, all_changed
+
+def check_replay(path, index, dirty):
+    """
+    Return None if running only the `dirty` positions, in order, on top of the
+    final state of the previous run reproduces a full re-run, or the reason it
+    does not.
+
+    The final state holds the value of each symbol from its last definer in the
+    path, so a dirty position may only read a symbol from it if that last
+    definer is also the last definer before the position and no earlier dirty
+    position replaced it; and the value a dirty position writes must not have
+    been overwritten afterwards by a clean position. Changes of different
+    attributes of an object add up (see `ANY_ATTRIBUTE`) rather than replace
+    each other, so a dirty position using the whole object requires that none
+    of its attributes change after it.
+    """
+    dirty_set = set(dirty)
+    last_definer = {}
+    for position, node_id in enumerate(path):
+        for symbol in index.defined_by(node_id):
+            last_definer[symbol] = position
+
+    definer_before = {}
+    dirty_definers = set()
+    for position, node_id in enumerate(path):
+        if position in dirty_set:
+            for symbol in index.consumed_by(node_id):
+                if is_attribute_change(symbol):
+                    if last_definer.get(symbol, -1) > position:
+                        return f"'{symbol}' changes after position {position}"
+                    continue
+                before = definer_before.get(symbol)
+                if before is not None and before in dirty_set:
+                    continue
+                if symbol in dirty_definers:
+                    return f"'{symbol}' is read at position {position} after being shadowed by a re-run"
+                if last_definer.get(symbol) != before:
+                    return f"'{symbol}' is redefined after position {position}"
+            for symbol in index.defined_by(node_id):
+                if last_definer[symbol] not in dirty_set and not is_attribute_change(symbol):
+                    return f"'{symbol}' defined at position {position} is redefined by a skipped fragment"
+                dirty_definers.add(symbol)
+        for symbol in index.defined_by(node_id):
+            definer_before[symbol] = position
+    return None
+
+def plan_reexecution(path, index, edited, previously_defined=(), state_symbols=None, mutated=None):
+    """
+    Plan the re-execution of a session path after the nodes in `edited` changed.
+
+    `path` is the list of node ids in execution order (a node may appear more
+    than once) and `index` a `SymbolIndex` of the current code of its nodes.
+    `previously_defined` are the symbols the edited nodes defined when the
+    path last ran and `state_symbols` the names held by the final state of
+    the session: a name the re-run would no longer define survives in that
+    state, so it requires a full re-run. `mutated` gives the names each node
+    may change in place: running such a node again on the final state would
+    apply its change twice, so a plan re-running it is full.
+
+    Returns {"mode": "incremental", "rerun": [...], "skipped": [...], "changed": [...]}
+    where "rerun" are the path positions to run again, in order, on top of the
+    final state of the session, or a "full" plan (with a "reason") when that
+    would not reproduce a re-run of the whole path. Fragments are assumed to
+    only affect the namespace through the definitions the analyzer reports.
+    """
+    edited = set(edited)
+    for position, node_id in enumerate(path):
+        if node_id not in index.nodes:
+            return full_plan(path, f"'{node_id}' at position {position} could not be analyzed")
+    removed = set(previously_defined).difference(*(index.defined_by(node_id) for node_id in edited))
+    if removed:
+        return full_plan(path, f"the edit removed the definition of {', '.join(sorted(removed))}")
+    if state_symbols is not None:
+        defined = set().union(*(index.defined_by(node_id) for node_id in path))
+        stale = set(state_symbols) - defined
+        if stale:
+            return full_plan(path, f"the state holds names no fragment defines: {', '.join(sorted(stale))}")
+
+    dirty, changed = dirty_positions(path, index, edited)
+    mutated = mutated or {}
+    for position in dirty:
+        names = mutated.get(path[position])
+        if names:
+            return full_plan(path, f"position {position} changes {', '.join(sorted(names))} in place")
+    reason = check_replay(path, index, dirty)
+    if reason is not None:
+        return full_plan(path, reason)
+    dirty_set = set(dirty)
+    return {
+        "mode": "incremental",
+        "rerun": dirty,
+        "skipped": [position for position in range(len(path)) if position not in dirty_set],
+        "changed": sorted(changed),
+    }
+
+def handle_plan_request(request, cache=None):
+    """
+    Daemon operation "plan".
+
+    {"codes": {...}, "scopes": {...}, "path": [...], "previous_codes": [...], "state_symbols": [...]}
+    holds the current code of the nodes of the path and, for each position of
+    the path, the code it ran last time (None if unknown). Positions whose
+    code changed mark their node as edited. When the code actually executed
+    differs from the analyzed one (e.g. methods injected into their class),
+    "executed" gives the code each position would run now.
+
+    "previous_traces" optionally gives, for each position, the globals its
+    last run was traced reading and writing (see `global_trace`), or None.
+    They are added to what the analyzer finds; a global mutated in place is
+    traced as written, so its consumers are re-run too. The code of edited
+    positions changed, so only the globals they wrote are kept: the re-run
+    may change them.
+
+    "types" optionally gives the type environment the path starts from, or
+    "configuration" the configuration it is read from (see `type_propagation`).
+
+    Names a node may change in place (see `changed_in_place`) are taken as
+    both consumed and defined by it.
+    """
+    codes = request["codes"]
+    path = request["path"]
+    previous_codes = request["previous_codes"]
+    executed = request.get("executed") or [codes.get(node_id) for node_id in path]
+    cache_dir = request.get("cache_dir")
+
+    if None in previous_codes:
+        return full_plan(path, f"the code run at position {previous_codes.index(None)} was not recorded")
+
+    edited = {node_id for node_id, previous, code in zip(path, previous_codes, executed) if previous != code}
+    previous = {position: code for position, code in enumerate(previous_codes) if path[position] in edited}
+    scopes = request.get("scopes") or {}
+    effects, methods = function_effects({node_id: codes[node_id] for node_id in set(path) if node_id in codes}, scopes)
+    previously_defined = set()
+    for position, result in analyze_many(previous, cache=cache, cache_dir=cache_dir).items():
+        if "error" not in result:
+            scope = scopes.get(path[position])
+            previously_defined |= defined_symbols(apply_scope(result, scope) if scope else result)
+            if not scope:
+                previously_defined |= changed_in_place(
+                    previous[position], result, defined_symbols(result), effects, methods,
+                )
+
+    # Method calls on the variables typed by earlier positions depend on their class
+    results = analyze_many(codes, cache=cache, cache_dir=cache_dir)
+    results, _ = propagate_types(results, path, request_types(request), scopes)
+    index = SymbolIndex.from_results(results, scopes)
+    traces = request.get("previous_traces") or [None] * len(path)
+    for node_id, trace in zip(path, traces):
+        if trace is not None and node_id in index.nodes:
+            read = trace["read"] if node_id not in edited else ()
+            index.add_names(node_id, set(trace["written"]) | set(trace["deleted"]), read)
+    mutated = {}
+    for node_id in set(path) & index.nodes.keys():
+        if not scopes.get(node_id):
+            names = changed_in_place(codes[node_id], results[node_id], index.defined_by(node_id), effects, methods)
+            if names:
+                mutated[node_id] = names
+                index.add_names(node_id, names, names)
+    plan = plan_reexecution(path, index, edited, previously_defined, request.get("state_symbols"), mutated)
+    plan["edited"] = sorted(edited)
+    return plan
@@ -0,0 +1,258 @@
+import io
+import json
+import random
+import unittest
+
+from analyze_code import analyze_code, analyze_many, serve
+from dependency_index import SymbolIndex
+from execution_planner import handle_plan_request, plan_reexecution
+from global_trace import GlobalTracer, fragment_trace
+
+def build_index(codes):
+    return SymbolIndex.from_results({node_id: analyze_code(code) for node_id, code in codes.items()})
+
+def run(codes, path, namespace=None):
+    namespace = {} if namespace is None else namespace
+    for node_id in path:
+        exec(codes[node_id], namespace)
+    namespace.pop("__builtins__", None)
+    return namespace
+
+class TestExecutionPlanner(unittest.TestCase):
+
+    def setUp(self):
+        self.codes = {
+            "load": "data = [1, 2, 3]",
+            "other": "labels = ['a', 'b']",
+            "total": "total = sum(data)",
+            "report": "summary = f'{total} {labels}'",
+            "unrelated": "constant = 42",
+        }
+        self.path = ["load", "other", "total", "report", "unrelated"]
+
+    def test_only_downstream_fragments_rerun(self):
+        plan = plan_reexecution(self.path, build_index(self.codes), {"load"})
+        self.assertEqual(plan["mode"], "incremental")
+        self.assertEqual(plan["rerun"], [0, 2, 3])
+        self.assertEqual(plan["skipped"], [1, 4])
+        self.assertEqual(plan["changed"], ["data", "summary", "total"])
+
+    def test_independent_edit_reruns_itself(self):
+        plan = plan_reexecution(self.path, build_index(self.codes), {"unrelated"})
+        self.assertEqual(plan["rerun"], [4])
+
+    def test_edited_node_not_in_path(self):
+        plan = plan_reexecution(self.path, build_index(self.codes), {"missing"})
+        self.assertEqual(plan["rerun"], [])
+
+    def test_removed_definition_requires_full_rerun(self):
+        plan = plan_reexecution(self.path, build_index(self.codes), {"other"}, {"labels", "colors"})
+        self.assertEqual(plan["mode"], "full")
+
+    def test_clean_redefinition_shadows_change(self):
+        codes = {"a": "x = 1", "b": "x = 2", "c": "y = x"}
+        plan = plan_reexecution(["a", "b", "c"], build_index(codes), {"a"})
+        self.assertEqual(plan["mode"], "full")
+
+    def test_read_modify_write_requires_full_rerun(self):
+        codes = {"a": "x = 1", "b": "y = 0", "c": "x = x + y"}
+        plan = plan_reexecution(["a", "b", "c"], build_index(codes), {"b"})
+        self.assertEqual(plan["mode"], "full")
+
+    def test_unanalyzable_node_requires_full_rerun(self):
+        index = SymbolIndex.from_results(analyze_many({"a": "x = 1", "b": "def f("}))
+        plan = plan_reexecution(["a", "b"], index, {"a"})
+        self.assertEqual(plan["mode"], "full")
+        self.assertEqual(plan["rerun"], [0, 1])
+
+    def test_stale_state_symbols_require_full_rerun(self):
+        index = build_index(self.codes)
+        symbols = ["data", "labels", "total", "summary", "constant"]
+        self.assertEqual(plan_reexecution(self.path, index, {"load"}, (), symbols)["mode"], "incremental")
+        self.assertEqual(plan_reexecution(self.path, index, {"load"}, (), symbols + ["removed"])["mode"], "full")
+
+    def test_incremental_plans_match_full_rerun(self):
+        rng = random.Random(0)
+        names = ["a", "b", "c", "d"]
+        incremental = 0
+        for _ in range(1000):
+            codes = {
+                str(i): f"{rng.choice(names)} = {rng.randrange(10)} + {' + '.join(rng.sample(names, rng.randrange(3))) or '0'}"
+                for i in range(5)
+            }
+            path = [rng.choice(list(codes)) for _ in range(rng.randrange(1, 8))]
+            edited = rng.choice(path)
+            codes["init"] = "; ".join(f"{name} = 0" for name in names)
+            path.insert(0, "init")
+            before = run(codes, path)
+
+            previous_codes = [codes[node_id] for node_id in path]
+            codes[edited] = f"{rng.choice(names)} = {rng.randrange(10, 20)} + {rng.choice(names)}"
+            request = {"codes": codes, "path": path, "previous_codes": previous_codes, "state_symbols": list(before)}
+            plan = handle_plan_request(request)
+            if plan["mode"] != "incremental":
+                continue
+            incremental += 1
+            replayed = run(codes, [path[position] for position in plan["rerun"]], before)
+            self.assertEqual(replayed, run(codes, path), (codes, path, edited, plan))
+        self.assertGreater(incremental, 100)
+
+    def test_attribute_changes_rerun_their_readers(self):
+        codes = {
+            "class": "class Tracker:\n    def __init__(self):\n        self.name = ''\n        self.tasks = []",
+            "init": "tracker = Tracker()",
+            "name": "tracker.name = 'work'",
+            "add": "tracker.tasks.append('write')",
+            "title": "title = tracker.name.upper()",
+            "count": "count = len(tracker.tasks)",
+            "show": "shown = repr(vars(tracker))",
+        }
+        path = list(codes)
+        plan = plan_reexecution(path, build_index(codes), {"name"})
+        self.assertEqual([path[position] for position in plan["rerun"]], ["name", "title", "show"])
+        # Appending again to the final state would not reproduce a re-run
+        self.assertEqual(plan_reexecution(path, build_index(codes), {"add"})["mode"], "full")
+
+    def test_incremental_attribute_plans_match_full_rerun(self):
+        rng = random.Random(0)
+        reads = ["o.a", "o.b", "v"]
+        incremental = 0
+        for _ in range(1000):
+            def fragment(constant):
+                target = rng.choice(["o.a", "o.b", "v", "o.a", "o.b"])
+                value = " + ".join([str(constant)] + rng.sample(reads, rng.randrange(3)))
+                return rng.choice([
+                    f"{target} = {value}", f"{target} += {value}", f"w = {value}", "w = repr(vars(o))",
+                    "o = NS(a=1, b=1, l=[0])", "o.l = [0]", "o.l[0] += 1", "o.l.append(1)", "w = len(o.l)",
+                ])
+
+            codes = {str(i): fragment(rng.randrange(10)) for i in range(5)}
+            path = [rng.choice(list(codes)) for _ in range(rng.randrange(1, 8))]
+            edited = rng.choice(path)
+            # No value holds a reference to an attribute, which the analysis does not follow
+            codes["init"] = "from types import SimpleNamespace as NS\no = NS(a=0, b=0, l=[0])\nv = 0\nw = 0"
+            path.insert(0, "init")
+            before = run(codes, path)
+
+            previous_codes = [codes[node_id] for node_id in path]
+            codes[edited] = fragment(rng.randrange(10, 20))
+            request = {"codes": codes, "path": path, "previous_codes": previous_codes, "state_symbols": list(before)}
+            plan = handle_plan_request(request)
+            if plan["mode"] != "incremental":
+                continue
+            incremental += 1
+            replayed = run(codes, [path[position] for position in plan["rerun"]], before)
+            self.assertEqual(replayed, run(codes, path), (codes, path, edited, plan))
+        self.assertGreater(incremental, 100)
+
+    def test_method_edits_rerun_callers(self):
+        codes = {
+            "class": "class Tracker:\n    pass",
+            "add": "def add(self, task):\n    return [task]",
+            "init": "tracker = Tracker()",
+            "use": "tasks = tracker.add('write')",
+            "other": "other = 1",
+        }
+        path = ["class", "add", "init", "use", "other"]
+        previous_codes = [codes[node_id] for node_id in path]
+        previous_codes[1] = "def add(self, task):\n    return []"
+        request = {"codes": codes, "scopes": {"add": "Tracker"}, "path": path, "previous_codes": previous_codes}
+        self.assertEqual(handle_plan_request(request)["rerun"], [1, 3])
+        # A variable typed before the path
+        request = {**request, "path": ["add", "use", "other"], "previous_codes": [previous_codes[1], *previous_codes[3:]]}
+        self.assertEqual(handle_plan_request(request)["rerun"], [0])
+        self.assertEqual(handle_plan_request({**request, "types": {"tracker": "Tracker"}})["rerun"], [0, 1])
+
+    def plan_edit(self, codes, path, edited, previous_code):
+        previous_codes = [previous_code if node_id == edited else codes[node_id] for node_id in path]
+        return handle_plan_request({"codes": codes, "path": path, "previous_codes": previous_codes})
+
+    def test_changes_in_place_require_full_rerun(self):
+        cases = [
+            ({"a": "lst = []", "b": "lst.append(2)", "c": "n = len(lst)"}, "b", "lst.append(1)"),
+            ({"a": "d = {}", "b": "d['k'] = 2", "c": "v = d.get('k')"}, "b", "d['k'] = 1"),
+            ({"a": "d = {'k': 1}", "b": "del d['k']\nn = 1", "c": "v = d.get('k')"}, "b", "del d['k']"),
+            ({"a": "df = load()", "b": "df.drop(columns, inplace=True)", "c": "n = len(df)"}, "b", "df.drop(columns, inplace=True, errors='ignore')"),
+            ({"a": "lst = [2, 1]", "b": "random.shuffle(lst)\nn = 2", "c": "n = len(lst)"}, "b", "random.shuffle(lst)"),
+            # Changes of a value an edited fragment defines
+            ({"a": "lst = [0]", "b": "lst.append(1)", "c": "n = len(lst)"}, "a", "lst = []"),
+        ]
+        for codes, edited, previous_code in cases:
+            path = list(codes)
+            plan = self.plan_edit(codes, path, edited, previous_code)
+            self.assertEqual(plan["mode"], "full", (codes, plan))
+            self.assertIn("in place", plan["reason"])
+
+    def test_changes_through_session_functions_require_full_rerun(self):
+        codes = {
+            "define": "x = 0\ndef inc():\n    global x\n    x += 1",
+            "wrap": "def twice():\n    inc()\n    inc()",
+            "call": "twice()",
+            "read": "y = x",
+        }
+        path = list(codes)
+        plan = self.plan_edit(codes, path, "call", "inc()")
+        self.assertEqual(plan["mode"], "full")
+        self.assertIn("x", plan["reason"])
+        plan = self.plan_edit(codes, path, "define", "x = 1\ndef inc():\n    global x\n    x += 1")
+        self.assertEqual(plan["mode"], "full")
+        # A function changing a global list without declaring it
+        codes = {"a": "items = []\ndef add(v):\n    items.append(v)", "b": "add(1)", "c": "n = len(items)"}
+        self.assertEqual(self.plan_edit(codes, list(codes), "b", "add(2)")["mode"], "full")
+
+    def test_fragments_changing_their_own_values_stay_incremental(self):
+        codes = {"a": "lst = []\nlst.append(2)", "b": "n = len(lst)", "c": "other = 1"}
+        plan = self.plan_edit(codes, list(codes), "a", "lst = []\nlst.append(1)")
+        self.assertEqual(plan["mode"], "incremental")
+        self.assertEqual(plan["rerun"], [0, 1])
+
+    def test_serve_plan_operation(self):
+        previous_codes = [self.codes[node_id] for node_id in self.path]
+        previous_codes[1] = "labels = []"
+        request = {"id": 1, "op": "plan", "codes": self.codes, "path": self.path, "previous_codes": previous_codes}
+        stdout = io.StringIO()
+        serve(io.StringIO(json.dumps(request) + "\n"), stdout, ops={"plan": handle_plan_request})
+        response = json.loads(stdout.getvalue())
+        self.assertEqual(response["result"]["edited"], ["other"])
+        self.assertEqual(response["result"]["rerun"], [1, 3])
+
+    def test_executed_code_marks_edits(self):
+        executed = [f"# injected\n{self.codes[node_id]}" for node_id in self.path]
+        request = {"codes": self.codes, "path": self.path, "previous_codes": list(executed), "executed": executed}
+        request["previous_codes"][4] = "constant = 0"
+        plan = handle_plan_request(request)
+        self.assertEqual(plan["edited"], ["unrelated"])
+        self.assertEqual(plan["rerun"], [4])
+
+    def test_unrecorded_code_requires_full_rerun(self):
+        request = {"codes": self.codes, "path": self.path, "previous_codes": [None] * len(self.path)}
+        self.assertEqual(handle_plan_request(request)["mode"], "full")
+
+    def test_traces_add_dependencies(self):
+        codes = {"scale": "scale = 2", "use": "exec('result = scale * 3')", "show": "text = str(result)"}
+        path = ["scale", "use", "show"]
+        traces = []
+        namespace = {}
+        for node_id in path:
+            tracer = GlobalTracer(namespace)
+            with tracer.tracing():
+                exec(codes[node_id], namespace)
+            traces.append(fragment_trace(tracer))
+        request = {"codes": codes, "path": path, "previous_codes": ["scale = 1", codes["use"], codes["show"]]}
+        self.assertEqual(handle_plan_request(request)["rerun"], [0])
+        plan = handle_plan_request({**request, "previous_traces": traces})
+        self.assertEqual(plan["rerun"], [0, 1, 2])
+        self.assertEqual(plan["changed"], ["result", "scale", "text"])
+        # Only the writes of an edited position are still relevant
+        request["previous_codes"] = [codes["scale"], "exec('result = 1')", codes["show"]]
+        plan = handle_plan_request({**request, "previous_traces": traces})
+        self.assertEqual(plan["rerun"], [1, 2])
+        self.assertEqual(plan["changed"], ["result", "text"])
+
+    def test_serve_unknown_operation(self):
+        stdout = io.StringIO()
+        serve(io.StringIO(json.dumps({"id": 1, "op": "plan"}) + "\n"), stdout)
+        self.assertEqual(json.loads(stdout.getvalue())["error"], "ValueError: Unknown operation: plan")
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,224 @@
+import ast
+import builtins
+
+from analyze_code import analyze_many
+from dependency_index import defined_symbols, consumed_symbols
+from type_propagation import propagate_types, request_types
+from value_summary import described_type
+
+def top_level_name(symbol):
+    # "Task.__init__" -> "Task", "<df>.head" -> "df"
+    return symbol.split(".", 1)[0].strip("<>")
+
+def namespace_names(result):
+    """(defined, consumed) top-level names of the namespace touched by an analyzed fragment."""
+    defined = {top_level_name(symbol) for symbol in defined_symbols(result)}
+    consumed = {top_level_name(symbol) for symbol in consumed_symbols(result)}
+    return defined, consumed - defined
+
+def mutation_root(node):
+    # `x.a[0].m` -> "x": the value a mutation through the chain may change
+    while isinstance(node, (ast.Attribute, ast.Subscript, ast.Call)):
+        node = node.func if isinstance(node, ast.Call) else node.value
+    return node.id if isinstance(node, ast.Name) else None
+
+# Builtins that never change the values passed to them
+PURE_BUILTINS = {
+    "abs", "all", "any", "ascii", "bin", "bool", "bytes", "callable", "chr",
+    "complex", "dict", "divmod", "enumerate", "filter", "float", "format",
+    "frozenset", "hasattr", "hash", "hex", "id", "int", "isinstance",
+    "issubclass", "iter", "len", "list", "map", "max", "min", "oct", "ord",
+    "pow", "print", "range", "repr", "reversed", "round", "set", "sorted",
+    "str", "sum", "tuple", "type", "vars", "zip",
+}
+
+def mutated_names(tree, keeps_receiver=None):
+    """
+    Names a fragment may change in place: receivers of method calls, values
+    passed to calls (`random.shuffle(lst)`) other than `PURE_BUILTINS`, and
+    targets of attribute and item assignments or deletions.
+    `keeps_receiver(name, method)` optionally tells the calls of a method on
+    a variable that are known not to change it.
+    """
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Call):
+            if isinstance(node.func, ast.Attribute):
+                receiver = node.func.value
+                if not (
+                    keeps_receiver is not None
+                    and isinstance(receiver, ast.Name)
+                    and keeps_receiver(receiver.id, node.func.attr)
+                ):
+                    names.add(mutation_root(receiver))
+            elif isinstance(node.func, ast.Name) and node.func.id in PURE_BUILTINS:
+                continue
+            for arg in node.args:
+                names.add(mutation_root(arg.value if isinstance(arg, ast.Starred) else arg))
+            for keyword in node.keywords:
+                names.add(mutation_root(keyword.value))
+        elif isinstance(node, (ast.Attribute, ast.Subscript)) and isinstance(node.ctx, (ast.Store, ast.Del)):
+            names.add(mutation_root(node.value))
+    names.discard(None)
+    return names
+
+def called_names(tree):
+    """Names a fragment calls when it runs; calls in the bodies of the functions it defines are left out."""
+    names = set()
+    nodes = [tree]
+    while nodes:
+        node = nodes.pop()
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name):
+            names.add(node.func.id)
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.Lambda)):
+            # Only the decorators and defaults run with the definition
+            nodes.extend(getattr(node, "decorator_list", ()))
+            nodes.extend(node.args.defaults)
+            nodes.extend(default for default in node.args.kw_defaults if default is not None)
+        else:
+            nodes.extend(ast.iter_child_nodes(node))
+    return names
+
+def imported_names(tree):
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            names.update((alias.asname or alias.name).split(".", 1)[0] for alias in node.names)
+    return names
+
+def conflicts(first, second):
+    """
+    Whether two fragments must run in order: one defines a name the other
+    touches. Names a fragment changes in place are given as defined.
+    """
+    if first is None or second is None:
+        return True
+    first_defined, first_consumed = first
+    second_defined, second_consumed = second
+    return bool(
+        first_defined & (second_defined | second_consumed)
+        or second_defined & first_consumed
+    )
+
+def schedule_levels(entries):
+    """
+    Group fragments into levels that can run concurrently.
+
+    `entries` are the (defined, consumed) names of each fragment in execution
+    order, or None for a fragment that could not be analyzed, which conflicts
+    with every other fragment. A fragment is placed one level after the last fragment before it
+    that it conflicts with, so every level only depends on earlier levels and
+    running the levels in order is equivalent to running the fragments in
+    order.
+    """
+    levels = []
+    level_of = []
+    for position, entry in enumerate(entries):
+        level = 0
+        for earlier in range(position):
+            if conflicts(entries[earlier], entry):
+                level = max(level, level_of[earlier] + 1)
+        level_of.append(level)
+        if level == len(levels):
+            levels.append([])
+        levels[level].append(position)
+    return levels
+
+def flatten_codes(elements):
+    """Yield (path, code) for each code of a possibly nested execution list."""
+    for i, element in enumerate(elements):
+        if isinstance(element, list):
+            for path, code in flatten_codes(element):
+                yield (i,) + path, code
+        else:
+            yield (i,), element
+
+def handle_schedule_request(request, cache=None):
+    """
+    Daemon operation "schedule": {"elements": [...], "types": {...}, "configuration": {...}}.
+
+    Each element is the code of a fragment as it is executed, a nested list
+    of elements (a graph node) or None. Returns {"levels": [[...], ...], "names": [...]}
+    with the positions of each level and the defined, consumed and mutated
+    (consumed and possibly changed in place) names of every element, None
+    when unknown. A fragment changing a name in place conflicts with every
+    other fragment touching it. A fragment calling a function or class of
+    the session, which may change any global, runs alone in its level.
+    Names neither built in, imported nor described by the "configuration"
+    as a value other than a function or class are taken to be such
+    functions. Method calls are resolved with the
+    types exported by the fragments run before, starting from the optional
+    type environment "types", or from the types read from the "configuration"
+    of the execution the fragments run after (see `type_propagation`).
+    """
+    elements = request["elements"]
+    codes = {path: code for path, code in flatten_codes(elements) if code is not None}
+    trees = {}
+    for path, code in codes.items():
+        try:
+            trees[path] = ast.parse(code)
+        except (SyntaxError, ValueError):
+            pass
+    # Calls on modules are not taken as changes to them
+    modules = set().union(*map(imported_names, trees.values()))
+    keys = ["/".join(map(str, path)) for path in codes]
+    results = analyze_many(
+        dict(zip(keys, codes.values())),
+        cache=cache,
+        cache_dir=request.get("cache_dir"),
+    )
+    results, _ = propagate_types(results, keys, request_types(request))
+    configuration = request.get("configuration") or {}
+    batch_defined = set()
+    for result in results.values():
+        if "error" not in result:
+            batch_defined |= namespace_names(result)[0]
+
+    def is_session_callable(name):
+        if name in modules or (hasattr(builtins, name) and name not in batch_defined):
+            return False
+        description = configuration.get(name)
+        return (
+            name in batch_defined
+            or description is None
+            or described_type(description) in ("function", "class")
+        )
+
+    def names_of(element, path):
+        # (defined, consumed, mutated, whether it calls session code)
+        if element is None:
+            return None
+        if isinstance(element, list):
+            defined, consumed, mutated, serial = set(), set(), set(), False
+            for i, child in enumerate(element):
+                names = names_of(child, path + (i,))
+                if names is None:
+                    return None
+                defined |= names[0]
+                consumed |= names[1] - defined
+                mutated |= names[2] - defined
+                serial = serial or names[3]
+            return defined, consumed, mutated, serial
+        result = results["/".join(map(str, path))]
+        if "error" in result:
+            return None
+        defined, consumed = namespace_names(result)
+        tree = trees[path]
+        mutated = (mutated_names(tree) - modules) & consumed
+        return defined, consumed, mutated, any(map(is_session_callable, called_names(tree)))
+
+    entries = [names_of(element, (i,)) for i, element in enumerate(elements)]
+    return {
+        "levels": schedule_levels([
+            None if entry is None or entry[3] else (entry[0] | entry[2], entry[1] - entry[2])
+            for entry in entries
+        ]),
+        "names": [
+            None if entry is None else {
+                "defined": sorted(entry[0]),
+                "consumed": sorted(entry[1]),
+                "mutated": sorted(entry[2]),
+            }
+            for entry in entries
+        ],
+    }
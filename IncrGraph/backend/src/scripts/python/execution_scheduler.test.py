@@ -0,0 +1,90 @@
+import io
+import json
+import unittest
+
+from analyze_code import analyze_code, serve
+from execution_scheduler import handle_schedule_request, namespace_names, schedule_levels
+
+class TestExecutionScheduler(unittest.TestCase):
+
+    def test_namespace_names(self):
+        defined, consumed = namespace_names(analyze_code("import numpy as np\nx = np.ones(3)\nitems.append(x)"))
+        self.assertEqual(defined, {"np", "x"})
+        self.assertEqual(consumed, {"items"})
+
+    def test_independent_fragments_share_a_level(self):
+        entries = [({"a"}, set()), ({"b"}, set()), ({"c"}, {"a", "b"}), ({"d"}, {"a"})]
+        self.assertEqual(schedule_levels(entries), [[0, 1], [2, 3]])
+
+    def test_readers_of_the_same_name_run_concurrently(self):
+        entries = [({"df"}, set()), ({"mean"}, {"df"}), ({"summary"}, {"df"})]
+        self.assertEqual(schedule_levels(entries), [[0], [1, 2]])
+
+    def test_redefinition_waits_for_readers(self):
+        entries = [({"x"}, set()), ({"y"}, {"x"}), ({"x"}, set())]
+        self.assertEqual(schedule_levels(entries), [[0], [1], [2]])
+
+    def test_unknown_fragment_is_a_barrier(self):
+        entries = [({"a"}, set()), None, ({"b"}, set())]
+        self.assertEqual(schedule_levels(entries), [[0], [1], [2]])
+
+    def test_nested_elements(self):
+        result = handle_schedule_request({"elements": [
+            "import pandas as pd",
+            ["x = 1", "y = x + 1"],
+            "df = pd.DataFrame()",
+            "z = y",
+            "def broken(",
+        ]})
+        self.assertEqual(result["levels"], [[0, 1], [2, 3], [4]])
+        self.assertEqual(result["names"][1], {"defined": ["x", "y"], "consumed": [], "mutated": []})
+        self.assertIsNone(result["names"][4])
+
+    def test_changes_in_place_conflict(self):
+        result = handle_schedule_request({"elements": ["x = []", "x.append(1)", "print(x)"]})
+        self.assertEqual(result["levels"], [[0], [1], [2]])
+        self.assertEqual(result["names"][1], {"defined": [], "consumed": ["x"], "mutated": ["x"]})
+        elements = ["d = {}\nt = T()", "d['a'] = 1", "t.done = True", "del d['a']", "t.items[0].mark()", "len(d)"]
+        self.assertEqual(handle_schedule_request({"elements": elements})["levels"], [[0], [1, 2], [3, 4], [5]])
+        # Calls on modules do not change them
+        elements = ["import numpy as np", "a = np.zeros(3)", "b = np.ones(3)"]
+        self.assertEqual(handle_schedule_request({"elements": elements})["levels"], [[0], [1, 2]])
+
+    def test_changes_through_calls_conflict(self):
+        elements = ["x = 0\ndef inc():\n    global x\n    x += 1", "inc()", "inc()", "print(x)"]
+        self.assertEqual(handle_schedule_request({"elements": elements})["levels"], [[0], [1], [2], [3]])
+        elements = ["import random\nlst = [1, 2]", "random.shuffle(lst)", "print(lst)"]
+        result = handle_schedule_request({"elements": elements})
+        self.assertEqual(result["levels"], [[0], [1], [2]])
+        self.assertEqual(result["names"][1]["mutated"], ["lst"])
+        elements = ["lst = []\ndef f(items):\n    items.append(1)", "f(lst)", "print(lst)"]
+        self.assertEqual(handle_schedule_request({"elements": elements})["levels"], [[0], [1], [2]])
+        # Functions of the session the configuration describes as built in
+        elements = ["a = sqrt(2)", "b = sqrt(3)"]
+        self.assertEqual(handle_schedule_request({"elements": elements})["levels"], [[0], [1]])
+        configuration = {"sqrt": "<builtin_function_or_method>"}
+        result = handle_schedule_request({"elements": elements, "configuration": configuration})
+        self.assertEqual(result["levels"], [[0, 1]])
+
+    def test_method_calls_wait_for_their_class(self):
+        elements = ["class Tracker:\n    pass", "tracker.add(1)", "tracker = Tracker()", "tracker.add(2)"]
+        result = handle_schedule_request({"elements": elements, "types": {"tracker": "Tracker"}})
+        self.assertEqual(result["levels"], [[0], [1], [2], [3]])
+        self.assertEqual(result["names"][1], {"defined": [], "consumed": ["Tracker", "tracker"], "mutated": ["tracker"]})
+        self.assertEqual(handle_schedule_request({"elements": elements})["levels"], [[0, 1], [2], [3]])
+
+    def test_types_from_configuration(self):
+        elements = ["class Tracker:\n    pass", "tracker.add(1)"]
+        result = handle_schedule_request({"elements": elements, "configuration": {"tracker": "<Tracker>"}})
+        self.assertEqual(result["levels"], [[0], [1]])
+        result = handle_schedule_request({"elements": elements, "configuration": {"tracker": "<function>"}})
+        self.assertEqual(result["levels"], [[0, 1]])
+
+    def test_serve_schedule_operation(self):
+        request = {"id": 1, "op": "schedule", "elements": ["a = 1", "b = 2", "c = a + b"]}
+        stdout = io.StringIO()
+        serve(io.StringIO(json.dumps(request) + "\n"), stdout, ops={"schedule": handle_schedule_request})
+        self.assertEqual(json.loads(stdout.getvalue())["result"]["levels"], [[0, 1], [2]])
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,97 @@
+"""
+Benchmark the per-fragment latency of the two ways the backend can execute code:
+
+* spawn:  a fresh interpreter per fragment that loads the previous session with
+          `dill.load_session` and saves it with `dill.dump_session` (the original
+          `executeCode` script)
+* worker: one long-lived `execution_worker.py` process keeping the session live
+          and saving it as content-addressed per-global snapshots
+
+Each run executes a chain of short fragments on top of a session holding a
+few numpy arrays, as in the case study graphs, and reports the disk used by
+the saved states.
+
+Usage: python execution_worker.bench.py [--fragments N] [--array-size N]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+WORKER_PATH = os.path.join(SCRIPT_DIR, "execution_worker.py")
+
+SPAWN_SCRIPT = """
+import os, sys, dill
+if os.path.exists(sys.argv[1]):
+    dill.load_session(sys.argv[1])
+exec(sys.argv[3])
+dill.dump_session(sys.argv[2])
+"""
+
+def fragments(count, array_size):
+    yield f"import numpy as np\nrng = np.random.default_rng(0)\ndata = rng.random({array_size})\nlabels = list(range(100))"
+    for i in range(count - 1):
+        yield f"value_{i} = float(data[{i}]) * 2\ncount = len(labels) + {i}"
+
+def bench_spawn(codes, directory):
+    timings = []
+    previous = ""
+    for i, code in enumerate(codes):
+        state = os.path.join(directory, f"spawn-{i}.pkl")
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", SPAWN_SCRIPT, previous, state, code], check=True)
+        timings.append(time.perf_counter() - start)
+        previous = state
+    return timings
+
+def bench_worker(codes, directory):
+    timings = []
+    process = subprocess.Popen([sys.executable, WORKER_PATH], stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+    try:
+        previous = ""
+        for i, code in enumerate(codes):
+            state = os.path.join(directory, f"worker-{i}.json")
+            request = {"id": i, "code": code, "state_in": previous, "state_out": state, "config_out": state + ".config"}
+            start = time.perf_counter()
+            process.stdin.write(json.dumps(request) + "\n")
+            process.stdin.flush()
+            response = json.loads(process.stdout.readline())
+            timings.append(time.perf_counter() - start)
+            assert not response["result"]["failed"], response
+            previous = state
+    finally:
+        process.stdin.close()
+        process.wait()
+    return timings
+
+def disk_usage(directory, prefix):
+    total = 0
+    for root, _, files in os.walk(directory):
+        for name in files:
+            if root != directory or name.startswith(prefix):
+                total += os.path.getsize(os.path.join(root, name))
+    return total
+
+def report(name, timings, disk):
+    timings_ms = sorted(t * 1000 for t in timings)
+    print(
+        f"{name:<8} fragments={len(timings_ms):<5} mean={statistics.mean(timings_ms):8.2f}ms "
+        f"median={statistics.median(timings_ms):8.2f}ms max={timings_ms[-1]:8.2f}ms "
+        f"total={sum(timings_ms):9.1f}ms disk={disk / 2**20:8.1f}MiB"
+    )
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare spawn-per-fragment and warm worker execution latency.")
+    parser.add_argument("--fragments", type=int, default=20, help="Number of fragments in the chain")
+    parser.add_argument("--array-size", type=int, default=1_000_000, help="Length of the array held by the session")
+    args = parser.parse_args()
+
+    codes = list(fragments(args.fragments, args.array_size))
+    with tempfile.TemporaryDirectory() as directory:
+        report("spawn", bench_spawn(codes, directory), disk_usage(directory, "spawn-"))
+        report("worker", bench_worker(codes, directory), disk_usage(directory, "worker-"))
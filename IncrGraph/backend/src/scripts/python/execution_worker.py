@@ -0,0 +1,352 @@
+import io
+import os
+import sys
+import json
+import time
+import types
+import builtins
+import cProfile
+import traceback
+from collections import OrderedDict
+from contextlib import contextmanager, redirect_stderr, redirect_stdout
+
+from execution_memo import find_run, global_reads, memo_dir_for, record_run, replay_run, state_entries
+from fragment_profile import write_profile
+from global_trace import GlobalTracer, fragment_trace, write_trace
+from state_store import LazyBuiltins, ObjectStore, default_store_dir, load_state, save_state, state_exists, state_size
+from value_summary import PREVIEW_ITEMS, describe_value, page_value, resolve_path
+
+# Names left in the session by the original one-shot execution script
+HARNESS_PREFIX = "IGC_RUN_VARIABLE_"
+HARNESS_NAMES = {"state", "config"}
+
+# Written next to each state
+CONFIGURATION_FILE = "configuration.json"
+
+DEFAULT_MAX_NAMESPACES = 4
+
+def capture_configuration(namespace):
+    """The user-visible globals of a namespace, as shown in the session configuration."""
+    configuration = {
+        name: describe_value(value)
+        for name, value in list(namespace.items())
+        if not name.startswith("__") and not name.startswith(HARNESS_PREFIX) and name not in HARNESS_NAMES
+    }
+    # Globals not loaded yet keep the description they were saved with
+    lazy = namespace.get("__builtins__")
+    if isinstance(lazy, LazyBuiltins):
+        for name in lazy.deferred:
+            if name not in namespace and name in lazy.descriptions:
+                configuration[name] = lazy.descriptions[name]
+    return configuration
+
+def global_value(main, name):
+    if name in main.__dict__:
+        return main.__dict__[name]
+    lazy = main.__dict__.get("__builtins__")
+    if isinstance(lazy, LazyBuiltins) and name in lazy.deferred:
+        return lazy.materialize(name)
+    raise KeyError(name)
+
+def read_configuration(state_path):
+    path = os.path.join(os.path.dirname(state_path), CONFIGURATION_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+def reset_peak_rss():
+    # Linux resets the peak resident set size of the process on request
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+def peak_rss():
+    """Peak resident set size in bytes since the last reset, or of the whole process where it cannot be reset."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+class PhaseTimer:
+    """Milliseconds spent in each phase of a run."""
+
+    def __init__(self):
+        self.phases = {}
+        self.last = time.perf_counter()
+
+    def end(self, phase):
+        now = time.perf_counter()
+        self.phases[phase] = (now - self.last) * 1000
+        self.last = now
+
+def file_signature(path):
+    stat = os.stat(path)
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+@contextmanager
+def as_main(module):
+    # Sessions pickle their globals as those of __main__
+    previous = sys.modules["__main__"]
+    sys.modules["__main__"] = module
+    try:
+        yield module
+    finally:
+        sys.modules["__main__"] = previous
+
+def new_main():
+    main = types.ModuleType("__main__")
+    main.__dict__["__builtins__"] = builtins
+    return main
+
+class ExecutionWorker:
+    """
+    Runs code fragments against session states while keeping the resulting
+    namespaces alive.
+
+    Each live namespace is keyed by the state file it was last saved to. A
+    fragment continuing from that file reuses the namespace directly; the
+    file is only loaded when the namespace is not live (a cold worker, a
+    different branch of the session, or a file rewritten since). The record
+    of the last save is kept with the namespace, so saving it again only
+    pickles the globals that may have changed.
+
+    When the fragment's dependencies are known, a state loaded from disk
+    only loads those globals up front and the others on first access.
+    """
+
+    def __init__(self, max_namespaces=DEFAULT_MAX_NAMESPACES):
+        self.max_namespaces = max_namespaces
+        # state path -> (module, file signature when saved, state record)
+        self.namespaces = OrderedDict()
+        self.loads = 0
+        self.reuses = 0
+
+    def namespace_for(self, state_in, dependencies=None):
+        entry = self.namespaces.pop(state_in, None)
+        if entry is not None and os.path.exists(state_in) and file_signature(state_in) == entry[1]:
+            self.reuses += 1
+            return entry[0], entry[2]
+        main = new_main()
+        record = None
+        if state_exists(state_in):
+            with as_main(main):
+                record = load_state(main, state_in, dependencies)
+            lazy = main.__dict__["__builtins__"]
+            if isinstance(lazy, LazyBuiltins):
+                lazy.descriptions = read_configuration(state_in)
+            self.loads += 1
+        return main, record
+
+    def keep(self, state_out, main, record):
+        self.namespaces[state_out] = (main, file_signature(state_out), record)
+        while len(self.namespaces) > self.max_namespaces:
+            self.namespaces.popitem(last=False)
+
+    def run(self, code, state_in, state_out, config_out, dependencies=None, profile_dir=None, memoize=False, trace=False):
+        """
+        Run `code` on top of the state saved at `state_in` and save the result
+        to `state_out`, with its configuration at `config_out`. A fragment
+        raising an exception saves nothing, like the original script.
+        `dependencies` lists the globals the fragment reads, if known. With
+        `profile_dir`, the fragment is profiled and its profile written there.
+        With `memoize`, a recorded run of the same code on the same inputs is
+        replayed instead (see `execution_memo`), and this run is recorded.
+        With `trace`, the globals the fragment reads and writes are traced
+        and written next to `config_out` (see `global_trace`); traced runs
+        are always executed.
+        """
+        reset_peak_rss()
+        timer = PhaseTimer()
+        store = ObjectStore(default_store_dir(state_out))
+        use_memo = memoize and not profile_dir and not trace
+        # Objects are named by their hash, so traced runs compare entries across stores
+        entries_in = state_entries(state_in, store if use_memo else None) if use_memo or trace else None
+        if use_memo and entries_in is not None:
+            recorded = find_run(memo_dir_for(store), code, entries_in, store)
+            if recorded is not None:
+                configuration_in = read_configuration(state_in) if state_exists(state_in) else {}
+                entries = replay_run(recorded, entries_in, configuration_in, store, state_out, config_out)
+                timer.end("memo")
+                return {
+                    "output": recorded["output"],
+                    "error": recorded["error"],
+                    "failed": False,
+                    "live": list(self.namespaces),
+                    "metrics": {
+                        "memoized": True,
+                        "restoredFromDisk": False,
+                        "stateSize": state_size(store, {name: (None, entry) for name, entry in entries.items()}),
+                        "storedBytes": 0,
+                        "phases": timer.phases,
+                        "peakRss": peak_rss(),
+                    },
+                }
+        loads = self.loads
+        main, record = self.namespace_for(state_in, dependencies)
+        timer.end("load")
+        metrics = {"restoredFromDisk": self.loads > loads}
+        stdout = io.StringIO()
+        stderr = io.StringIO()
+        failed = False
+        tracer = GlobalTracer(main.__dict__) if trace else None
+        profiler = None
+        stdin = sys.stdin
+        sys.stdin = io.StringIO()
+        try:
+            with as_main(main), redirect_stdout(stdout), redirect_stderr(stderr):
+                try:
+                    code_object = compile(code, "<fragment>", "exec")
+                    profiler = cProfile.Profile() if profile_dir else None
+                    if profiler is not None:
+                        profiler.enable()
+                    try:
+                        if tracer is not None:
+                            with tracer.tracing():
+                                exec(code_object, main.__dict__)
+                        else:
+                            exec(code_object, main.__dict__)
+                    finally:
+                        if profiler is not None:
+                            profiler.disable()
+                except BaseException as e:
+                    failed = True
+                    # Drop this frame from the traceback
+                    traceback.print_exception(type(e), e, e.__traceback__.tb_next)
+        finally:
+            sys.stdin = stdin
+        timer.end("execute")
+
+        if profiler is not None:
+            # The profile is not part of the fragment's result
+            try:
+                write_profile(profiler, profile_dir)
+            except Exception:
+                stderr.write(f"Could not write the profile:\n{traceback.format_exc()}")
+            timer.end("profile")
+
+        if not failed:
+            try:
+                with as_main(main):
+                    record = save_state(main, state_out, record, store)
+                metrics["stateSize"] = state_size(store, record)
+                metrics["storedBytes"] = store.written
+            except Exception:
+                failed = True
+                stderr.write(traceback.format_exc())
+                if os.path.exists(state_out):
+                    os.remove(state_out)
+            timer.end("save")
+        if not failed:
+            configuration = capture_configuration(main.__dict__)
+            with open(config_out, "w") as f:
+                json.dump(configuration, f, default=str)
+            self.keep(state_out, main, record)
+            timer.end("configuration")
+            if tracer is not None:
+                entries_out = {name: entry for name, (_, entry) in record.items()} if entries_in is not None else None
+                write_trace(fragment_trace(tracer, entries_in, entries_out), os.path.dirname(config_out))
+                timer.end("trace")
+            if use_memo and entries_in is not None:
+                record_run(
+                    memo_dir_for(store),
+                    code,
+                    global_reads(code_object, main.__dict__),
+                    entries_in,
+                    {name: entry for name, (_, entry) in record.items()},
+                    stdout.getvalue(),
+                    stderr.getvalue(),
+                    # As written to `config_out`
+                    json.loads(json.dumps(configuration, default=str)),
+                )
+                timer.end("memo")
+        metrics["phases"] = timer.phases
+        metrics["peakRss"] = peak_rss()
+
+        return {
+            "output": stdout.getvalue(),
+            "error": stderr.getvalue(),
+            "failed": failed,
+            "live": list(self.namespaces),
+            "metrics": metrics,
+        }
+
+    def expand(self, state_path, name, path=(), offset=0, limit=PREVIEW_ITEMS):
+        """
+        A page of the items of the global `name` in the state saved at
+        `state_path`, or of the item at `path` inside it.
+        """
+        entry = self.namespaces.get(state_path)
+        if entry is not None and file_signature(state_path) == entry[1]:
+            main = entry[0]
+        else:
+            main = new_main()
+            with as_main(main):
+                load_state(main, state_path, [name])
+        with as_main(main):
+            return page_value(resolve_path(global_value(main, name), path), offset, limit)
+
+def serve(stdin, stdout, worker):
+    """
+    Reads newline-delimited JSON requests
+    {"id", "code", "state_in", "state_out", "config_out", "dependencies"?, "profile_dir"?, "memoize"?, "trace"?}
+    or {"id", "op": "expand", "state", "name", "path"?, "offset"?, "limit"?}
+    and writes one JSON response line per request.
+    """
+    for line in stdin:
+        line = line.strip()
+        if not line:
+            continue
+        request_id = None
+        try:
+            request = json.loads(line)
+            request_id = request.get("id")
+            if request.get("op") == "expand":
+                result = worker.expand(
+                    request["state"],
+                    request["name"],
+                    request.get("path", []),
+                    request.get("offset", 0),
+                    request.get("limit", PREVIEW_ITEMS),
+                )
+            else:
+                result = worker.run(
+                    request["code"],
+                    request["state_in"],
+                    request["state_out"],
+                    request["config_out"],
+                    request.get("dependencies"),
+                    request.get("profile_dir"),
+                    request.get("memoize", False),
+                    request.get("trace", False),
+                )
+            response = {"id": request_id, "result": result}
+        except Exception as e:
+            response = {"id": request_id, "error": f"{type(e).__name__}: {e}"}
+        stdout.write(json.dumps(response, default=str) + "\n")
+        stdout.flush()
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Serve code fragment executions over stdin/stdout.")
+    parser.add_argument("--max-namespaces", type=int, default=DEFAULT_MAX_NAMESPACES, help="Live namespaces kept per worker")
+    args = parser.parse_args()
+
+    # Keep the protocol on the original stdout; anything written to file
+    # descriptor 1 by native code or child processes goes to stderr instead
+    protocol = os.fdopen(os.dup(sys.stdout.fileno()), "w")
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    serve(sys.stdin, protocol, ExecutionWorker(args.max_namespaces))
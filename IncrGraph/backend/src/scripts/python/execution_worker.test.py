@@ -0,0 +1,157 @@
+import io
+import os
+import json
+import tempfile
+import unittest
+
+import dill
+
+from analyze_code import analyze_code
+from execution_scheduler import namespace_names
+from execution_worker import ExecutionWorker, capture_configuration, serve
+from fragment_profile import COLLAPSED_FILE
+
+class TestExecutionWorker(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.worker = ExecutionWorker()
+
+    def paths(self, n):
+        directory = os.path.join(self.tmp.name, str(n))
+        os.makedirs(directory, exist_ok=True)
+        return os.path.join(directory, "state.json"), os.path.join(directory, "configuration.json")
+
+    def run_fragment(self, code, previous, n, worker=None):
+        state_in = self.paths(previous)[0] if previous is not None else ""
+        return (worker or self.worker).run(code, state_in, *self.paths(n))
+
+    def read_configuration(self, n):
+        with open(self.paths(n)[1]) as f:
+            return json.load(f)
+
+    def test_chain_reuses_live_namespace(self):
+        self.run_fragment("x = 1\ndef double(v):\n    return v * 2", None, 1)
+        result = self.run_fragment("y = double(x)\nprint(y)", 1, 2)
+        self.assertEqual(result["output"], "2\n")
+        self.assertEqual(self.read_configuration(2), {"x": 1, "double": "<function>", "y": 2})
+        self.assertEqual((self.worker.loads, self.worker.reuses), (0, 1))
+
+    def test_saved_state_loads_elsewhere(self):
+        self.run_fragment("import json\nclass Point:\n    pass\np = Point()\np.x = 3", None, 1)
+        result = self.run_fragment("z = p.x + json.loads('1')", 1, 2, ExecutionWorker())
+        self.assertFalse(result["failed"])
+        self.assertEqual(self.read_configuration(2)["z"], 4)
+
+    def test_failure_saves_nothing_and_reloads(self):
+        self.run_fragment("x = 1", None, 1)
+        result = self.run_fragment("x = 2\nraise ValueError('boom')", 1, 2)
+        self.assertTrue(result["failed"])
+        self.assertIn("ValueError: boom", result["error"])
+        self.assertNotIn("execution_worker", result["error"])
+        self.assertFalse(os.path.exists(self.paths(2)[0]))
+        self.run_fragment("y = x", 1, 3)
+        self.assertEqual(self.read_configuration(3)["y"], 1)
+        self.assertEqual(self.worker.loads, 1)
+
+    def test_profile(self):
+        directory = os.path.dirname(self.paths(1)[0])
+        self.run_fragment("x = 1", None, 1)
+        self.assertFalse(os.path.exists(os.path.join(directory, COLLAPSED_FILE)))
+        result = self.worker.run("x = sorted(range(1000), key=lambda v: -v)\nraise ValueError", "", *self.paths(1), None, directory)
+        self.assertNotIn("execution_worker", result["error"])
+        with open(os.path.join(directory, COLLAPSED_FILE)) as f:
+            self.assertIn("<lambda> (<fragment>:1)", f.read())
+
+    def test_profile_errors_do_not_fail_the_fragment(self):
+        missing = os.path.join(self.tmp.name, "missing")
+        result = self.worker.run("x = 1", "", *self.paths(1), None, missing)
+        self.assertFalse(result["failed"])
+        self.assertIn("Could not write the profile", result["error"])
+        self.assertEqual(self.read_configuration(1), {"x": 1})
+
+    def test_branching_from_an_older_state(self):
+        self.run_fragment("x = 1", None, 1)
+        self.run_fragment("x = 2", 1, 2)
+        self.run_fragment("y = x", 1, 3)
+        self.assertEqual(self.read_configuration(3)["y"], 1)
+
+    def test_rewritten_state_file_is_reloaded(self):
+        self.run_fragment("x = 1", None, 1)
+        other = ExecutionWorker()
+        self.run_fragment("x = 5", None, 0, other)
+        os.replace(self.paths(0)[0], self.paths(1)[0])
+        self.run_fragment("y = x", 1, 2)
+        self.assertEqual(self.read_configuration(2)["y"], 5)
+
+    def test_unpicklable_state_fails(self):
+        result = self.run_fragment("import threading\nlock = threading.Lock()\ngen = (i for i in range(3))", None, 1)
+        self.assertTrue(result["failed"])
+        self.assertFalse(os.path.exists(self.paths(1)[0]))
+
+    def test_dependencies_are_loaded_first(self):
+        self.run_fragment("import numpy as np\ndata = np.zeros(3)\nx = 1", None, 1)
+        worker = ExecutionWorker()
+        state_in = self.paths(1)[0]
+        worker.run("y = x + 1", state_in, *self.paths(2), dependencies=["x"])
+        main = worker.namespaces[self.paths(2)[0]][0]
+        self.assertNotIn("data", main.__dict__)
+        self.assertEqual(
+            self.read_configuration(2),
+            {"y": 2, "x": 1, "np": "<module>", "data": {"type": "ndarray", "shape": [3], "dtype": "float64", "preview": [0.0] * 3}},
+        )
+        self.run_fragment("z = float(data.sum()) + y", 2, 3, worker)
+        self.assertEqual(self.read_configuration(3)["z"], 2.0)
+
+    def test_deleted_globals_are_loaded_first(self):
+        self.run_fragment("x = [1, 2]\ny = 3", None, 1)
+        code = "del x\nprint(y)"
+        _, consumed = namespace_names(analyze_code(code))
+        result = ExecutionWorker().run(code, self.paths(1)[0], *self.paths(2), dependencies=sorted(consumed))
+        self.assertFalse(result["failed"], result["error"])
+        self.assertEqual(self.read_configuration(2), {"y": 3})
+
+    def test_expand(self):
+        self.run_fragment("rows = [{'id': i} for i in range(1000)]", None, 1)
+        self.assertEqual(self.read_configuration(1)["rows"]["length"], 1000)
+        state = self.paths(1)[0]
+        for worker in (self.worker, ExecutionWorker()):
+            page = worker.expand(state, "rows", [], 995, 10)
+            self.assertEqual(page["items"], [{"id": i} for i in range(995, 1000)])
+            self.assertEqual(worker.expand(state, "rows", [3, "id"]), {"type": "int", "offset": 0, "value": 3})
+
+    def test_metrics(self):
+        first = self.run_fragment("data = bytearray(10_000_000)", None, 1)["metrics"]
+        self.assertEqual(set(first["phases"]), {"load", "execute", "save", "configuration"})
+        self.assertGreater(first["peakRss"], 10_000_000)
+        self.assertGreater(first["stateSize"], 10_000_000)
+        second = self.run_fragment("x = 1", 1, 2, ExecutionWorker())["metrics"]
+        self.assertTrue(second["restoredFromDisk"])
+        # Rerunning into the same store only writes what changed
+        rerun = self.run_fragment("x = 2", 1, 2)["metrics"]
+        self.assertFalse(rerun["restoredFromDisk"])
+        self.assertLess(rerun["storedBytes"], 1000)
+        self.assertEqual(rerun["stateSize"], second["stateSize"])
+        failed = self.run_fragment("raise ValueError", 2, 3)["metrics"]
+        self.assertEqual(set(failed["phases"]), {"load", "execute"})
+
+    def test_configuration_skips_harness_names(self):
+        namespace = {"__name__": "__main__", "IGC_RUN_VARIABLE_JSON": json, "state": {}, "a": (1, 2), "m": dill}
+        self.assertEqual(capture_configuration(namespace), {"a": (1, 2), "m": "<module>"})
+
+    def test_serve(self):
+        state, config = self.paths(1)
+        requests = [
+            {"id": 1, "code": "print('hi')", "state_in": "", "state_out": state, "config_out": config},
+            {"id": 2, "code": "x = 1"},
+        ]
+        stdout = io.StringIO()
+        serve(io.StringIO("".join(json.dumps(r) + "\n" for r in requests)), stdout, self.worker)
+        responses = [json.loads(line) for line in stdout.getvalue().splitlines()]
+        self.assertEqual(responses[0]["result"]["output"], "hi\n")
+        self.assertEqual(responses[0]["result"]["live"], [state])
+        self.assertEqual(responses[1], {"id": 2, "error": "KeyError: 'state_in'"})
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
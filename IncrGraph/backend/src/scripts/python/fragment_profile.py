@@ -0,0 +1,85 @@
+"""
+Profiles of code fragment executions.
+
+A fragment run with profiling enabled leaves two files in its execution
+directory: `profile.pstats`, the cProfile statistics (readable with
+`pstats` or `snakeviz`), and `profile.collapsed`, the same profile as
+collapsed stacks (`caller;callee microseconds` lines) for flame graph tools
+such as `flamegraph.pl` or speedscope.
+
+cProfile only records caller/callee pairs, not whole stacks, so the time of
+a function called along several paths is split between them in proportion
+to the time each caller spent in it. The number of paths can grow
+exponentially with the depth of the call graph (e.g. functions calling the
+same helpers along many routes), so stacks are only expanded up to
+MAX_STACKS stacks and MAX_DEPTH frames: beyond that, a callee is shown as a
+leaf with all the time spent in it.
+"""
+import os
+import pstats
+
+PSTATS_FILE = "profile.pstats"
+COLLAPSED_FILE = "profile.collapsed"
+
+MAX_STACKS = 10000
+MAX_DEPTH = 64
+
+def frame_name(function):
+    filename, line, name = function
+    if filename == "~":
+        # Built-in functions, e.g. "<built-in method builtins.sorted>"
+        return name.strip("<>")
+    return f"{name} ({os.path.basename(filename)}:{line})"
+
+def collapsed_stacks(stats):
+    """Lines `frame;frame;... microseconds` of the self time of every call path in `stats`."""
+    entries = stats.stats
+    callees = {function: [] for function in entries}
+    for function, (_, _, _, _, callers) in entries.items():
+        for caller, (_, _, _, cumulative) in callers.items():
+            if caller in callees:
+                callees[caller].append((function, cumulative))
+
+    totals = {}
+    expanded = 0
+
+    def visit(function, stack, share):
+        nonlocal expanded
+        expanded += 1
+        _, _, own, cumulative, _ = entries[function]
+        stack = stack + (frame_name(function),)
+        totals[stack] = totals.get(stack, 0) + own * share
+        pending = []
+        for callee, time in callees[function]:
+            callee_cumulative = entries[callee][3]
+            # Recursive calls are already counted in the outer call
+            if callee_cumulative > 0 and frame_name(callee) not in stack:
+                pending.append((callee, time, share * time / callee_cumulative))
+        for callee, time, callee_share in pending:
+            if expanded < MAX_STACKS and len(stack) < MAX_DEPTH:
+                visit(callee, stack, callee_share)
+            else:
+                leaf = stack + (frame_name(callee),)
+                totals[leaf] = totals.get(leaf, 0) + time * share
+
+    for function, (_, _, _, _, callers) in entries.items():
+        if not any(caller in entries for caller in callers):
+            visit(function, (), 1.0)
+
+    return [
+        f"{';'.join(stack)} {round(time * 1e6)}"
+        for stack, time in totals.items()
+        if round(time * 1e6) > 0
+    ]
+
+def write_profile(profiler, directory):
+    """Write the profile of a stopped `profiler` to `directory`, returning the files written."""
+    stats = pstats.Stats(profiler)
+    # The profiler records its own disable call
+    stats.stats.pop(("~", 0, "<method 'disable' of '_lsprof.Profiler' objects>"), None)
+    pstats_path = os.path.join(directory, PSTATS_FILE)
+    collapsed_path = os.path.join(directory, COLLAPSED_FILE)
+    stats.dump_stats(pstats_path)
+    with open(collapsed_path, "w") as f:
+        f.writelines(line + "\n" for line in collapsed_stacks(stats))
+    return [pstats_path, collapsed_path]
@@ -0,0 +1,74 @@
+import os
+import time
+import pstats
+import cProfile
+import tempfile
+import unittest
+
+from fragment_profile import COLLAPSED_FILE, MAX_STACKS, PSTATS_FILE, collapsed_stacks, write_profile
+
+CODE = """
+def leaf():
+    return sum(range(20000))
+def left():
+    return leaf() + leaf() + leaf()
+def right():
+    return leaf()
+def fib(n):
+    return n if n < 2 else fib(n - 1) + fib(n - 2)
+for _ in range(20):
+    left()
+    right()
+fib(15)
+"""
+
+def profile(code):
+    profiler = cProfile.Profile()
+    profiler.enable()
+    exec(compile(code, "<fragment>", "exec"), {})
+    profiler.disable()
+    return profiler
+
+def parse(lines):
+    return {line.rsplit(" ", 1)[0]: int(line.rsplit(" ", 1)[1]) for line in lines}
+
+class TestFragmentProfile(unittest.TestCase):
+
+    def test_collapsed_stacks(self):
+        stacks = parse(collapsed_stacks(pstats.Stats(profile(CODE))))
+        module = "built-in method builtins.exec;<module> (<fragment>:1)"
+        left = stacks[f"{module};left (<fragment>:4);leaf (<fragment>:2);built-in method builtins.sum"]
+        right = stacks[f"{module};right (<fragment>:6);leaf (<fragment>:2);built-in method builtins.sum"]
+        # leaf's time is split by how much of it each caller spent
+        self.assertAlmostEqual(left / (left + right), 0.75, delta=0.1)
+        # Recursive calls collapse into the outermost call
+        self.assertIn(f"{module};fib (<fragment>:8)", stacks)
+        self.assertFalse(any("fib (<fragment>:8);fib" in stack for stack in stacks))
+
+    def test_diamond_call_graphs(self):
+        # Every function calls both functions of the next level: 2 ** 18 paths
+        code = "def f18():\n    return 1\n" + "".join(
+            f"def f{i}():\n    return f{i + 1}() + g{i + 1}()\ndef g{i}():\n    return f{i + 1}() + g{i + 1}()\n"
+            for i in range(17, -1, -1)
+        ).replace("g18()", "f18()") + "f0()"
+        stats = pstats.Stats(profile(code))
+        start = time.perf_counter()
+        stacks = parse(collapsed_stacks(stats))
+        self.assertLess(time.perf_counter() - start, 2)
+        self.assertLess(len(stacks), 2 * MAX_STACKS)
+        # Folded callees keep the time spent in them
+        total = sum(own for _, _, own, _, _ in stats.stats.values())
+        self.assertAlmostEqual(sum(stacks.values()) / 1e6, total, delta=total * 0.05)
+
+    def test_write_profile(self):
+        with tempfile.TemporaryDirectory() as directory:
+            paths = write_profile(profile("sorted(range(1000), key=lambda v: -v)"), directory)
+            self.assertEqual(paths, [os.path.join(directory, PSTATS_FILE), os.path.join(directory, COLLAPSED_FILE)])
+            functions = {name for _, _, name in pstats.Stats(paths[0]).stats}
+            self.assertIn("<lambda>", functions)
+            self.assertFalse(any("disable" in name for name in functions))
+            with open(paths[1]) as f:
+                self.assertTrue(all(line.rsplit(" ", 1)[1].strip().isdigit() for line in f))
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,169 @@
+"""
+Runtime tracing of the globals a fragment reads, writes and deletes.
+
+`analyze_code` finds the dependencies of a fragment statically, and misses
+the names used through `exec`, `global` statements in called functions, or
+functions defined by earlier fragments. A traced run records instead the
+globals the code actually used: every name instruction executed by a frame
+running in the fragment's namespace (the fragment itself, and the functions,
+methods and comprehensions defined in it) is looked at before it runs.
+
+The globals of a module cannot be replaced by an instrumented mapping (the
+functions defined in it would keep reading the plain one), so the namespace
+is traced with `sys.settrace` opcode events instead. Running a name
+instruction again records nothing new, so opcode events are only turned on
+for the lines whose name instructions did not all run yet (a deletion starts
+over, for the frames still traced and those called after it). Accesses through
+`globals()` or `vars()` are not seen; the globals whose stored value changed
+(see `state_store`) are reported as written regardless of how.
+
+The trace of a run is written next to its configuration as `trace.json`:
+{"read": [...], "written": [...], "deleted": [...]}, where "read" are the
+names the fragment took from the state it ran on (not the builtins it used,
+nor names it set itself first).
+"""
+import os
+import sys
+import dis
+import json
+import builtins
+from contextlib import contextmanager
+
+TRACE_FILE = "trace.json"
+
+NAME_READS = {"LOAD_NAME", "LOAD_GLOBAL"}
+NAME_WRITES = {"STORE_NAME", "STORE_GLOBAL"}
+NAME_DELETES = {"DELETE_NAME", "DELETE_GLOBAL"}
+NAME_OPS = NAME_READS | NAME_WRITES | NAME_DELETES
+
+class GlobalTracer:
+    """Records the globals of `namespace` read, written and deleted by the code run under `tracing()`."""
+
+    def __init__(self, namespace):
+        self.namespace = namespace
+        self.read = set()
+        self.written = set()
+        self.deleted = set()
+        # code object -> {offset: (instruction, name, line)} of its name instructions
+        self.name_ops = {}
+        # code object -> {line: offsets} of its name instructions not run yet
+        self.pending = {}
+
+    def ops_of(self, code):
+        ops = self.name_ops.get(code)
+        if ops is None:
+            ops = {}
+            starts = dict(dis.findlinestarts(code))
+            line = None
+            for instruction in dis.get_instructions(code):
+                line = starts.get(instruction.offset, line)
+                if instruction.opname in NAME_OPS:
+                    ops[instruction.offset] = (instruction.opname, instruction.argval, line)
+            self.name_ops[code] = ops
+        return ops
+
+    def pending_of(self, code):
+        pending = self.pending.get(code)
+        if pending is None:
+            pending = {}
+            for offset, (_, _, line) in self.ops_of(code).items():
+                pending.setdefault(line, set()).add(offset)
+            self.pending[code] = pending
+        return pending
+
+    def is_global(self, name):
+        if name in self.namespace:
+            return True
+        lazy = self.namespace.get("__builtins__")
+        if name in getattr(lazy, "deferred", ()):
+            return True
+        # A name found nowhere is still a dependency: a fragment defining it
+        # changes what this one does
+        return name not in builtins.__dict__
+
+    def trace_call(self, frame, event, arg):
+        if frame.f_globals is not self.namespace or not self.pending_of(frame.f_code):
+            return None
+        frame.f_trace_opcodes = False
+        return self.trace_frame
+
+    def trace_frame(self, frame, event, arg):
+        if event == "line":
+            # Only lines with name instructions not run yet are traced by opcode
+            frame.f_trace_opcodes = frame.f_lineno in self.pending_of(frame.f_code)
+            return self.trace_frame
+        if event != "opcode":
+            return self.trace_frame
+        op = self.name_ops[frame.f_code].get(frame.f_lasti)
+        if op is None:
+            return self.trace_frame
+        opname, name, line = op
+        if opname.endswith("_NAME") and frame.f_locals is not self.namespace:
+            # Class bodies keep their names local, and only fall back to the
+            # globals for the names they read but did not set
+            if opname != "LOAD_NAME" or name in frame.f_locals:
+                return self.trace_frame
+        if opname in NAME_READS:
+            if name not in self.written and name not in self.deleted and self.is_global(name):
+                self.read.add(name)
+        elif opname in NAME_WRITES:
+            self.written.add(name)
+            self.deleted.discard(name)
+        else:
+            self.deleted.add(name)
+            self.written.discard(name)
+            # What the other instructions found may no longer hold
+            self.pending.clear()
+            return self.trace_frame
+
+        # Running the instruction again would record nothing new
+        pending = self.pending_of(frame.f_code)
+        offsets = pending.get(line, set())
+        offsets.discard(frame.f_lasti)
+        if not offsets:
+            pending.pop(line, None)
+            frame.f_trace_opcodes = False
+            if not pending:
+                return None
+        return self.trace_frame
+
+    @contextmanager
+    def tracing(self):
+        previous = sys.gettrace()
+        sys.settrace(self.trace_call)
+        try:
+            yield self
+        finally:
+            sys.settrace(previous)
+
+def user_name(name):
+    return not name.startswith("__")
+
+def fragment_trace(tracer, entries_in=None, entries_out=None):
+    """
+    The trace of a run, as written to `trace.json`. With the manifest entries
+    of the states before and after the run, the globals whose value changed
+    in place or through `globals()` are included.
+    """
+    written = set(tracer.written)
+    deleted = set(tracer.deleted)
+    if entries_in is not None and entries_out is not None:
+        written |= {name for name, entry in entries_out.items() if entries_in.get(name) != entry}
+        deleted = (deleted | set(entries_in)) - set(entries_out)
+    return {
+        "read": sorted(filter(user_name, tracer.read)),
+        "written": sorted(filter(user_name, written - deleted)),
+        "deleted": sorted(filter(user_name, deleted)),
+    }
+
+def write_trace(trace, directory):
+    with open(os.path.join(directory, TRACE_FILE), "w") as f:
+        json.dump(trace, f)
+
+def read_trace(directory):
+    """The trace written to `directory`, or None if its last run was not traced."""
+    try:
+        with open(os.path.join(directory, TRACE_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
@@ -0,0 +1,72 @@
+import os
+import json
+import tempfile
+import unittest
+
+from execution_worker import ExecutionWorker, new_main
+from global_trace import TRACE_FILE, GlobalTracer, fragment_trace, read_trace
+
+def traced(code, namespace):
+    tracer = GlobalTracer(namespace)
+    with tracer.tracing():
+        exec(compile(code, "<fragment>", "exec"), namespace)
+    return fragment_trace(tracer)
+
+class TestGlobalTrace(unittest.TestCase):
+
+    def setUp(self):
+        self.namespace = new_main().__dict__
+        exec(
+            "scale = 2\noffset = 1\nunused = 0\n"
+            "def f(v):\n    return v * scale\n"
+            "def bump():\n    global counter\n    counter = offset\n",
+            self.namespace,
+        )
+
+    def test_reads_through_functions(self):
+        trace = traced("r = f(3)\nq = [offset + i for i in range(r)]\nlen(q)", self.namespace)
+        # Builtins and names set by the fragment itself are not read from the state
+        self.assertEqual(trace, {"read": ["f", "offset", "scale"], "written": ["q", "r"], "deleted": []})
+
+    def test_names_the_analyzer_misses(self):
+        trace = traced("bump()\nexec('s = scale')\ndel unused", self.namespace)
+        self.assertEqual(trace, {"read": ["bump", "offset", "scale"], "written": ["counter", "s"], "deleted": ["unused"]})
+
+    def test_deletions_retrace(self):
+        exec("def drop():\n    global scale\n    del scale", self.namespace)
+        trace = traced("for i in range(2):\n    drop()\n    scale = i\nr = f(1)", self.namespace)
+        self.assertEqual(trace, {"read": ["drop", "f"], "written": ["i", "r", "scale"], "deleted": []})
+        trace = traced("for i in range(2):\n    scale = i\n    drop()", self.namespace)
+        self.assertEqual(trace, {"read": ["drop"], "written": ["i"], "deleted": ["scale"]})
+
+    def test_class_bodies(self):
+        trace = traced("class A:\n    scale = 3\n    size = scale + offset\n    def m(self):\n        return scale", self.namespace)
+        self.assertEqual(trace, {"read": ["offset"], "written": ["A"], "deleted": []})
+        self.assertEqual(traced("x = A().m()", self.namespace)["read"], ["A", "scale"])
+
+    def test_missing_names_are_read(self):
+        trace = traced("try:\n    later\nexcept NameError:\n    pass", self.namespace)
+        self.assertEqual(trace["read"], ["later"])
+
+    def test_worker_writes_trace(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            def paths(n):
+                directory = os.path.join(tmp, ".sessions", "graph.igc", "session", "executions", str(n))
+                os.makedirs(directory, exist_ok=True)
+                return os.path.join(directory, "state.json"), os.path.join(directory, "configuration.json")
+
+            worker = ExecutionWorker()
+            worker.run("data = [1, 2]\nother = 0", "", *paths(1), trace=True)
+            self.assertEqual(read_trace(os.path.dirname(paths(1)[0]))["written"], ["data", "other"])
+            # Mutated in place, through `globals()`, or not at all
+            code = "data.append(3)\nglobals()['extra'] = len(data)"
+            for n, memoize in ((2, False), (3, True), (4, True)):
+                result = worker.run(code, paths(1)[0], *paths(n), memoize=memoize, trace=True)
+                self.assertNotIn("memoized", result["metrics"])
+                with open(os.path.join(os.path.dirname(paths(n)[0]), TRACE_FILE)) as f:
+                    self.assertEqual(json.load(f), {"read": ["data"], "written": ["data", "extra"], "deleted": []})
+            worker.run(code, paths(1)[0], *paths(5))
+            self.assertIsNone(read_trace(os.path.dirname(paths(5)[0])))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,301 @@
+"""
+Import plain Python modules as .igc graphs.
+
+Each module becomes one graph, split into code nodes at top-level statement
+boundaries:
+
+* runs of imports, and runs of other plain statements, become one
+  CodeFragmentNode each
+* every top-level function becomes its own CodeFragmentNode
+* every class becomes a ClassNode holding its header and class-level
+  statements, with a MethodNode (scoped to the class) per method
+
+Comments and blank lines before a statement go with it. The code data of
+each node holds its analysis, as the editor stores it, and nodes are linked
+by MethodRelationship edges and by DependencyRelationship edges from each
+node to the nodes defining the names it depends on.
+
+Each module is parsed once: the analysis of a node replays the recorded
+operations of its statements (see `AnalysisState`). Modules are imported
+in parallel across processes.
+"""
+import os
+import ast
+import copy
+import json
+import tokenize
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+from analyze_code import AnalysisState, DependencyVisitor, describe_error
+from incremental_analysis import split_lines, statement_span
+
+# Below this many modules the cost of starting worker processes outweighs the gain
+PARALLEL_THRESHOLD = 16
+
+# Directories never searched for modules
+SKIPPED_DIRS = {"__pycache__", "node_modules", "venv", "site-packages"}
+
+# Vertical distance between nodes, and horizontal offset of methods from their class
+ROW_HEIGHT = 120
+METHOD_OFFSET = 250
+
+START_NODE = {
+    "id": "start",
+    "type": "StartNode",
+    "data": {"label": "Start"},
+    "position": {"x": 0, "y": -100},
+    "positionAbsolute": {"x": 0, "y": -100},
+    "style": {"cursor": "grab"},
+    "width": 23,
+    "height": 23,
+    "selected": False,
+    "draggable": False,
+}
+
+# A node to create: its type, code, class scope (methods only) and the
+# statements whose recorded operations make up its analysis
+Fragment = namedtuple("Fragment", ["node_type", "code", "scope", "statements"])
+
+def statement_group(stmt):
+    """Consecutive statements of the same group (other than None) share a fragment."""
+    if isinstance(stmt, (ast.Import, ast.ImportFrom)):
+        return "imports"
+    if isinstance(stmt, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+        return None
+    return "code"
+
+def line_ranges(statements):
+    """(start, end) line indices of each statement, with the lines before it back to the previous one."""
+    ranges = []
+    previous_end = 0
+    for stmt in statements:
+        start, end = statement_span(stmt)
+        ranges.append((min(start, previous_end), end))
+        previous_end = max(previous_end, end)
+    return ranges
+
+def source(lines, start, end, indent=""):
+    """Lines start..end, without `indent` and without leading and trailing blank lines."""
+    text = "".join(line[len(indent):] if line.startswith(indent) else line for line in lines[start:end])
+    return text.strip("\n").rstrip()
+
+def split_class(lines, stmt, start, end):
+    """The ClassNode and MethodNode fragments of a class spanning lines start..end."""
+    methods = [s for s in stmt.body if isinstance(s, (ast.FunctionDef, ast.AsyncFunctionDef))]
+    body_start = statement_span(stmt.body[0])[0]
+    if not methods or stmt.body[0].lineno == stmt.lineno:
+        # Nothing to split, or a class on one line
+        return [Fragment("ClassNode", source(lines, start, end), None, [stmt])]
+    first_line = lines[body_start]
+    indent = first_line[:len(first_line) - len(first_line.lstrip())]
+
+    class_lines = lines[start:body_start]
+    method_fragments = []
+    for member, (member_start, member_end) in zip(stmt.body, line_ranges(stmt.body)):
+        member_start = max(member_start, body_start)
+        if member in methods:
+            method_fragments.append(
+                Fragment("MethodNode", source(lines, member_start, member_end, indent), stmt.name, [member])
+            )
+        else:
+            class_lines.extend(lines[member_start:member_end])
+    header = copy.copy(stmt)
+    header.body = [s for s in stmt.body if s not in methods]
+    code = source(class_lines, 0, len(class_lines))
+    if not header.body:
+        header.body = [ast.Pass()]
+        code += f"\n{indent}pass"
+    return [Fragment("ClassNode", code, None, [header])] + method_fragments
+
+def split_module(code):
+    """The fragments of a module, in order."""
+    lines = split_lines(code)
+    tree = ast.parse(code)
+    # Runs of statements sharing a fragment, as [statements, start, end]
+    runs = []
+    for stmt, (start, end) in zip(tree.body, line_ranges(tree.body)):
+        group = statement_group(stmt)
+        if runs:
+            previous = runs[-1][0][-1]
+            # Statements sharing a line cannot be split apart
+            if stmt.lineno == previous.end_lineno or (group is not None and group == statement_group(previous)):
+                runs[-1][0].append(stmt)
+                runs[-1][2] = end
+                continue
+        runs.append([[stmt], start, end])
+
+    fragments = []
+    for statements, start, end in runs:
+        if len(statements) == 1 and isinstance(statements[0], ast.ClassDef):
+            fragments.extend(split_class(lines, statements[0], start, end))
+        else:
+            fragments.append(Fragment("CodeFragmentNode", source(lines, start, end), None, statements))
+    return fragments
+
+def fragment_analysis(fragment):
+    """The analysis of a fragment's code, with its definitions scoped to its class as the editor does."""
+    state = AnalysisState()
+    visitor = DependencyVisitor()
+    for stmt in fragment.statements:
+        state.apply(visitor.record(stmt))
+    result = state.result()
+    if fragment.scope is not None:
+        result["new_definitions"] = {
+            kind: names if kind == "attributes" else [f"{fragment.scope}.{name}" for name in names]
+            for kind, names in result["new_definitions"].items()
+        }
+        if fragment.scope not in result["dependencies"]["classes"]:
+            result["dependencies"]["classes"].append(fragment.scope)
+    for kinds in result.values():
+        for names in kinds.values():
+            names.sort()
+    return result
+
+def node_label(fragment, new_definitions):
+    # The label the editor gives a node after analyzing it
+    if fragment.node_type == "ClassNode" and new_definitions["classes"]:
+        return new_definitions["classes"][0]
+    if new_definitions["functions"]:
+        return new_definitions["functions"][0]
+    if fragment.node_type == "CodeFragmentNode" and new_definitions["variables"]:
+        return new_definitions["variables"][0]
+    return fragment.code.splitlines()[0][:40]
+
+def dependency_edges(nodes):
+    """DependencyRelationship edges from each code node to the nodes defining what it depends on."""
+    dependents = {}
+    definers = {}
+    for node in nodes:
+        code_data = node["data"].get("codeData")
+        if code_data is None:
+            continue
+        for names in code_data["dependencies"].values():
+            for name in names:
+                dependents.setdefault(name, []).append(node["id"])
+        for names in code_data["new_definitions"].values():
+            for name in names:
+                definers.setdefault(name, []).append(node["id"])
+
+    fulfilled = {}
+    for name, sources in dependents.items():
+        for source_id in sources:
+            for target_id in definers.get(name, ()):
+                if source_id != target_id:
+                    names = fulfilled.setdefault((source_id, target_id), [])
+                    if name not in names:
+                        names.append(name)
+    return [
+        {
+            "id": f"D0-{source_id}>{target_id}",
+            "source": source_id,
+            "target": target_id,
+            "type": "DependencyRelationship",
+            "data": {"label": ", ".join(names)},
+        }
+        for (source_id, target_id), names in fulfilled.items()
+    ]
+
+def module_graph(code):
+    """The .igc graph of a module's source."""
+    nodes = [copy.deepcopy(START_NODE)]
+    edges = []
+    class_ids = {}
+    for i, fragment in enumerate(split_module(code)):
+        node_id = str(i)
+        analysis = fragment_analysis(fragment)
+        code_data = {"code": fragment.code, **analysis}
+        position = {"x": 0, "y": i * ROW_HEIGHT}
+        if fragment.scope is not None:
+            code_data["scope"] = fragment.scope
+            position["x"] = METHOD_OFFSET
+            edges.append({
+                "id": f"0-{node_id}>{class_ids[fragment.scope]}",
+                "source": node_id,
+                "target": class_ids[fragment.scope],
+                "type": "MethodRelationship",
+            })
+        elif fragment.node_type == "ClassNode":
+            class_ids[fragment.statements[0].name] = node_id
+        # Labels use the definitions before they are scoped to the class
+        new_definitions = analysis["new_definitions"]
+        if fragment.scope is not None:
+            new_definitions = {
+                kind: names if kind == "attributes" else [name[len(fragment.scope) + 1:] for name in names]
+                for kind, names in new_definitions.items()
+            }
+        nodes.append({
+            "id": node_id,
+            "type": fragment.node_type,
+            "data": {"label": node_label(fragment, new_definitions), "codeData": code_data},
+            "position": position,
+        })
+    return {"nodes": nodes, "edges": edges + dependency_edges(nodes)}
+
+def import_module(path, output_path):
+    """Write the graph of the module at `path` to `output_path`, returning its number of code nodes."""
+    with tokenize.open(path) as f:
+        code = f.read()
+    graph = module_graph(code)
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    with open(output_path, "w") as f:
+        json.dump(graph, f)
+    return len(graph["nodes"]) - 1
+
+def import_module_or_error(job):
+    path, output_path = job
+    try:
+        return import_module(path, output_path)
+    except Exception as e:
+        return {"error": describe_error(e)}
+
+def find_modules(source, output_dir):
+    """(module path, .igc path) of every module under `source`, a file or a directory."""
+    if os.path.isfile(source):
+        name = os.path.splitext(os.path.basename(source))[0]
+        yield source, os.path.join(output_dir, f"{name}.igc")
+        return
+    for directory, subdirectories, files in os.walk(source):
+        subdirectories[:] = sorted(d for d in subdirectories if not d.startswith(".") and d not in SKIPPED_DIRS)
+        for file in sorted(files):
+            if file.endswith(".py"):
+                path = os.path.join(directory, file)
+                relative = os.path.relpath(os.path.splitext(path)[0], source)
+                yield path, os.path.join(output_dir, f"{relative}.igc")
+
+def import_paths(sources, output_dir, max_workers=None, parallel_threshold=PARALLEL_THRESHOLD):
+    """
+    Import every module under `sources` (files or directories) into
+    `output_dir`, mirroring the directory layout. Returns {"files": {module
+    path: .igc path}, "errors": {module path: error}}. Large imports are
+    fanned out across a process pool.
+    """
+    jobs = [job for source in sources for job in find_modules(source, output_dir)]
+    if max_workers == 1 or len(jobs) < parallel_threshold:
+        results = map(import_module_or_error, jobs)
+    else:
+        workers = max_workers or os.cpu_count() or 1
+        executor = ProcessPoolExecutor(max_workers=workers)
+        results = executor.map(import_module_or_error, jobs, chunksize=max(1, len(jobs) // (workers * 4)))
+    summary = {"files": {}, "errors": {}}
+    try:
+        for (path, output_path), result in zip(jobs, results):
+            if isinstance(result, dict):
+                summary["errors"][path] = result["error"]
+            else:
+                summary["files"][path] = output_path
+    finally:
+        if not (max_workers == 1 or len(jobs) < parallel_threshold):
+            executor.shutdown()
+    return summary
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Import Python modules as .igc graphs.")
+    parser.add_argument("sources", nargs="+", help="Python files, or directories searched for them")
+    parser.add_argument("--out", required=True, help="Directory to write the .igc files to")
+    parser.add_argument("--workers", type=int, default=None, help="Maximum worker processes (1 disables the pool)")
+    args = parser.parse_args()
+
+    print(json.dumps(import_paths(args.sources, args.out, args.workers)))
@@ -0,0 +1,127 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+
+from igc_import import import_paths, module_graph, split_module
+
+SOURCE = '''"""A module."""
+import os
+from . import sibling
+from math import sqrt
+
+# The origin
+ORIGIN = (0, 0); SCALE = 2
+
+@decorate
+def distance(a, b=ORIGIN):
+    return sqrt(a[0] - b[0])
+
+class Point:
+    """A point."""
+    dimensions = 2
+
+    def __init__(self, x):
+        self.x = x
+
+    # Decorated methods keep their decorators
+    @property
+    def norm(self):
+        return distance(self.x)
+
+class Empty: pass
+
+if __name__ == "__main__":
+    print(Point(SCALE).norm)
+'''
+
+class TestIgcImport(unittest.TestCase):
+
+    def test_split_module(self):
+        fragments = split_module(SOURCE)
+        self.assertEqual(
+            [(fragment.node_type, fragment.scope) for fragment in fragments],
+            [
+                ("CodeFragmentNode", None),
+                ("CodeFragmentNode", None),
+                ("CodeFragmentNode", None),
+                ("CodeFragmentNode", None),
+                ("ClassNode", None),
+                ("MethodNode", "Point"),
+                ("MethodNode", "Point"),
+                ("ClassNode", None),
+                ("CodeFragmentNode", None),
+            ],
+        )
+        self.assertEqual(fragments[1].code, "import os\nfrom . import sibling\nfrom math import sqrt")
+        self.assertEqual(fragments[2].code, "# The origin\nORIGIN = (0, 0); SCALE = 2")
+        self.assertEqual(fragments[4].code, 'class Point:\n    """A point."""\n    dimensions = 2')
+        # Methods are dedented to the top level
+        self.assertEqual(
+            fragments[6].code,
+            "# Decorated methods keep their decorators\n@property\ndef norm(self):\n    return distance(self.x)",
+        )
+        self.assertEqual(fragments[7].code, "class Empty: pass")
+
+    def test_class_without_attributes(self):
+        fragments = split_module("class A:\n    def f(self):\n        pass\n")
+        self.assertEqual(fragments[0].code, "class A:\n    pass")
+        self.assertEqual(fragments[1].code, "def f(self):\n    pass")
+
+    def test_module_graph(self):
+        graph = module_graph(SOURCE)
+        nodes = {node["id"]: node for node in graph["nodes"]}
+        self.assertEqual(graph["nodes"][0]["type"], "StartNode")
+        self.assertEqual(
+            [node["data"]["label"] for node in graph["nodes"][1:]],
+            ['"""A module."""', "os", "ORIGIN", "distance", "Point", "__init__", "norm", "Empty", 'if __name__ == "__main__":'],
+        )
+        # Method definitions are scoped to their class, which they depend on
+        norm = nodes["6"]["data"]["codeData"]
+        self.assertEqual(norm["scope"], "Point")
+        self.assertEqual(norm["new_definitions"]["functions"], ["Point.norm"])
+        self.assertIn("Point", norm["dependencies"]["classes"])
+
+        edges = {edge["id"]: edge for edge in graph["edges"]}
+        self.assertEqual(edges["0-6>4"]["type"], "MethodRelationship")
+        self.assertEqual(edges["D0-3>2"]["data"]["label"], "ORIGIN")
+        self.assertEqual(edges["D0-3>1"]["data"]["label"], "sqrt")
+        self.assertEqual(edges["D0-6>3"]["data"]["label"], "distance")
+        self.assertEqual(edges["D0-8>2"]["data"]["label"], "SCALE")
+        self.assertEqual(edges["D0-8>4"]["data"]["label"], "Point")
+        self.assertFalse(any(edge["source"] == edge["target"] for edge in graph["edges"]))
+
+    def test_import_paths(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        source = os.path.join(directory, "src")
+        os.makedirs(os.path.join(source, "package"))
+        os.makedirs(os.path.join(source, "__pycache__"))
+        modules = {
+            "main.py": SOURCE,
+            os.path.join("package", "util.py"): "def f():\n    return 1\n",
+            os.path.join("package", "broken.py"): "def f(:\n",
+            os.path.join("__pycache__", "skipped.py"): "",
+        }
+        for name, code in modules.items():
+            with open(os.path.join(source, name), "w") as f:
+                f.write(code)
+        output = os.path.join(directory, "out")
+
+        for max_workers, parallel_threshold in ((1, 16), (2, 0)):
+            summary = import_paths([source], output, max_workers, parallel_threshold)
+            self.assertEqual(
+                summary["files"],
+                {
+                    os.path.join(source, "main.py"): os.path.join(output, "main.igc"),
+                    os.path.join(source, "package", "util.py"): os.path.join(output, "package", "util.igc"),
+                },
+            )
+            self.assertEqual(list(summary["errors"]), [os.path.join(source, "package", "broken.py")])
+            self.assertIn("SyntaxError", summary["errors"][os.path.join(source, "package", "broken.py")])
+            with open(os.path.join(output, "main.igc")) as f:
+                self.assertEqual(json.load(f), module_graph(SOURCE))
+
+if __name__ == "__main__":
+    unittest.main()
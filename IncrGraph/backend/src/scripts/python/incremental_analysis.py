@@ -0,0 +1,128 @@
+import io
+import ast
+from collections import OrderedDict, namedtuple
+
+from analyze_code import AnalysisState, record_statements
+
+# A top-level statement: its line span [start, end) and its recorded operations
+Statement = namedtuple("Statement", ["start", "end", "ops"])
+
+DEFAULT_MAX_ANALYZERS = 256
+
+def split_lines(code):
+    # Split on the same line endings as the Python tokenizer (\n, \r\n and \r)
+    return io.StringIO(code, newline="").readlines()
+
+def statement_span(stmt):
+    start = stmt.lineno
+    for decorator in getattr(stmt, "decorator_list", []):
+        start = min(start, decorator.lineno)
+    return start - 1, stmt.end_lineno
+
+def parse_statements(lines, offset=0):
+    """Parse `lines` and record every top-level statement, with line numbers shifted by `offset`."""
+    tree = ast.parse("".join(lines))
+    statements = []
+    for stmt, ops in zip(tree.body, record_statements(tree.body)):
+        start, end = statement_span(stmt)
+        statements.append(Statement(start + offset, end + offset, ops))
+    return statements
+
+class IncrementalAnalyzer:
+    """
+    Analyzes successive versions of the same fragment.
+
+    The recorded operations of every top-level statement from the previous
+    analysis are kept. On the next call the new source is diffed line by line
+    against the previous one; only the statements overlapping the edited lines
+    are parsed and walked again, and the result is rebuilt by replaying the
+    operations of all statements in order. The result is always identical to
+    `analyze_code(code)`.
+    """
+
+    def __init__(self):
+        self.lines = None
+        self.statements = []
+        # Number of statements walked and reused by the last call
+        self.walked = 0
+        self.reused = 0
+
+    def analyze(self, code):
+        lines = split_lines(code)
+        statements = None
+        if self.lines is not None:
+            statements = self._reanalyze(lines)
+        if statements is None:
+            statements = parse_statements(lines)
+            self.walked = len(statements)
+            self.reused = 0
+
+        self.lines = lines
+        self.statements = statements
+
+        state = AnalysisState()
+        for statement in statements:
+            state.apply(statement.ops)
+        return state.result()
+
+    def _reanalyze(self, lines):
+        """Return the statements of `lines`, reusing unchanged ones, or None to reparse everything."""
+        old_lines = self.lines
+        old_statements = self.statements
+        limit = min(len(lines), len(old_lines))
+
+        prefix = 0
+        while prefix < limit and lines[prefix] == old_lines[prefix]:
+            prefix += 1
+        suffix = 0
+        while suffix < limit - prefix and lines[-1 - suffix] == old_lines[-1 - suffix]:
+            suffix += 1
+        old_edit_end = len(old_lines) - suffix
+        shift = len(lines) - len(old_lines)
+
+        # Statements entirely before the edit. The last one is re-walked as well,
+        # since indented lines added right after it become part of its body.
+        before = [s for s in old_statements if s.end <= prefix]
+        chunk_start = 0
+        if before:
+            chunk_start = before[-1].start
+            before = [s for s in before if s.end <= chunk_start]
+
+        # Statements entirely after the edit, not sharing a line with a re-walked one
+        first_after = len(old_statements)
+        while first_after > len(before) and old_statements[first_after - 1].start >= old_edit_end:
+            first_after -= 1
+        while (
+            first_after < len(old_statements)
+            and first_after > 0
+            and old_statements[first_after].start < old_statements[first_after - 1].end
+        ):
+            first_after += 1
+        after = old_statements[first_after:]
+
+        chunk_end = (after[0].start if after else len(old_lines)) + shift
+        try:
+            middle = parse_statements(lines[chunk_start:chunk_end], chunk_start)
+        except SyntaxError:
+            # The edit changed how the surrounding lines tokenize (e.g. an unclosed bracket)
+            return None
+
+        self.walked = len(middle)
+        self.reused = len(before) + len(after)
+        return before + middle + [Statement(s.start + shift, s.end + shift, s.ops) for s in after]
+
+class IncrementalAnalyzerPool:
+    """Keeps one `IncrementalAnalyzer` per key (e.g. per node), bounded in least-recently-used order."""
+
+    def __init__(self, max_analyzers=DEFAULT_MAX_ANALYZERS):
+        self.max_analyzers = max_analyzers
+        self.analyzers = OrderedDict()
+
+    def analyze(self, key, code):
+        analyzer = self.analyzers.get(key)
+        if analyzer is None:
+            analyzer = self.analyzers[key] = IncrementalAnalyzer()
+            while len(self.analyzers) > self.max_analyzers:
+                self.analyzers.popitem(last=False)
+        self.analyzers.move_to_end(key)
+        return analyzer.analyze(code)
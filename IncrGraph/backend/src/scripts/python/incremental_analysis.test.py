@@ -0,0 +1,138 @@
+import io
+import json
+import random
+import unittest
+
+from analyze_code import analyze_code, serve
+from incremental_analysis import IncrementalAnalyzer, IncrementalAnalyzerPool
+
+def sort_analysis_result(result):
+    for key in result['dependencies']:
+        result['dependencies'][key].sort()
+    for key in result['new_definitions']:
+        result['new_definitions'][key].sort()
+    return result
+
+MODULE = """import os
+from datetime import datetime
+
+class Task:
+    def __init__(self, title):
+        self.title = title
+
+    def describe(self):
+        return f"{self.title} ({datetime.now()})"
+
+@staticmethod
+def helper(x):
+    return x * 2
+
+tasks = [Task("a"), Task("b")]
+task = Task("c")
+print(task.describe())
+total = 0
+for t in tasks:
+    total += helper(len(t.title))
+x = 1; y = x + 1
+del y
+result = os.path.join("a", "b")
+"""
+
+EDIT_LINES = [
+    "z = total + 1\n",
+    "    w = 5\n",
+    "task = tracker\n",
+    "def helper(x):\n",
+    "del total\n",
+    "items = (1,\n",
+    "print(undefined_name)\n",
+    "class Task(Base):\n",
+    "\n",
+    "# comment\n",
+    "s = '''\n",
+    "obj.method(arg)\n",
+]
+
+class TestIncrementalAnalyzer(unittest.TestCase):
+
+    def assert_matches_full_analysis(self, analyzer, code):
+        try:
+            expected = sort_analysis_result(analyze_code(code))
+        except SyntaxError:
+            with self.assertRaises(SyntaxError):
+                analyzer.analyze(code)
+            return
+        self.assertEqual(sort_analysis_result(analyzer.analyze(code)), expected, code)
+
+    def test_first_analysis_matches(self):
+        analyzer = IncrementalAnalyzer()
+        self.assert_matches_full_analysis(analyzer, MODULE)
+        self.assertEqual(analyzer.reused, 0)
+
+    def test_only_edited_statement_is_walked(self):
+        analyzer = IncrementalAnalyzer()
+        analyzer.analyze(MODULE)
+        edited = MODULE.replace('result = os.path.join("a", "b")', 'result = os.path.join("a", other)')
+        self.assert_matches_full_analysis(analyzer, edited)
+        self.assertLessEqual(analyzer.walked, 2)
+        self.assertGreater(analyzer.reused, 5)
+
+    def test_edit_changes_later_dependencies(self):
+        analyzer = IncrementalAnalyzer()
+        analyzer.analyze("a = 1\nb = a\n")
+        result = analyzer.analyze("c = 1\nb = a\n")
+        self.assertEqual(result["dependencies"]["variables"], ["a"])
+        self.assertEqual(analyzer.walked, 1)
+
+    def test_indented_line_joins_previous_statement(self):
+        analyzer = IncrementalAnalyzer()
+        analyzer.analyze("def f():\n    return 1\nx = 2\n")
+        self.assert_matches_full_analysis(analyzer, "def f():\n    return 1\n    y = g()\nx = 2\n")
+
+    def test_syntax_error_keeps_previous_version(self):
+        analyzer = IncrementalAnalyzer()
+        analyzer.analyze(MODULE)
+        with self.assertRaises(SyntaxError):
+            analyzer.analyze(MODULE + "def broken(\n")
+        self.assert_matches_full_analysis(analyzer, MODULE + "extra = 1\n")
+
+    def test_random_edits_match_full_analysis(self):
+        rng = random.Random(0)
+        for _ in range(20):
+            analyzer = IncrementalAnalyzer()
+            lines = MODULE.splitlines(keepends=True)
+            self.assert_matches_full_analysis(analyzer, "".join(lines))
+            for _ in range(15):
+                index = rng.randrange(len(lines) + 1)
+                action = rng.choice(["insert", "replace", "delete"])
+                if action == "insert":
+                    lines.insert(index, rng.choice(EDIT_LINES))
+                elif action == "replace" and index < len(lines):
+                    lines[index] = rng.choice(EDIT_LINES)
+                elif index < len(lines):
+                    del lines[index]
+                self.assert_matches_full_analysis(analyzer, "".join(lines))
+
+    def test_pool_keeps_one_analyzer_per_key(self):
+        pool = IncrementalAnalyzerPool(max_analyzers=2)
+        pool.analyze("a", "x = 1")
+        pool.analyze("b", "y = 1")
+        pool.analyze("a", "x = 2")
+        pool.analyze("c", "z = 1")
+        self.assertEqual(list(pool.analyzers), ["a", "c"])
+        self.assertEqual(pool.analyze("a", "x = q")["dependencies"]["variables"], ["q"])
+
+    def test_serve_keyed_requests(self):
+        pool = IncrementalAnalyzerPool()
+        requests = [
+            {"id": 1, "code": "a = 1\nb = a", "key": "graph.igc:0"},
+            {"id": 2, "code": "b = a", "key": "graph.igc:0"},
+        ]
+        stdout = io.StringIO()
+        serve(io.StringIO("".join(json.dumps(r) + "\n" for r in requests)), stdout, incremental=pool)
+        responses = [json.loads(line) for line in stdout.getvalue().splitlines()]
+        self.assertEqual(responses[1]["result"], analyze_code("b = a"))
+        self.assertIn("graph.igc:0", pool.analyzers)
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,269 @@
+"""
+Garbage collection and compaction of the sessions of a graph.
+
+Every run adds an execution directory to its session and objects to the
+store the sessions of a graph share (see `state_store`), and nothing is
+removed when executions are deleted or re-run. `collect_garbage`:
+
+* prunes the execution directories that are not on their session's path
+  (nested executions included)
+* sweeps the objects of the store no remaining state refers to, and the
+  temporary files of interrupted writes
+* hard links identical state files (manifests, legacy full session pickles)
+  to a single copy; states are always replaced, never written in place
+* optionally compresses the objects only earlier executions refer to, so
+  the last state of each session, which the next run loads, is left as is
+* expires the memoized runs (see `execution_memo`) not recorded or replayed
+  for a week; the objects of the others are kept
+
+Files changed within the grace period are left alone, so a collection can
+run while fragments execute and write new objects.
+"""
+import os
+import sys
+import gzip
+import json
+import time
+import shutil
+import hashlib
+import tempfile
+
+from execution_memo import MEMO_DIR, read_runs
+from state_store import (
+    COMPRESSED_SUFFIX,
+    LEGACY_STATE_FILE,
+    NPY_FORMAT,
+    OBJECTS_DIR,
+    STATE_FILE,
+    ObjectStore,
+    read_manifest,
+)
+
+SESSION_CONFIG_FILE = "config.json"
+EXECUTIONS_DIR = "executions"
+
+# Seconds a file must be left unchanged before it can be removed or compressed
+GRACE_PERIOD = 60 * 60
+# Seconds a memoized run is kept after it was last recorded or replayed
+MEMO_MAX_AGE = 7 * 24 * 60 * 60
+
+def new_stats():
+    return {
+        "prunedExecutions": 0,
+        "removedObjects": 0,
+        "linkedStates": 0,
+        "compressedObjects": 0,
+        "expiredMemos": 0,
+        "freedBytes": 0,
+    }
+
+def tree_size(path):
+    if not os.path.isdir(path):
+        return os.path.getsize(path)
+    return sum(
+        os.path.getsize(os.path.join(directory, file))
+        for directory, _, files in os.walk(path)
+        for file in files
+    )
+
+def is_settled(path, now, grace_period):
+    return now - os.path.getmtime(path) >= grace_period
+
+def read_path(executions_dir):
+    """The path of the executions in `executions_dir`, or None if it has no config."""
+    try:
+        with open(os.path.join(executions_dir, SESSION_CONFIG_FILE)) as f:
+            return json.load(f).get("path")
+    except (OSError, ValueError):
+        return None
+
+def prune_executions(executions_dir, pruned, now, grace_period):
+    """
+    Add the execution directories of `executions_dir` (recursively) that are
+    not on its path to `pruned`, and return the last execution directory on it.
+    """
+    path = read_path(executions_dir)
+    if not isinstance(path, list):
+        # Not a session this collector knows how to read
+        return None
+    reachable = {str(i) for i in range(1, len(path) + 1)}
+    for name in os.listdir(executions_dir):
+        execution_dir = os.path.join(executions_dir, name)
+        if not os.path.isdir(execution_dir):
+            continue
+        if name in reachable:
+            nested_dir = os.path.join(execution_dir, EXECUTIONS_DIR)
+            if os.path.isdir(nested_dir):
+                prune_executions(nested_dir, pruned, now, grace_period)
+        elif is_settled(execution_dir, now, grace_period):
+            pruned.append(execution_dir)
+    return os.path.join(executions_dir, str(len(path))) if path else None
+
+def state_files(sessions_dir, store_dir):
+    """Every state file under `sessions_dir`, outside of the object store."""
+    for directory, subdirectories, files in os.walk(sessions_dir):
+        subdirectories[:] = [d for d in subdirectories if os.path.join(directory, d) != store_dir]
+        for file in files:
+            if file in (STATE_FILE, LEGACY_STATE_FILE):
+                yield os.path.join(directory, file)
+
+def referenced_objects(state_path, store):
+    """The objects of `store` the manifest at `state_path` refers to, as {digest: format}."""
+    try:
+        manifest_store, entries = read_manifest(state_path)
+    except (OSError, ValueError, KeyError):
+        return {}
+    if manifest_store.directory != store.directory:
+        return {}
+    return {entry["hash"]: entry.get("format") for entry in entries.values() if "hash" in entry}
+
+def memo_objects(memo_dir, stats, now, max_age, dry_run):
+    """Expire the memoized runs of `memo_dir` unused for `max_age`, and return the objects of the others."""
+    referenced = {}
+    if not os.path.isdir(memo_dir):
+        return referenced
+    for file in os.listdir(memo_dir):
+        path = os.path.join(memo_dir, file)
+        if now - os.path.getmtime(path) >= max_age:
+            stats["expiredMemos"] += 1
+            stats["freedBytes"] += os.path.getsize(path)
+            if not dry_run:
+                os.remove(path)
+            continue
+        for run in read_runs(path):
+            for entry in run["changed"].values():
+                if "hash" in entry:
+                    referenced[entry["hash"]] = entry.get("format")
+    return referenced
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def link_duplicates(paths, stats, now, grace_period, dry_run):
+    """Hard link the files of `paths` with identical content to one of them."""
+    by_size = {}
+    for path in paths:
+        if is_settled(path, now, grace_period):
+            by_size.setdefault((os.path.basename(path), os.path.getsize(path)), []).append(path)
+    for candidates in by_size.values():
+        if len(candidates) < 2:
+            continue
+        # Files already linked are only read once
+        inode_digests = {}
+        originals = {}
+        for path in sorted(candidates):
+            status = os.stat(path)
+            inode = (status.st_dev, status.st_ino)
+            if inode not in inode_digests:
+                inode_digests[inode] = file_digest(path)
+            original = originals.setdefault(inode_digests[inode], path)
+            if os.path.samefile(original, path):
+                continue
+            stats["linkedStates"] += 1
+            stats["freedBytes"] += status.st_size
+            if not dry_run:
+                tmp = os.path.join(os.path.dirname(path), f".{os.path.basename(path)}.link")
+                os.link(original, tmp)
+                os.replace(tmp, path)
+
+def compress_object(store, digest):
+    """Replace an object by its gzip compression, returning the bytes saved."""
+    path = store.path(digest)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+    with os.fdopen(fd, "wb") as f, open(path, "rb") as source:
+        with gzip.GzipFile(fileobj=f, mode="wb", mtime=0) as target:
+            shutil.copyfileobj(source, target)
+    saved = os.path.getsize(path) - os.path.getsize(tmp)
+    if saved <= 0:
+        # Not worth decompressing on load
+        os.remove(tmp)
+        return 0
+    os.replace(tmp, store.compressed_path(digest))
+    os.remove(path)
+    return saved
+
+def sweep_store(store, referenced, hot, stats, now, grace_period, compress, dry_run):
+    """Remove the unreferenced objects of `store`, compressing the cold ones if `compress`."""
+    if not os.path.isdir(store.directory):
+        return
+    for directory, _, files in os.walk(store.directory):
+        for file in files:
+            path = os.path.join(directory, file)
+            digest = file[:-len(COMPRESSED_SUFFIX)] if file.endswith(COMPRESSED_SUFFIX) else file
+            if not is_settled(path, now, grace_period):
+                continue
+            # Objects of interrupted writes, unreferenced objects, and
+            # compressed copies of objects stored again uncompressed
+            if digest not in referenced or (file != digest and os.path.exists(store.path(digest))):
+                stats["removedObjects"] += 1
+                stats["freedBytes"] += os.path.getsize(path)
+                if not dry_run:
+                    os.remove(path)
+            elif compress and file == digest and digest not in hot and referenced[digest] != NPY_FORMAT:
+                # `.npy` objects are memory-mapped, so they stay uncompressed
+                saved = 0 if dry_run else compress_object(store, digest)
+                if dry_run or saved:
+                    stats["compressedObjects"] += 1
+                    stats["freedBytes"] += saved
+
+def collect_garbage(sessions_dir, compress=False, grace_period=GRACE_PERIOD, dry_run=False, memo_max_age=MEMO_MAX_AGE):
+    """
+    Collect the garbage of the sessions of a graph (`.sessions/<graph>`) and
+    return what was done, as counts and the bytes freed. With `dry_run`,
+    nothing is changed, and the objects that may be compressed are counted
+    without their savings.
+    """
+    stats = new_stats()
+    now = time.time()
+    sessions_dir = os.path.abspath(sessions_dir)
+    store = ObjectStore(os.path.join(sessions_dir, OBJECTS_DIR))
+
+    pruned = []
+    last_executions = []
+    for name in sorted(os.listdir(sessions_dir)):
+        executions_dir = os.path.join(sessions_dir, name, EXECUTIONS_DIR)
+        if name != OBJECTS_DIR and os.path.isdir(executions_dir):
+            last = prune_executions(executions_dir, pruned, now, grace_period)
+            if last is not None:
+                last_executions.append(last)
+    for execution_dir in pruned:
+        stats["prunedExecutions"] += 1
+        stats["freedBytes"] += tree_size(execution_dir)
+        if not dry_run:
+            shutil.rmtree(execution_dir)
+
+    # Pruned directories are still on disk in a dry run
+    states = [
+        path for path in state_files(sessions_dir, store.directory)
+        if not any(path.startswith(execution_dir + os.sep) for execution_dir in pruned)
+    ]
+    referenced = memo_objects(os.path.join(sessions_dir, MEMO_DIR), stats, now, memo_max_age, dry_run)
+    for path in states:
+        if os.path.basename(path) == STATE_FILE:
+            referenced.update(referenced_objects(path, store))
+    hot = set()
+    for execution_dir in last_executions:
+        hot.update(referenced_objects(os.path.join(execution_dir, STATE_FILE), store))
+
+    link_duplicates(states, stats, now, grace_period, dry_run)
+    sweep_store(store, referenced, hot, stats, now, grace_period, compress, dry_run)
+    return stats
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Collect the garbage of the sessions of a graph.")
+    parser.add_argument("sessions_dir", help="The sessions directory of the graph (.sessions/<graph>)")
+    parser.add_argument("--compress", action="store_true", help="Compress the objects only earlier executions use")
+    parser.add_argument("--grace-period", type=float, default=GRACE_PERIOD, help="Seconds files must be left unchanged")
+    parser.add_argument("--dry-run", action="store_true", help="Only report what would be done")
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.sessions_dir):
+        print(f"No sessions directory at {args.sessions_dir}", file=sys.stderr)
+        sys.exit(1)
+    print(json.dumps(collect_garbage(args.sessions_dir, args.compress, args.grace_period, args.dry_run)))
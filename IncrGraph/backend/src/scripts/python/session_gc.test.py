@@ -0,0 +1,112 @@
+import os
+import json
+import tempfile
+import unittest
+
+from execution_worker import as_main, new_main
+from session_gc import collect_garbage
+from state_store import STATE_FILE, ObjectStore, load_state, save_state
+
+class TestSessionGc(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.sessions_dir = os.path.join(self.tmp.name, ".sessions", "graph.igc")
+        self.executions_dir = os.path.join(self.sessions_dir, "session", "executions")
+        self.store = ObjectStore(os.path.join(self.sessions_dir, "objects"))
+
+        # Runs 1 to 3 are on the path; run 4 was deleted from it, as was the
+        # second run of the nested executions of run 2
+        main = new_main()
+        record = None
+        codes = ["text = 'a' * 10000\nn = 1", "del text\nn = 2", "n", "orphan = 'b' * 1000"]
+        for i, code in enumerate(codes, 1):
+            with as_main(main):
+                exec(code, main.__dict__)
+                record = save_state(main, self.state_path(i), record)
+        self.write_path(self.executions_dir, ["a", "b", "c"])
+        nested_dir = os.path.join(self.executions_dir, "2", "executions")
+        os.makedirs(os.path.join(nested_dir, "1"))
+        os.makedirs(os.path.join(nested_dir, "2"))
+        self.write_path(nested_dir, ["x"])
+        # Left over by an interrupted write
+        with open(os.path.join(self.store.directory, "tmpabcdef"), "wb") as f:
+            f.write(b"partial")
+
+    def state_path(self, run):
+        directory = os.path.join(self.executions_dir, str(run))
+        os.makedirs(directory, exist_ok=True)
+        return os.path.join(directory, STATE_FILE)
+
+    def write_path(self, executions_dir, path):
+        with open(os.path.join(executions_dir, "config.json"), "w") as f:
+            json.dump({"path": path, "timestamp": 0}, f)
+
+    def objects(self):
+        return sorted(file for _, _, files in os.walk(self.store.directory) for file in files)
+
+    def load(self, run):
+        main = new_main()
+        with as_main(main):
+            load_state(main, self.state_path(run))
+        return main
+
+    def test_collect_garbage(self):
+        objects = self.objects()
+        stats = collect_garbage(self.sessions_dir, compress=True, grace_period=0)
+        self.assertEqual(stats["prunedExecutions"], 2)
+        self.assertFalse(os.path.exists(os.path.join(self.executions_dir, "4")))
+        self.assertFalse(os.path.exists(os.path.join(self.executions_dir, "2", "executions", "2")))
+        self.assertTrue(os.path.exists(os.path.join(self.executions_dir, "2", "executions", "1")))
+
+        # The object of `orphan` and the temporary file are removed
+        self.assertEqual(stats["removedObjects"], 2)
+        self.assertEqual(len(self.objects()), len(objects) - 2)
+        # Runs 2 and 3 left the same state
+        self.assertEqual(stats["linkedStates"], 1)
+        self.assertTrue(os.path.samefile(self.state_path(2), self.state_path(3)))
+        # `text` is only in the state of run 1, the object of `n = 1` does not compress
+        self.assertEqual(stats["compressedObjects"], 1)
+        self.assertEqual(len([file for file in self.objects() if file.endswith(".gz")]), 1)
+        self.assertGreater(stats["freedBytes"], 10000)
+
+        self.assertEqual(self.load(1).text, "a" * 10000)
+        self.assertEqual(self.load(3).n, 2)
+
+        stats = collect_garbage(self.sessions_dir, compress=True, grace_period=0)
+        self.assertEqual(set(stats.values()), {0})
+
+    def test_dry_run(self):
+        objects = self.objects()
+        stats = collect_garbage(self.sessions_dir, compress=True, grace_period=0, dry_run=True)
+        # Every object that may be compressed is counted
+        self.assertEqual(
+            {name: count for name, count in stats.items() if name != "freedBytes"},
+            {"prunedExecutions": 2, "removedObjects": 2, "linkedStates": 1, "compressedObjects": 2, "expiredMemos": 0},
+        )
+        self.assertEqual(self.objects(), objects)
+        self.assertTrue(os.path.exists(os.path.join(self.executions_dir, "4")))
+        self.assertFalse(os.path.samefile(self.state_path(2), self.state_path(3)))
+
+    def test_recent_files_are_kept(self):
+        objects = self.objects()
+        stats = collect_garbage(self.sessions_dir, compress=True)
+        self.assertEqual(set(stats.values()), {0})
+        self.assertEqual(self.objects(), objects)
+
+    def test_compressed_object_stored_again(self):
+        collect_garbage(self.sessions_dir, compress=True, grace_period=0)
+        # A state loading the compressed object stores it again uncompressed,
+        # and the compressed copy is dropped by the next collection
+        main = self.load(1)
+        with as_main(main):
+            save_state(main, self.state_path(3))
+        self.assertEqual(len([file for file in self.objects() if file.endswith(".gz")]), 1)
+        stats = collect_garbage(self.sessions_dir, grace_period=0)
+        self.assertEqual(stats["removedObjects"], 1)
+        self.assertEqual([file for file in self.objects() if file.endswith(".gz")], [])
+        self.assertEqual(self.load(1).text, "a" * 10000)
+
+if __name__ == "__main__":
+    unittest.main()
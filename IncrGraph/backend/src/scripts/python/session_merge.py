@@ -0,0 +1,135 @@
+import os
+import sys
+import json
+
+import dill
+
+from state_store import (
+    LEGACY_STATE_FILE,
+    STATE_FILE,
+    ObjectStore,
+    default_store_dir,
+    read_manifest,
+    snapshot,
+    write_manifest,
+)
+from execution_worker import CONFIGURATION_FILE, as_main, new_main
+from global_trace import read_trace
+
+
+def read_configuration(directory):
+    path = os.path.join(directory, CONFIGURATION_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+def read_globals(directory):
+    """
+    The manifest entries of the state of an execution directory, as
+    {name: (store, entry)} with aliases resolved to the entry they share.
+    Legacy full session pickles are stored object by object first.
+    """
+    if directory is None:
+        return {}
+    path = os.path.join(directory, STATE_FILE)
+    if os.path.exists(path):
+        store, entries = read_manifest(path)
+    elif os.path.exists(os.path.join(directory, LEGACY_STATE_FILE)):
+        store = ObjectStore(default_store_dir(path))
+        main = new_main()
+        with as_main(main):
+            dill.load_module(os.path.join(directory, LEGACY_STATE_FILE), module=main)
+            entries = {name: entry for name, (_, entry) in snapshot(main.__dict__, store).items()}
+    else:
+        return {}
+
+    def resolve(entry):
+        while "alias" in entry:
+            entry = entries[entry["alias"]]
+        return entry
+
+    return {name: (store, resolve(entry)) for name, entry in entries.items()}
+
+def merge_states(base, steps):
+    """
+    Fold the states of fragments that ran concurrently into `base`.
+
+    `base` is an execution directory (or None for an empty state) and each
+    step {"dir": ..., "from": ..., "defined": [...], "consumed": [...], "out": ...}
+    the execution directory of one fragment and the one it ran on top of
+    (`base` by default). A step contributes the names it defines, the names
+    it added or removed, and the names it consumed whose stored value it
+    changed in place; a step whose names are unknown (None) replaces the
+    whole state. Names the fragment was traced writing or deleting (see
+    `global_trace`) are contributed too. When a step has an "out" directory,
+    the state merged so far is written there.
+
+    States are merged by their manifests, so no value is unpickled, and the
+    merged states are written to the store of the first state read.
+    """
+    loaded = {}
+    stores = []
+
+    def globals_of(directory):
+        if directory not in loaded:
+            loaded[directory] = read_globals(directory)
+            stores.extend(store for store, _ in loaded[directory].values())
+        return loaded[directory]
+
+    merged = dict(globals_of(base))
+    configuration = read_configuration(base) if base is not None else {}
+
+    for step in steps:
+        start_globals = globals_of(step.get("from", base))
+        step_globals = globals_of(step["dir"])
+        step_configuration = read_configuration(step["dir"])
+
+        if step["defined"] is None:
+            # Unanalyzed fragments run alone on top of everything before them
+            names = set(step_globals) | set(merged)
+        else:
+            defined = set(step["defined"])
+            trace = read_trace(step["dir"])
+            if trace is not None:
+                defined |= set(trace["written"]) | set(trace["deleted"])
+            names = {name for name in defined if name in step_globals}
+            names |= set(step_globals) ^ set(start_globals)
+            names |= {
+                name
+                for name in step["consumed"]
+                if name in step_globals
+                and name in start_globals
+                and step_globals[name][1]["hash"] != start_globals[name][1]["hash"]
+            }
+        for name in names:
+            if name in step_globals:
+                merged[name] = step_globals[name]
+            else:
+                merged.pop(name, None)
+            if name in step_configuration:
+                configuration[name] = step_configuration[name]
+            else:
+                configuration.pop(name, None)
+
+        if step.get("out") is not None:
+            os.makedirs(step["out"], exist_ok=True)
+            state_path = os.path.join(step["out"], STATE_FILE)
+            store = stores[0] if stores else ObjectStore(default_store_dir(state_path))
+            write_merged(state_path, store, merged)
+            with open(os.path.join(step["out"], CONFIGURATION_FILE), "w") as f:
+                json.dump(configuration, f, default=str)
+
+def write_merged(state_path, store, merged):
+    entries = {}
+    for name, (source, entry) in merged.items():
+        # States of one graph share their store; objects from another one are copied
+        if source.directory != store.directory and not store.has(entry["hash"]):
+            store.put(source.get(entry["hash"]))
+        entries[name] = entry
+    write_manifest(state_path, store, entries)
+
+if __name__ == "__main__":
+    # Usage: session_merge.py < {"base": ..., "steps": [...]}
+    spec = json.load(sys.stdin)
+    merge_states(spec.get("base"), spec["steps"])
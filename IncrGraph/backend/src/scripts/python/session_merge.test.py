@@ -0,0 +1,120 @@
+import os
+import sys
+import json
+import tempfile
+import unittest
+import subprocess
+
+from execution_worker import ExecutionWorker, as_main, new_main
+from session_merge import merge_states
+from state_store import load_state
+
+LEGACY_RUN_SCRIPT = """
+import sys, dill
+exec(sys.argv[2])
+dill.dump_session(sys.argv[1])
+"""
+
+class TestMergeStates(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def directory(self, name):
+        path = os.path.join(self.tmp.name, name)
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def run_fragment(self, code, start, name, configuration=None, trace=False):
+        directory = self.directory(name)
+        start_state = os.path.join(start, "state.json") if start else ""
+        result = ExecutionWorker().run(
+            code, start_state, os.path.join(directory, "state.json"), os.path.join(directory, "configuration.json"),
+            trace=trace,
+        )
+        self.assertFalse(result["failed"], result["error"])
+        with open(os.path.join(directory, "configuration.json"), "w") as f:
+            json.dump(configuration or {}, f)
+        return directory
+
+    def read(self, directory, expression):
+        main = new_main()
+        with as_main(main):
+            load_state(main, os.path.join(directory, "state.json"))
+            return eval(expression, main.__dict__)
+
+    def test_concurrent_fragments_are_merged(self):
+        base = self.run_fragment("data = [1, 2]\nscale = 3", None, "base", {"data": [1, 2], "scale": 3})
+        first = self.run_fragment("total = sum(data)", base, "first", {"data": [1, 2], "scale": 3, "total": 3})
+        second = self.run_fragment("def scaled(x):\n    return x * scale", base, "second", {"scaled": "<function>"})
+        out = self.directory("out")
+        merge_states(base, [
+            {"dir": first, "defined": ["total"], "consumed": ["data"]},
+            {"dir": second, "defined": ["scaled"], "consumed": ["scale"], "out": out},
+        ])
+        self.assertEqual(self.read(out, "[data, total, scaled(2)]"), [[1, 2], 3, 6])
+        with open(os.path.join(out, "configuration.json")) as f:
+            self.assertEqual(json.load(f), {"data": [1, 2], "scale": 3, "total": 3, "scaled": "<function>"})
+
+    def test_in_place_changes_and_deletions_are_kept(self):
+        base = self.run_fragment("items = [1]\nflag = True\nother = 0", None, "base")
+        first = self.run_fragment("items.append(2)", base, "first")
+        second = self.run_fragment("del flag", base, "second")
+        out = self.directory("out")
+        merge_states(base, [
+            {"dir": first, "defined": [], "consumed": ["items"]},
+            {"dir": second, "defined": [], "consumed": [], "out": out},
+        ])
+        self.assertEqual(self.read(out, "[items, 'flag' in globals(), other]"), [[1, 2], False, 0])
+
+    def test_traced_writes_are_kept(self):
+        base = self.run_fragment("items = [1]\ndef add(x):\n    items.append(x)", None, "base")
+        # The analyzer only sees `add` being used
+        steps = [{"dir": None, "defined": [], "consumed": ["add"]}, {"dir": None, "defined": ["other"], "consumed": []}]
+        for trace in (False, True):
+            steps[0]["dir"] = self.run_fragment("add(2)", base, f"first{trace}", trace=trace)
+            steps[1]["dir"] = self.run_fragment("other = 1", base, f"second{trace}")
+            out = self.directory(f"out{trace}")
+            steps[1]["out"] = out
+            merge_states(base, steps)
+            self.assertEqual(self.read(out, "items"), [1, 2] if trace else [1])
+
+    def test_unanalyzed_step_replaces_state(self):
+        base = self.run_fragment("a = 1", None, "base")
+        first = self.run_fragment("b = 2", base, "first")
+        level = self.directory("level")
+        merge_states(base, [{"dir": first, "defined": ["b"], "consumed": [], "out": level}])
+        second = self.run_fragment("exec('c = a + b')\ndel a", level, "second")
+        out = self.directory("out")
+        merge_states(base, [
+            {"dir": first, "defined": ["b"], "consumed": []},
+            {"dir": second, "from": level, "defined": None, "consumed": None, "out": out},
+        ])
+        self.assertEqual(self.read(out, "['a' in globals(), b, c]"), [False, 2, 3])
+
+    def test_steps_from_different_states(self):
+        base = self.run_fragment("y = 1", None, "base")
+        first = self.run_fragment("x = 1", base, "first")
+        level = self.directory("level")
+        merge_states(base, [{"dir": first, "defined": ["x"], "consumed": [], "out": level}])
+        second = self.run_fragment("y = x + 1", level, "second")
+        third = self.run_fragment("z = 5", base, "third")
+        out = self.directory("out")
+        merge_states(base, [
+            {"dir": first, "defined": ["x"], "consumed": []},
+            {"dir": second, "from": level, "defined": ["y"], "consumed": ["x"]},
+            {"dir": third, "defined": ["z"], "consumed": [], "out": out},
+        ])
+        self.assertEqual(self.read(out, "[x, y, z]"), [1, 2, 5])
+
+    def test_legacy_base_state(self):
+        base = self.directory("base")
+        subprocess.run([sys.executable, "-c", LEGACY_RUN_SCRIPT, os.path.join(base, "state.pkl"), "a = [1]"], check=True)
+        first = self.run_fragment("b = a + [2]", base, "first")
+        out = self.directory("out")
+        merge_states(base, [{"dir": first, "defined": ["b"], "consumed": ["a"], "out": out}])
+        self.assertEqual(self.read(out, "[a, b]"), [[1], [1, 2]])
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,69 @@
+"""
+Benchmark how long restoring a session takes as the arrays it holds grow:
+
+* pickle: the full session pickle written by `dill.dump_session`
+* store:  the state manifest, whose arrays are memory-mapped `.npy` objects
+* lazy:   the state manifest, loading only the globals a fragment reads
+          (`labels`) up front
+
+Each session holds one float array of the given length, a dict with a tenth
+as many entries, a small list and a function, and is restored into a fresh
+module several times.
+
+Usage: python state_store.bench.py [--sizes N [N ...]] [--repeat N]
+"""
+import os
+import time
+import argparse
+import statistics
+import tempfile
+
+import dill
+
+from execution_worker import as_main, new_main
+from state_store import load_state, save_state
+
+SESSION_CODE = """
+import numpy as np
+data = np.random.default_rng(0).random({size})
+table = {{i: str(i) for i in range({size} // 10)}}
+labels = list(range(100))
+def mean():
+    return float(data.mean())
+"""
+
+def restore_time(restore, repeat):
+    timings = []
+    for _ in range(repeat):
+        main = new_main()
+        start = time.perf_counter()
+        with as_main(main):
+            restore(main)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000
+
+def bench(size, directory, repeat):
+    main = new_main()
+    legacy_path = os.path.join(directory, f"{size}.pkl")
+    state_path = os.path.join(directory, f"{size}.json")
+    with as_main(main):
+        exec(SESSION_CODE.format(size=size), main.__dict__)
+        dill.dump_module(legacy_path, module=main)
+        save_state(main, state_path)
+    pickle_ms = restore_time(lambda m: dill.load_module(legacy_path, module=m), repeat)
+    store_ms = restore_time(lambda m: load_state(m, state_path), repeat)
+    lazy_ms = restore_time(lambda m: load_state(m, state_path, ["labels"]), repeat)
+    print(
+        f"size={size:<10} array={size * 8 / 2**20:9.1f}MiB "
+        f"pickle={pickle_ms:9.2f}ms store={store_ms:9.2f}ms lazy={lazy_ms:7.2f}ms"
+    )
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare session restore time for full pickles and the state store.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000, 10_000_000], help="Array lengths")
+    parser.add_argument("--repeat", type=int, default=5, help="Restores per size")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        for size in args.sizes:
+            bench(size, directory, args.repeat)
@@ -0,0 +1,418 @@
+"""
+Content-addressed session states.
+
+A state is saved as a manifest (`state.json`) mapping every global of the
+session to the hash of its own pickle in an object store shared by all the
+sessions of a graph (`.sessions/<graph>/objects`). Saving only pickles the
+globals that may have changed since the state was loaded or last saved, and
+only writes the pickles the store does not hold yet, so an execution that
+changes one integer adds one small object instead of a full session dump.
+
+Objects that are themselves globals (a class defined in the session, a list
+bound to two names) are pickled as references to those globals, so loading
+a state keeps their identity.
+
+Globals holding numpy arrays of plain values are stored as `.npy` files
+instead, which are memory-mapped copy-on-write when loaded: restoring them
+neither copies nor deserializes the array, whatever its size.
+
+A state can also be loaded partially, with the globals a fragment depends
+on loaded up front and the others loaded on first access (see
+`LazyBuiltins`); globals never accessed are carried over to the next state
+without being loaded at all.
+"""
+import io
+import os
+import sys
+import gzip
+import json
+import hashlib
+import builtins
+import tempfile
+
+import dill
+
+STATE_FILE = "state.json"
+# Full `dill.dump_session` pickles written by older sessions
+LEGACY_STATE_FILE = "state.pkl"
+OBJECTS_DIR = "objects"
+SESSIONS_DIR = ".sessions"
+MANIFEST_VERSION = 1
+NPY_FORMAT = "npy"
+# Objects compressed by `session_gc.py`
+COMPRESSED_SUFFIX = ".gz"
+
+# Values whose equality means an unchanged pickle
+ATOMIC_TYPES = (bool, int, float, complex, str, bytes, type(None))
+
+def default_store_dir(state_path):
+    """The object store of the graph a state belongs to, next to the state when outside of `.sessions`."""
+    state_dir = os.path.dirname(os.path.abspath(state_path))
+    directory = state_dir
+    while True:
+        parent = os.path.dirname(directory)
+        if os.path.basename(parent) == SESSIONS_DIR:
+            return os.path.join(directory, OBJECTS_DIR)
+        if parent == directory:
+            return os.path.join(state_dir, OBJECTS_DIR)
+        directory = parent
+
+def legacy_state_path(state_path):
+    return os.path.join(os.path.dirname(state_path), LEGACY_STATE_FILE)
+
+def state_exists(state_path):
+    return bool(state_path) and (os.path.exists(state_path) or os.path.exists(legacy_state_path(state_path)))
+
+class ObjectStore:
+    """Pickles stored under the hash of their content."""
+
+    def __init__(self, directory):
+        self.directory = os.path.abspath(directory)
+        # Bytes of the objects this instance added to the store
+        self.written = 0
+
+    def path(self, digest):
+        return os.path.join(self.directory, digest[:2], digest)
+
+    def compressed_path(self, digest):
+        return self.path(digest) + COMPRESSED_SUFFIX
+
+    def has(self, digest):
+        return os.path.exists(self.path(digest)) or os.path.exists(self.compressed_path(digest))
+
+    def size(self, digest):
+        """Bytes the object takes on disk."""
+        try:
+            return os.path.getsize(self.path(digest))
+        except FileNotFoundError:
+            return os.path.getsize(self.compressed_path(digest))
+
+    def put(self, data):
+        return self.put_chunks([data])
+
+    def put_chunks(self, chunks, digest=None):
+        """
+        Store the concatenation of `chunks`, whose hash may already be known.
+        A compressed object is stored again uncompressed, as states still in
+        use load it.
+        """
+        digest = digest or chunks_digest(chunks)
+        path = self.path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+            with os.fdopen(fd, "wb") as f:
+                for chunk in chunks:
+                    self.written += f.write(chunk)
+            os.replace(tmp, path)
+        return digest
+
+    def get(self, digest):
+        try:
+            with open(self.path(digest), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            with gzip.open(self.compressed_path(digest), "rb") as f:
+                return f.read()
+
+def chunks_digest(chunks):
+    digest = hashlib.sha256()
+    for chunk in chunks:
+        digest.update(chunk)
+    return digest.hexdigest()
+
+def plain_array(value):
+    """`value` as a C-contiguous array if it is a numpy array of plain values, else None."""
+    # numpy is not imported here unless the session did
+    numpy = sys.modules.get("numpy")
+    if numpy is None or type(value) not in (numpy.ndarray, numpy.memmap) or value.dtype.hasobject:
+        return None
+    # Zero-dimensional arrays cannot be memory-mapped as such
+    if value.ndim == 0:
+        return None
+    return numpy.ascontiguousarray(value)
+
+def npy_chunks(array):
+    """The `.npy` file of a C-contiguous array, as its header and its buffer."""
+    numpy = sys.modules["numpy"]
+    header = io.BytesIO()
+    numpy.lib.format.write_array_header_1_0(header, numpy.lib.format.header_data_from_array_1_0(array))
+    return [header.getvalue(), array.reshape(-1).view(numpy.uint8).data]
+
+def load_array(path):
+    import numpy
+
+    try:
+        # Copy-on-write, so fragments can still modify the array in place
+        return numpy.load(path, mmap_mode="c")
+    except ValueError:
+        # Arrays without data cannot be mapped
+        return numpy.load(path)
+
+class GlobalPickler(dill.Pickler):
+    """Pickles a value with the other globals it contains as references by name."""
+
+    def __init__(self, file, value, owners):
+        super().__init__(file)
+        self.value = value
+        self.owners = owners
+        self.refs = set()
+
+    def persistent_id(self, obj):
+        name = self.owners.get(id(obj))
+        if name is None or obj is self.value:
+            return None
+        self.refs.add(name)
+        return name
+
+    def reducer_override(self, obj):
+        # Views of memory-mapped globals are pickled as the arrays they hold
+        numpy = sys.modules.get("numpy")
+        if numpy is not None and isinstance(obj, numpy.memmap):
+            return numpy.asarray(obj).__reduce_ex__(self.proto)
+        return NotImplemented
+
+class GlobalUnpickler(dill.Unpickler):
+
+    def __init__(self, file, resolve):
+        super().__init__(file)
+        self.resolve = resolve
+
+    def persistent_load(self, name):
+        return self.resolve(name)
+
+def fingerprint(value):
+    """
+    What identifies the pickle of a value without pickling it, or None when
+    it has to be pickled to tell.
+    """
+    if isinstance(value, ATOMIC_TYPES):
+        return (type(value), value)
+    # Arrays are identified by the hash of their `.npy` file, which is much
+    # cheaper to compute than a pickle
+    array = plain_array(value)
+    if array is not None:
+        return (NPY_FORMAT, chunks_digest(npy_chunks(array)))
+    return None
+
+def dump_global(value, owners):
+    buffer = io.BytesIO()
+    pickler = GlobalPickler(buffer, value, owners)
+    pickler.dump(value)
+    return buffer.getvalue(), pickler.refs
+
+def entry_targets(entry):
+    """The globals a manifest entry references."""
+    return entry["refs"] if "refs" in entry else [entry["alias"]]
+
+def reference_cycles(entries):
+    """Names whose pickle references themselves through other globals."""
+    cyclic = set()
+    for start in entries:
+        seen = set()
+        stack = list(entry_targets(entries[start]))
+        while stack:
+            name = stack.pop()
+            if name == start:
+                cyclic.add(start)
+                break
+            if name not in seen and name in entries:
+                seen.add(name)
+                stack.extend(entry_targets(entries[name]))
+    return cyclic
+
+class LazyBuiltins(dict):
+    """
+    The builtins of a partially loaded namespace.
+
+    Name lookups that miss the globals of a module fall back to its
+    builtins, so the globals not loaded yet are loaded here on first access,
+    including from functions defined in the namespace. Globals that
+    reference each other are loaded together, so the ones left deferred
+    never reference an object the namespace can change. Deferred globals are
+    not visible through `globals()` until accessed by name.
+    """
+
+    def __init__(self, namespace, store, deferred):
+        super().__init__(builtins.__dict__)
+        self.namespace = namespace
+        self.store = store
+        # name -> manifest entry of the globals not loaded yet
+        self.deferred = deferred
+        # Descriptions of the deferred globals for the session configuration
+        self.descriptions = {}
+        # Stored values of deferred globals the namespace rebound without loading them
+        self.replaced = {}
+
+    def __missing__(self, name):
+        if name not in self.deferred:
+            raise KeyError(name)
+        return self.materialize(name)
+
+    def load(self, entry):
+        if "alias" in entry:
+            return self.resolve(entry["alias"])
+        return load_entry(self.store, entry, self.resolve)
+
+    def materialize(self, name):
+        value = self.load(self.deferred.pop(name))
+        self.namespace[name] = value
+        for other, entry in list(self.deferred.items()):
+            if other in self.deferred and other not in self.namespace and name in entry_targets(entry):
+                self.materialize(other)
+        return value
+
+    def resolve(self, name):
+        """The global a pickle being loaded references."""
+        if name in self.replaced:
+            return self.replaced[name]
+        if name not in self.deferred:
+            return self.namespace[name]
+        if name in self.namespace:
+            self.replaced[name] = self.load(self.deferred[name])
+            return self.replaced[name]
+        return self.materialize(name)
+
+    def settle(self):
+        """Forget the deferred globals the namespace rebound, loading the ones referencing them first."""
+        rebound = [name for name in self.deferred if name in self.namespace]
+        for name in rebound:
+            for other, entry in list(self.deferred.items()):
+                if other in self.deferred and other not in self.namespace and name in entry_targets(entry):
+                    self.materialize(other)
+        for name in rebound:
+            self.deferred.pop(name, None)
+
+def snapshot(namespace, store, previous=None):
+    """
+    Store the globals of `namespace` and return its record
+    {name: (fingerprint, manifest entry)}. Globals whose fingerprint matches
+    the `previous` record of the same namespace reuse their stored pickle.
+    Must run with the namespace registered as `__main__`.
+    """
+    previous = previous or {}
+    lazy = namespace.get("__builtins__")
+    deferred = {}
+    if isinstance(lazy, LazyBuiltins):
+        lazy.settle()
+        deferred = dict(lazy.deferred)
+    values = {name: value for name, value in list(namespace.items()) if not name.startswith("__")}
+    owners = {}
+    for name, value in values.items():
+        if not isinstance(value, ATOMIC_TYPES):
+            owners.setdefault(id(value), name)
+
+    record = {}
+    # Globals that were never loaded keep their stored objects
+    for name, entry in deferred.items():
+        if lazy.store.directory != store.directory and "hash" in entry and not store.has(entry["hash"]):
+            store.put(lazy.store.get(entry["hash"]))
+        record[name] = previous.get(name, (stored_fingerprint(entry), entry))
+    for name, value in values.items():
+        owner = owners.get(id(value), name)
+        if owner != name:
+            record[name] = (None, {"alias": owner})
+            continue
+        current = fingerprint(value)
+        saved = previous.get(name)
+        if current is not None and saved is not None and saved[0] == current:
+            record[name] = saved
+            continue
+        array = plain_array(value)
+        if array is not None:
+            digest = store.put_chunks(npy_chunks(array), current[1])
+            record[name] = (current, {"hash": digest, "refs": [], "format": NPY_FORMAT})
+            continue
+        data, refs = dump_global(value, owners)
+        record[name] = (current, {"hash": store.put(data), "refs": sorted(refs)})
+
+    # References are resolved by loading the referenced global first, which
+    # cannot work around a cycle, so those globals are stored whole instead
+    cyclic = reference_cycles({name: entry for name, (_, entry) in record.items()})
+    for name in cyclic:
+        if "hash" in record[name][1]:
+            data, _ = dump_global(values[name], {})
+            record[name] = (record[name][0], {"hash": store.put(data), "refs": []})
+    return record
+
+def write_manifest(state_path, store, entries):
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(state_path)))
+    with os.fdopen(fd, "w") as f:
+        json.dump({"version": MANIFEST_VERSION, "store": store.directory, "globals": entries}, f)
+    os.replace(tmp, state_path)
+
+def read_manifest(state_path):
+    with open(state_path) as f:
+        manifest = json.load(f)
+    store_dir = manifest.get("store") or default_store_dir(state_path)
+    return ObjectStore(os.path.join(os.path.dirname(os.path.abspath(state_path)), store_dir)), manifest["globals"]
+
+def save_state(main, state_path, previous=None, store=None):
+    """Save the globals of `main` as a manifest at `state_path` and return its record."""
+    store = store or ObjectStore(default_store_dir(state_path))
+    record = snapshot(main.__dict__, store, previous)
+    write_manifest(state_path, store, {name: entry for name, (_, entry) in record.items()})
+    return record
+
+def state_size(store, record):
+    """Bytes of the stored objects a state record refers to."""
+    digests = {entry["hash"] for _, entry in record.values() if "hash" in entry}
+    return sum(store.size(digest) for digest in digests if store.has(digest))
+
+def load_entry(store, entry, resolve):
+    """Load the stored object of a manifest entry, with `resolve` returning the globals it references."""
+    if entry.get("format") == NPY_FORMAT:
+        return load_array(store.path(entry["hash"]))
+    return GlobalUnpickler(io.BytesIO(store.get(entry["hash"])), resolve).load()
+
+def load_entries(store, entries):
+    """Unpickle the globals of manifest `entries` (must run with `__main__` set to their module)."""
+    values = {}
+
+    def load(name):
+        if name not in values:
+            entry = entries[name]
+            if "alias" in entry:
+                values[name] = load(entry["alias"])
+            else:
+                values[name] = load_entry(store, entry, load)
+        return values[name]
+
+    for name in entries:
+        load(name)
+    return values
+
+def load_state(main, state_path, names=None):
+    """
+    Load the state saved at `state_path` into `main` and return its record,
+    or None for a legacy full session pickle. When `names` is given, only
+    those globals are loaded up front and the others on first access. Must
+    run with `main` registered as `__main__`.
+    """
+    if not os.path.exists(state_path):
+        dill.load_module(legacy_state_path(state_path), module=main)
+        return None
+    store, entries = read_manifest(state_path)
+    if names is None:
+        main.__dict__.update(load_entries(store, entries))
+    else:
+        lazy = LazyBuiltins(main.__dict__, store, dict(entries))
+        main.__dict__["__builtins__"] = lazy
+        for name in names:
+            if name in lazy.deferred:
+                lazy.materialize(name)
+
+    record = {}
+    for name, entry in entries.items():
+        current = stored_fingerprint(entry)
+        if current is None and "hash" in entry and name in main.__dict__:
+            current = fingerprint(main.__dict__[name])
+        record[name] = (current, entry)
+    return record
+
+def stored_fingerprint(entry):
+    # The hash of a `.npy` file is the fingerprint of its array, known
+    # without reading it
+    if entry.get("format") == NPY_FORMAT:
+        return (NPY_FORMAT, entry["hash"])
+    return None
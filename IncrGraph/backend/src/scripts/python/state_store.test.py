@@ -0,0 +1,127 @@
+import os
+import tempfile
+import unittest
+
+import dill
+import numpy as np
+
+from execution_worker import as_main, new_main
+from state_store import ObjectStore, default_store_dir, load_state, save_state
+
+class TestStateStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.store = ObjectStore(os.path.join(self.tmp.name, "objects"))
+
+    def state_path(self, name):
+        return os.path.join(self.tmp.name, f"{name}.json")
+
+    def objects(self):
+        return sum(len(files) for _, _, files in os.walk(self.store.directory))
+
+    def run_and_save(self, code, name, main=None, previous=None):
+        main = main or new_main()
+        with as_main(main):
+            exec(code, main.__dict__)
+            record = save_state(main, self.state_path(name), previous, self.store)
+        return main, record
+
+    def load(self, name, names=None):
+        main = new_main()
+        with as_main(main):
+            load_state(main, self.state_path(name), names)
+        return main
+
+    def test_round_trip_keeps_identity(self):
+        self.run_and_save(
+            "import math\nclass Point:\n    pass\np = Point()\nitems = [p]\nsame = items\n"
+            "scale = 2\ndef scaled(v):\n    return v * scale",
+            "state",
+        )
+        main = self.load("state")
+        self.assertIsInstance(main.p, main.Point)
+        self.assertIs(main.items[0], main.p)
+        self.assertIs(main.same, main.items)
+        main.scale = 5
+        self.assertEqual(main.scaled(2), 10)
+        self.assertEqual(main.math.sqrt(4), 2)
+
+    def test_only_changed_globals_are_stored(self):
+        main, record = self.run_and_save("import numpy as np\ndata = np.arange(100000.0)\nn = 1\nlabel = 'a'", "first")
+        before = self.objects()
+        _, record = self.run_and_save("n = 2", "second", main, record)
+        self.assertEqual(self.objects(), before + 1)
+        _, record = self.run_and_save("data[0] = -1.0", "third", main, record)
+        self.assertEqual(self.objects(), before + 2)
+        self.assertEqual(self.load("first").data[0], 0.0)
+        self.assertEqual(self.load("third").data[0], -1.0)
+        self.assertEqual(self.load("third").n, 2)
+
+    def test_arrays_are_memory_mapped(self):
+        self.run_and_save(
+            "import numpy as np\ndata = np.arange(12.0).reshape(3, 4).T\nscalar = np.array(5)\nempty = np.zeros((0, 2))\n"
+            "names = np.array(['a', 'bc'])\nobjects = np.array([None, 1])",
+            "first",
+        )
+        main = self.load("first")
+        self.assertIsInstance(main.data, np.memmap)
+        self.assertEqual(main.data.tolist(), np.arange(12.0).reshape(3, 4).T.tolist())
+        self.assertEqual((main.scalar.shape, main.empty.shape, main.names.tolist()), ((), (0, 2), ["a", "bc"]))
+        self.assertNotIsInstance(main.objects, np.memmap)
+
+        # In-place changes stay in memory, and views of the array save as arrays
+        with as_main(main):
+            exec("data[0, 0] = -1.0\nrow = {'first': data[0]}", main.__dict__)
+            save_state(main, self.state_path("second"), store=self.store)
+        self.assertEqual(self.load("first").data[0, 0], 0.0)
+        second = self.load("second")
+        self.assertEqual(second.row["first"].tolist(), [-1.0, 4.0, 8.0])
+
+    def test_lazy_load(self):
+        self.run_and_save(
+            "import numpy as np\ndata = np.ones(4)\nn = 2\nclass Point:\n    pass\np = Point()\nother = p\n"
+            "def total():\n    return float(data.sum()) * n",
+            "first",
+        )
+        main = self.load("first", ["n"])
+        loaded = lambda: {name for name in main.__dict__ if not name.startswith("__")}
+        self.assertEqual(loaded(), {"n"})
+        with as_main(main):
+            exec("result = total()\nPoint = None", main.__dict__)
+            self.assertEqual(main.result, 8.0)
+            self.assertEqual(loaded(), {"n", "total", "data", "result", "Point"})
+            save_state(main, self.state_path("second"), store=self.store)
+
+        # The instance keeps the class it was created with
+        second = self.load("second")
+        self.assertIsNone(second.Point)
+        self.assertEqual(type(second.p).__name__, "Point")
+        self.assertIs(second.other, second.p)
+        with self.assertRaises(NameError):
+            exec("missing", self.load("second", []).__dict__)
+
+    def test_reference_cycles_and_rebound_classes(self):
+        self.run_and_save(
+            "a = []\nb = [a]\na.append(b)\nclass C:\n    pass\nc = C()\nclass C:\n    pass",
+            "state",
+        )
+        main = self.load("state")
+        self.assertIs(main.a[0][0], main.a)
+        self.assertNotIsInstance(main.c, main.C)
+
+    def test_legacy_session_pickle(self):
+        main = new_main()
+        with as_main(main):
+            exec("x = np.ones(3)", {"np": np}, main.__dict__)
+            dill.dump_module(os.path.join(self.tmp.name, "state.pkl"), module=main)
+        self.assertEqual(list(self.load("state").x), [1.0, 1.0, 1.0])
+
+    def test_default_store_dir(self):
+        state = os.path.join("/g", ".sessions", "graph", "s1", "executions", "2", "executions", "1", "state.json")
+        self.assertEqual(default_store_dir(state), os.path.join("/g", ".sessions", "graph", "objects"))
+        self.assertEqual(default_store_dir("/tmp/x/state.json"), "/tmp/x/objects")
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,158 @@
+"""
+Analysis of large sources as a stream of per-statement events.
+
+The source is read line by line and split into top-level statements with
+the tokenizer, so only one statement (with its decorators and `else`/
+`except`/`finally` clauses) is parsed and walked at a time. After each
+statement, one JSON line lists what it added to and removed from the
+analysis result, e.g.
+
+    {"line": 3, "end_line": 4, "dependencies": {"variables": ["x"]},
+     "new_definitions": {"functions": ["f"]}}
+
+with empty kinds left out. A last line {"result": ...} holds the result of
+the whole source, identical to `analyze_code`, or {"error": ...} if the
+source could not be analyzed.
+"""
+import ast
+import json
+import tokenize
+
+from analyze_code import AnalysisState, DependencyVisitor, describe_error
+from incremental_analysis import statement_span
+
+# Keywords continuing the compound statement before them at the same indentation
+CONTINUATION_KEYWORDS = {"else", "elif", "except", "finally"}
+
+class RecordingState(AnalysisState):
+    """An `AnalysisState` keeping the changes made to its result since the last `take_changes`."""
+
+    def __init__(self):
+        super().__init__()
+        self.added = {}
+        self.removed = {}
+
+    def change(self, group, kind, name, added):
+        # A name added then removed by the same statement cancels out
+        undo, changes = (self.removed, self.added) if added else (self.added, self.removed)
+        key = (group, kind)
+        if name in undo.get(key, ()):
+            undo[key].remove(name)
+        else:
+            changes.setdefault(key, set()).add(name)
+
+    def add_dependency(self, kind, name):
+        if name not in self.dependencies[kind]:
+            self.change("dependencies", kind, name, True)
+        super().add_dependency(kind, name)
+
+    def remove_dependency(self, kind, name):
+        self.change("dependencies", kind, name, False)
+        super().remove_dependency(kind, name)
+
+    def add_definition(self, kind, name):
+        if name not in self.new_definitions[kind]:
+            self.change("new_definitions", kind, name, True)
+        super().add_definition(kind, name)
+
+    def remove_definition(self, kind, name):
+        self.change("new_definitions", kind, name, False)
+        super().remove_definition(kind, name)
+
+    def add_typed_definition(self, name, var_type):
+        previous = self.newly_defined_type_variables.get(name)
+        if previous != var_type:
+            if previous is not None:
+                self.change("new_definitions", "variables", f"{name}[{previous}]", False)
+            self.change("new_definitions", "variables", f"{name}[{var_type}]", True)
+        super().add_typed_definition(name, var_type)
+
+    def remove_typed_definition(self, name):
+        self.change("new_definitions", "variables", f"{name}[{self.newly_defined_type_variables[name]}]", False)
+        super().remove_typed_definition(name)
+
+    def take_changes(self):
+        """The changes since the last call, as {group: {kind: [names]}} with "removed_" groups for removals."""
+        changes = {}
+        for prefix, recorded in (("", self.added), ("removed_", self.removed)):
+            for (group, kind), names in recorded.items():
+                if names:
+                    changes.setdefault(prefix + group, {})[kind] = sorted(names)
+        self.added = {}
+        self.removed = {}
+        return changes
+
+def iter_statement_chunks(readline):
+    """
+    Yield (first line number, source) for each top-level statement read with
+    `readline`. Statements sharing a line (`a = 1; b = 2`) are yielded
+    together, and comments before a statement go with the previous one.
+    """
+    lines = []
+    # Line number of lines[0]
+    first_line = 1
+
+    def read():
+        line = readline()
+        lines.append(line)
+        return line
+
+    depth = 0
+    line_start = True
+    in_statement = False
+    # The last top-level line was a decorator
+    decorated = False
+    for token in tokenize.generate_tokens(read):
+        if token.type == tokenize.INDENT:
+            depth += 1
+        elif token.type == tokenize.DEDENT:
+            depth -= 1
+        elif token.type == tokenize.NEWLINE:
+            line_start = True
+        elif token.type == tokenize.ENDMARKER:
+            break
+        elif token.type not in (tokenize.NL, tokenize.COMMENT) and line_start:
+            line_start = False
+            # An indented first statement starts a chunk, which fails to
+            # parse as the whole source would
+            if depth > 0 and in_statement:
+                continue
+            if in_statement and not decorated and token.string not in CONTINUATION_KEYWORDS:
+                end = token.start[0] - first_line
+                yield first_line, "".join(lines[:end])
+                del lines[:end]
+                first_line += end
+            in_statement = True
+            decorated = token.string == "@"
+    if in_statement:
+        yield first_line, "".join(lines)
+
+def stream_analysis(readline, write, flush=None):
+    """
+    Analyze the source read with `readline`, writing a JSON line per top-level
+    statement and the result. `flush`, if given, is called after each line,
+    so a reader on a pipe gets the events as they are found.
+    """
+    def write_line(event):
+        write(json.dumps(event) + "\n")
+        if flush is not None:
+            flush()
+
+    state = RecordingState()
+    visitor = DependencyVisitor()
+    try:
+        for first_line, source in iter_statement_chunks(readline):
+            try:
+                tree = ast.parse(source)
+            except SyntaxError as e:
+                e.lineno += first_line - 1
+                raise
+            ast.increment_lineno(tree, first_line - 1)
+            for stmt in tree.body:
+                state.apply(visitor.record(stmt))
+                start, end = statement_span(stmt)
+                write_line({"line": start + 1, "end_line": end, **state.take_changes()})
+    except Exception as e:
+        write_line({"error": describe_error(e)})
+        return
+    write_line({"result": state.result()})
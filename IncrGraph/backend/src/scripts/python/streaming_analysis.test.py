@@ -0,0 +1,86 @@
+import io
+import json
+import unittest
+
+from analyze_code import analyze_code
+from streaming_analysis import iter_statement_chunks, stream_analysis
+
+SOURCE = '''import os  # the first statement
+@decorate
+@decorate_more(1)
+def f(a):
+    return a
+
+# Clauses stay with their statement
+if x:
+    y = 1
+else:
+    y = 2
+a = 1; b = A()
+c = (1,
+     2)
+b = B()
+del b
+'''
+
+def stream(code):
+    output = io.StringIO()
+    stream_analysis(io.StringIO(code).readline, output.write)
+    return [json.loads(line) for line in output.getvalue().splitlines()]
+
+def sorted_result(result):
+    return {group: {kind: sorted(names) for kind, names in kinds.items()} for group, kinds in result.items()}
+
+class TestStreamingAnalysis(unittest.TestCase):
+
+    def test_statement_chunks(self):
+        chunks = list(iter_statement_chunks(io.StringIO(SOURCE).readline))
+        self.assertEqual([line for line, _ in chunks], [1, 2, 8, 12, 13, 15, 16])
+        self.assertEqual(chunks[1][1], "@decorate\n@decorate_more(1)\ndef f(a):\n    return a\n\n# Clauses stay with their statement\n")
+        self.assertTrue(chunks[2][1].endswith("else:\n    y = 2\n"))
+
+    def test_events(self):
+        events = stream(SOURCE)
+        self.assertEqual(events[0], {"line": 1, "end_line": 1, "dependencies": {"modules": ["os"]}, "new_definitions": {"variables": ["os"]}})
+        self.assertEqual(events[1]["line"], 2)
+        self.assertEqual(events[1]["new_definitions"], {"functions": ["f"]})
+        self.assertEqual(
+            events[-2],
+            {"line": 16, "end_line": 16, "removed_new_definitions": {"variables": ["b[B]"]}},
+        )
+        self.assertEqual(events[-3]["removed_new_definitions"], {"variables": ["b[A]"]})
+        self.assertEqual(sorted_result(events[-1]["result"]), sorted_result(analyze_code(SOURCE)))
+
+    def test_attribute_paths_dropped(self):
+        events = stream("print(task.title)\ntask.done = True\nsave(task)\n")
+        self.assertEqual(events[0]["dependencies"]["attributes"], ["task.title"])
+        self.assertEqual(events[1]["new_definitions"], {"attributes": ["task.done"]})
+        # Used as a whole, the variable no longer has paths
+        self.assertEqual(
+            events[2],
+            {
+                "line": 3,
+                "end_line": 3,
+                "dependencies": {"functions": ["save"]},
+                "removed_dependencies": {"attributes": ["task.title"]},
+                "removed_new_definitions": {"attributes": ["task.done"]},
+            },
+        )
+
+    def test_errors(self):
+        events = stream("x = 1\n\ny = 1 +\n")
+        self.assertEqual(events[0]["new_definitions"], {"variables": ["x"]})
+        self.assertIn("line 3", events[-1]["error"])
+        self.assertIn("error", stream("f(\n")[-1])
+        # As analyze_code does, reject an indented source
+        self.assertEqual(stream("    x = 1\n    y = 2\n"), [{"error": "IndentationError: unexpected indent (<unknown>, line 1)"}])
+        self.assertEqual(stream("# comment\n  x = 1\n")[-1], {"error": "IndentationError: unexpected indent (<unknown>, line 2)"})
+
+    def test_lines_are_flushed(self):
+        output = []
+        stream_analysis(io.StringIO("x = 1\ny = x\n").readline, output.append, lambda: output.append(None))
+        self.assertEqual([line is None for line in output], [False, True] * 3)
+        self.assertIn("result", json.loads(output[-2]))
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,140 @@
+"""
+Propagation of variable types across the fragments of a path.
+
+`analyze_code` only knows the type of a variable assigned in the fragment
+itself (`t = Tracker()` is reported as "t[Tracker]"), and reports a method
+called on any other variable as "<t>.add". Such a call depends on the method
+of whatever class `t` holds, which no node defines by that name, so editing
+`Tracker.add` did not reach the fragments calling it.
+
+A type environment maps module-level names to the class of their value. It
+is exported by the fragments run before (see `exported_types`), or read from
+the configuration of an execution (see `configuration_types`). Resolving a
+result against it rewrites the calls on variables of a known type to
+"Tracker.add", the symbol the class and method nodes define. The dependency
+on the variable itself is kept, as the method may read any of its attributes.
+
+Results are resolved after analysis rather than by it, so the analysis of a
+code only depends on the code and stays cached as it is.
+"""
+from analyze_code import analyze_many
+from value_summary import described_type
+
+# Configuration descriptions of values whose attributes are not methods
+NON_INSTANCES = {"function", "class", "module"}
+
+def type_reference(definition):
+    """(name, type) of a variable definition: "t[Tracker]" -> ("t", "Tracker"), "u[<t>]" -> ("u", "<t>")."""
+    name, _, rest = definition.partition("[")
+    return name, rest[:-1] if rest else None
+
+def configuration_types(configuration):
+    """
+    The type environment of an execution, from its configuration. Only the
+    values `value_summary` describes by their type are typed: other
+    descriptions may be the value itself.
+    """
+    types = {}
+    for name, description in configuration.items():
+        value_type = described_type(description)
+        if value_type is not None and value_type not in NON_INSTANCES:
+            types[name] = value_type
+    return types
+
+def request_types(request):
+    """The type environment a daemon request starts from: its "types", or the types of its "configuration"."""
+    types = request.get("types")
+    if types is None:
+        types = configuration_types(request.get("configuration") or {})
+    return types
+
+def exported_types(result, types):
+    """The type environment after a fragment analyzed as `result` ran with `types`."""
+    exported = dict(types)
+    new_definitions = result["new_definitions"]
+    for kind, names in new_definitions.items():
+        if kind in ("functions", "classes"):
+            for name in names:
+                exported.pop(name, None)
+    assigned = set()
+    aliases = {}
+    for definition in new_definitions.get("variables", ()):
+        name, var_type = type_reference(definition)
+        exported.pop(name, None)
+        assigned.add(name)
+        if var_type is None:
+            continue
+        if var_type.startswith("<"):
+            aliases[name] = var_type[1:-1]
+        else:
+            exported[name] = var_type
+    # `u = t` takes the type `t` has after the fragment, or before it if the
+    # fragment did not assign it
+    for name, source in aliases.items():
+        source_type = exported.get(source) if source in assigned else types.get(source)
+        if source_type is not None:
+            exported[name] = source_type
+    return exported
+
+def resolve_method_calls(result, types):
+    """`result` with the method calls on the variables typed by `types` resolved to their class."""
+    if "error" in result or not types:
+        return result
+    defined = {type_reference(definition)[0] for definition in result["new_definitions"].get("variables", ())}
+    functions = []
+    for function in result["dependencies"]["functions"]:
+        if function.startswith("<"):
+            name, _, method = function[1:].partition(">.")
+            # A variable the fragment assigns itself has the type it was
+            # given there, which the analyzer already used if known
+            if name in types and name not in defined:
+                function = f"{types[name]}.{method}"
+        if function not in functions:
+            functions.append(function)
+    dependencies = {**result["dependencies"], "functions": functions}
+    return {**result, "dependencies": dependencies}
+
+def merge_dependencies(first, second):
+    """The result of a node run at several positions, depending on what each run resolved."""
+    dependencies = {
+        kind: list(dict.fromkeys([*names, *second["dependencies"].get(kind, ())]))
+        for kind, names in first["dependencies"].items()
+    }
+    return {**first, "dependencies": dependencies}
+
+def propagate_types(results, path, types=None, scopes=None):
+    """
+    Resolve the results {node id: analysis result} of the nodes of `path`,
+    run in that order from the type environment `types`. Returns the resolved
+    results and the type environment exported by the last node. Method nodes
+    (those with a scope) are class members and do not change the environment.
+    """
+    types = dict(types or {})
+    scopes = scopes or {}
+    resolved = {}
+    for node_id in path:
+        result = results.get(node_id)
+        if result is None or "error" in result:
+            continue
+        node_result = resolve_method_calls(result, types)
+        if node_id in resolved:
+            node_result = merge_dependencies(resolved[node_id], node_result)
+        resolved[node_id] = node_result
+        if not scopes.get(node_id):
+            types = exported_types(result, types)
+    return {**results, **resolved}, types
+
+def handle_types_request(request, cache=None):
+    """
+    Daemon operation "types".
+
+    {"codes": {...}, "path": [...], "scopes": {...}, "types": {...}, "configuration": {...}}
+    resolves the analysis of the nodes of the path against the types exported
+    by the nodes before them. The path starts from the type environment
+    "types", or from the types read from the "configuration" of an execution.
+    Returns {"results": {...}, "types": {...}} with the resolved results and
+    the types exported by the path.
+    """
+    results = analyze_many(request["codes"], cache=cache, cache_dir=request.get("cache_dir"))
+    results, types = propagate_types(results, request["path"], request_types(request), request.get("scopes"))
+    return {"results": results, "types": types}
@@ -0,0 +1,75 @@
+import io
+import json
+import unittest
+
+from analyze_code import analyze_code, serve
+from execution_worker import capture_configuration, new_main
+from type_propagation import (
+    configuration_types,
+    exported_types,
+    handle_types_request,
+    propagate_types,
+    resolve_method_calls,
+)
+
+class TestTypePropagation(unittest.TestCase):
+
+    def test_resolve_method_calls(self):
+        result = analyze_code("n = tracker.add(1)\nlabels.append(n)\ntracker.add(2)")
+        resolved = resolve_method_calls(result, {"tracker": "Tracker"})
+        self.assertCountEqual(resolved["dependencies"]["functions"], ["<labels>.append", "Tracker.add"])
+        # The method may read any attribute of the variable
+        self.assertEqual(resolved["dependencies"]["variables"], result["dependencies"]["variables"])
+        self.assertCountEqual(result["dependencies"]["functions"], ["<labels>.append", "<tracker>.add"])
+
+    def test_assigned_variables_keep_their_own_type(self):
+        result = analyze_code("tracker = make()\ntracker.add(1)")
+        self.assertEqual(resolve_method_calls(result, {"tracker": "Tracker"}), result)
+
+    def test_exported_types(self):
+        types = {"a": "A", "b": "B", "c": "C", "f": "F"}
+        result = analyze_code("a = A2()\nb = None\nd = a\ne = c\ndef f():\n    pass")
+        self.assertEqual(exported_types(result, types), {"a": "A2", "c": "C", "d": "A2", "e": "C"})
+
+    def test_configuration_types(self):
+        namespace = new_main().__dict__
+        exec(
+            "import numpy as np\nclass Tracker:\n    pass\ndef f():\n    pass\n"
+            "tracker = Tracker()\nitems = list(range(100))\narray = np.zeros(3)\nname = 'x'\npage = '<html>'",
+            namespace,
+        )
+        types = configuration_types(json.loads(json.dumps(capture_configuration(namespace), default=str)))
+        self.assertEqual(types, {"tracker": "Tracker"})
+
+    def test_propagate_types(self):
+        results = {
+            "init": analyze_code("tracker = Tracker()\nbackup = tracker"),
+            "use": analyze_code("tracker.add(1)\nbackup.add(2)"),
+            "reset": analyze_code("tracker = None"),
+            "method": analyze_code("def add(self, v):\n    tracker.clear()"),
+        }
+        path = ["init", "use", "method", "reset", "use"]
+        resolved, types = propagate_types(results, path, scopes={"method": "Tracker"})
+        # Run again after `tracker` lost its known type
+        self.assertCountEqual(resolved["use"]["dependencies"]["functions"], ["Tracker.add", "<tracker>.add"])
+        self.assertEqual(resolved["method"]["dependencies"]["functions"], ["Tracker.clear"])
+        self.assertEqual(types, {"backup": "Tracker"})
+        self.assertEqual(propagate_types(results, ["use"], {"tracker": "T"})[1], {"tracker": "T"})
+
+    def test_serve_types_operation(self):
+        request = {
+            "id": 1,
+            "op": "types",
+            "codes": {"a": "report.render()", "b": "report = Report()\nreport.render()"},
+            "path": ["a", "b"],
+            "configuration": {"report": "<Draft>"},
+        }
+        stdout = io.StringIO()
+        serve(io.StringIO(json.dumps(request) + "\n"), stdout, ops={"types": handle_types_request})
+        response = json.loads(stdout.getvalue())["result"]
+        self.assertEqual(response["results"]["a"]["dependencies"]["functions"], ["Draft.render"])
+        self.assertEqual(response["results"]["b"]["dependencies"]["functions"], ["Report.render"])
+        self.assertEqual(response["types"], {"report": "Report"})
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,117 @@
+"""
+Bounded descriptions of session values, as shown in the session configuration.
+
+Small values are described as they are. Containers longer than
+PREVIEW_ITEMS, long strings and arrays are summarized by their type,
+length, shape and dtype with a preview of their first items, so a global
+holding a million elements costs a few hundred bytes of configuration.
+Further items of a value are described a page at a time by `page_value`.
+Other values are described by their type, as "<Tracker>"; strings of that
+form are summarized, so the description is not taken for a string value.
+"""
+import re
+import types
+from itertools import islice
+
+PREVIEW_ITEMS = 20
+# Containers nested deeper than this are only summarized
+MAX_DEPTH = 3
+MAX_STRING_LENGTH = 200
+
+CONTAINER_TYPES = (dict, list, tuple, set, frozenset)
+
+TYPE_DESCRIPTION = re.compile(r"<([A-Za-z_]\w*)>")
+
+def described_type(description):
+    """The type name of a value described by its type ("<Tracker>" -> "Tracker"), or None."""
+    if not isinstance(description, str):
+        return None
+    match = TYPE_DESCRIPTION.fullmatch(description)
+    return match.group(1) if match else None
+
+def describe_key(key):
+    # JSON object keys
+    if key is None or isinstance(key, (str, int, float, bool)):
+        return key
+    return repr(key)
+
+def describe_items(value, start, stop, depth):
+    """Items start..stop of a container, described."""
+    if isinstance(value, dict):
+        return {describe_key(k): describe_value(v, depth + 1) for k, v in islice(value.items(), start, stop)}
+    if isinstance(value, (list, tuple)):
+        items = [describe_value(v, depth + 1) for v in value[start:stop]]
+        return tuple(items) if isinstance(value, tuple) else items
+    return [describe_value(v, depth + 1) for v in islice(value, start, stop)]
+
+def describe_array(value, depth):
+    """Summary of a value with a shape (numpy arrays, data frames), or None."""
+    shape = getattr(value, "shape", None)
+    if not isinstance(shape, tuple):
+        return None
+    if shape == () and hasattr(value, "item"):
+        # numpy scalars and zero-dimensional arrays
+        return describe_value(value.item(), depth)
+    summary = {"type": type(value).__name__, "shape": list(shape)}
+    dtype = getattr(value, "dtype", None)
+    if dtype is not None:
+        summary["dtype"] = str(dtype)
+    if hasattr(value, "flat"):
+        summary["preview"] = [describe_value(v, depth + 1) for v in islice(value.flat, PREVIEW_ITEMS)]
+    elif hasattr(value, "columns"):
+        summary["columns"] = [describe_key(c) for c in islice(value.columns, PREVIEW_ITEMS)]
+    return summary
+
+def describe_value(value, depth=0):
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    if isinstance(value, str):
+        if len(value) <= MAX_STRING_LENGTH and not TYPE_DESCRIPTION.fullmatch(value):
+            return value
+        return {"type": "str", "length": len(value), "preview": value[:MAX_STRING_LENGTH]}
+    if isinstance(value, types.FunctionType):
+        return "<function>"
+    if isinstance(value, type):
+        return "<class>"
+    if isinstance(value, CONTAINER_TYPES):
+        if len(value) <= PREVIEW_ITEMS and depth < MAX_DEPTH:
+            return describe_items(value, 0, len(value), depth)
+        summary = {"type": type(value).__name__, "length": len(value)}
+        if depth < MAX_DEPTH:
+            summary["preview"] = describe_items(value, 0, PREVIEW_ITEMS, depth)
+        return summary
+    try:
+        summary = describe_array(value, depth)
+    except Exception:
+        summary = None
+    return summary if summary is not None else f"<{type(value).__name__}>"
+
+def resolve_path(value, path):
+    """The item of `value` at `path`, a list of keys or indices as shown in its description."""
+    for key in path:
+        if isinstance(value, dict):
+            if key in value:
+                value = value[key]
+            else:
+                value = next(v for k, v in value.items() if describe_key(k) == key)
+        elif isinstance(value, (set, frozenset)):
+            value = next(islice(value, int(key), None))
+        else:
+            value = value[int(key)]
+    return value
+
+def page_value(value, offset=0, limit=PREVIEW_ITEMS):
+    """Items offset..offset+limit of a container, string or array, described."""
+    page = {"type": type(value).__name__, "offset": offset}
+    if isinstance(value, str):
+        page["length"] = len(value)
+        page["items"] = value[offset:offset + limit]
+    elif isinstance(value, CONTAINER_TYPES):
+        page["length"] = len(value)
+        page["items"] = describe_items(value, offset, offset + limit, 0)
+    elif hasattr(value, "flat") and hasattr(value, "size"):
+        page["length"] = value.size
+        page["items"] = [describe_value(v, 1) for v in value.flat[offset:offset + limit]]
+    else:
+        page["value"] = describe_value(value)
+    return page
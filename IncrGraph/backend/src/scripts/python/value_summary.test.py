@@ -0,0 +1,45 @@
+import json
+import unittest
+
+import numpy as np
+
+from value_summary import PREVIEW_ITEMS, describe_value, described_type, page_value, resolve_path
+
+class TestDescribeValue(unittest.TestCase):
+
+    def test_small_values_are_kept(self):
+        value = {"a": [1, 2.5, None], "b": (True, "x"), 3: {"nested": [1]}}
+        self.assertEqual(describe_value(value), value)
+        self.assertEqual(describe_value({1, 2}), [1, 2])
+        self.assertEqual(describe_value({(1, 2): 3}), {"(1, 2)": 3})
+
+    def test_large_containers_are_summarized(self):
+        summary = describe_value(list(range(1_000_000)))
+        self.assertEqual(summary, {"type": "list", "length": 1_000_000, "preview": list(range(PREVIEW_ITEMS))})
+        self.assertLess(len(json.dumps(summary)), 200)
+        self.assertEqual(describe_value("x" * 1000)["length"], 1000)
+        self.assertEqual(describe_value([[[[1]]]]), [[[{"type": "list", "length": 1}]]])
+
+    def test_arrays(self):
+        summary = describe_value(np.zeros((1000, 3), dtype=np.float32))
+        self.assertEqual((summary["type"], summary["shape"], summary["dtype"]), ("ndarray", [1000, 3], "float32"))
+        self.assertEqual(summary["preview"], [0.0] * PREVIEW_ITEMS)
+        self.assertEqual(describe_value(np.int64(4)), 4)
+        self.assertEqual(describe_value(object()), "<object>")
+
+    def test_type_descriptions(self):
+        self.assertEqual(described_type(describe_value(object())), "object")
+        # A string is not described as a type
+        self.assertEqual(describe_value("<html>"), {"type": "str", "length": 6, "preview": "<html>"})
+        self.assertIsNone(described_type(describe_value("<html>")))
+        self.assertEqual(describe_value("<b>bold</b>"), "<b>bold</b>")
+
+    def test_pages(self):
+        value = {"rows": list(range(100)), "grid": np.arange(50).reshape(5, 10)}
+        page = page_value(resolve_path(value, ["rows"]), 90, 20)
+        self.assertEqual(page, {"type": "list", "offset": 90, "length": 100, "items": list(range(90, 100))})
+        self.assertEqual(page_value(resolve_path(value, ["grid", 2]), 8, 5)["items"], [28, 29])
+        self.assertEqual(page_value(7), {"type": "int", "offset": 0, "value": 7})
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,294 @@
+import path from "path";
+import readline from "readline";
+import { spawn, ChildProcessWithoutNullStreams } from "child_process";
+import {
+	AnalysisCacheStats,
+	CodeAnalysisResponse,
+	CodeManyAnalysisResponse,
+	createCustomLogger,
+	FragmentTrace,
+	ReexecutionPlan,
+	SymbolIndexResponse,
+} from "shared";
+
+// Logger
+const logger = createCustomLogger("backend");
+
+const analysisScriptPath = path.join(
+	__dirname,
+	"../scripts/python",
+	"analyze_code.py",
+);
+
+/**
+ * Levels of fragments that can run concurrently, and the namespace names
+ * each fragment defines, consumes and may change in place among those it
+ * consumes (null when it could not be analyzed)
+ */
+export interface ExecutionSchedule {
+	levels: number[][];
+	names: ({ defined: string[]; consumed: string[]; mutated?: string[] } | null)[];
+}
+
+/** Class of the value of module-level names, e.g. { tracker: "Tracker" } */
+export type TypeEnvironment = { [name: string]: string };
+
+/**
+ * Analysis of the nodes of a path with the method calls on variables typed
+ * by earlier nodes resolved to their class, and the types the path exports
+ */
+export interface TypePropagation {
+	results: CodeManyAnalysisResponse;
+	types: TypeEnvironment;
+}
+
+/** Fragment code as executed, a nested graph's elements, or null if unknown */
+export type ScheduleElement = string | null | ScheduleElement[];
+
+interface PendingRequest {
+	resolve: (result: any) => void;
+	reject: (error: Error) => void;
+}
+
+/**
+ * Long-lived `analyze_code.py --serve` process.
+ *
+ * Requests and responses are newline-delimited JSON matched by id, so one warm
+ * interpreter serves every analysis instead of spawning Python per call. The
+ * process is started lazily and restarted on the next request if it exits.
+ */
+export class AnalyzerDaemon {
+	private process: ChildProcessWithoutNullStreams | null = null;
+	// Requests sent to the current process. Each process has its own map, so
+	// a stopped process answers or rejects only the requests sent to it.
+	private pending = new Map<number, PendingRequest>();
+	private nextId = 0;
+
+	constructor(private readonly pythonPath: string) {}
+
+	private start(): ChildProcessWithoutNullStreams {
+		const pythonProcess = spawn(this.pythonPath, [
+			analysisScriptPath,
+			"--serve",
+		]);
+		const pending = new Map<number, PendingRequest>();
+		this.pending = pending;
+
+		readline
+			.createInterface({ input: pythonProcess.stdout })
+			.on("line", (line) => this.handleResponse(line, pending));
+
+		pythonProcess.stdin.on("error", (err) => {
+			logger.error("Failed to write to analyzer daemon", { error: err });
+		});
+
+		pythonProcess.stderr.on("data", (data: Buffer) => {
+			logger.error("Analyzer daemon error output", {
+				error: data.toString(),
+			});
+		});
+
+		const handleExit = (error: Error) => {
+			if (this.process === pythonProcess) {
+				this.process = null;
+			}
+			for (const { reject } of pending.values()) {
+				reject(error);
+			}
+			pending.clear();
+		};
+		pythonProcess.on("close", (code) =>
+			handleExit(new Error(`Analyzer daemon exited with code ${code}`)),
+		);
+		pythonProcess.on("error", (err) => {
+			logger.error("Analyzer daemon failed to start", { error: err });
+			handleExit(err);
+		});
+
+		return pythonProcess;
+	}
+
+	private handleResponse(line: string, pending: Map<number, PendingRequest>) {
+		let response: any;
+		try {
+			response = JSON.parse(line);
+		} catch (e) {
+			logger.error("Invalid response from analyzer daemon", { line });
+			return;
+		}
+
+		const request = pending.get(response.id);
+		if (!request) {
+			logger.error("Analyzer daemon response has no pending request", {
+				response,
+			});
+			return;
+		}
+		pending.delete(response.id);
+
+		if (response.error !== undefined) {
+			request.reject(new Error(response.error));
+		} else {
+			request.resolve(response.result);
+		}
+	}
+
+	/**
+	 * Send a request to the daemon and wait for its result.
+	 *
+	 * @param {object} payload - The request fields (without the id)
+	 * @returns {Promise<any>} - The result field of the response
+	 */
+	public request(payload: object): Promise<any> {
+		if (!this.process) {
+			this.process = this.start();
+		}
+		const pythonProcess = this.process;
+		const pending = this.pending;
+		const id = ++this.nextId;
+
+		return new Promise((resolve, reject) => {
+			pending.set(id, { resolve, reject });
+			pythonProcess.stdin.write(JSON.stringify({ ...payload, id }) + "\n");
+		});
+	}
+
+	public analyze(
+		code: string,
+		options: { cacheDir?: string; key?: string; scope?: string } = {},
+	): Promise<CodeAnalysisResponse> {
+		return this.request({
+			code,
+			cache_dir: options.cacheDir,
+			key: options.key,
+			scope: options.scope,
+		});
+	}
+
+	/**
+	 * Analyze a batch of fragments. When `file` is given the batch is taken
+	 * to be the whole graph and replaces that file's symbol index.
+	 */
+	public analyzeMany(
+		codes: { [nodeId: string]: string },
+		options: {
+			cacheDir?: string;
+			file?: string;
+			scopes?: { [nodeId: string]: string };
+		} = {},
+	): Promise<CodeManyAnalysisResponse> {
+		return this.request({
+			codes,
+			cache_dir: options.cacheDir,
+			file: options.file,
+			scopes: options.scopes,
+		});
+	}
+
+	/**
+	 * Plan which positions of a session path to run again after an edit.
+	 * `previousCodes` holds the code each position ran with (null if
+	 * unknown), `executed` the code it would run now and `previousTraces`
+	 * the globals each position was traced using (null if not traced).
+	 * `types` gives the type environment the path starts from.
+	 */
+	public planRerun(options: {
+		codes: { [nodeId: string]: string };
+		scopes?: { [nodeId: string]: string };
+		path: string[];
+		previousCodes: (string | null)[];
+		executed: (string | null)[];
+		previousTraces?: (FragmentTrace | null)[];
+		stateSymbols?: string[];
+		types?: TypeEnvironment;
+		cacheDir?: string;
+	}): Promise<ReexecutionPlan> {
+		return this.request({
+			op: "plan",
+			codes: options.codes,
+			scopes: options.scopes,
+			path: options.path,
+			previous_codes: options.previousCodes,
+			executed: options.executed,
+			previous_traces: options.previousTraces,
+			state_symbols: options.stateSymbols,
+			types: options.types,
+			cache_dir: options.cacheDir,
+		});
+	}
+
+	/**
+	 * Group the elements into levels that can run concurrently. Method calls
+	 * are resolved from `types`, or from the `configuration` of the
+	 * execution the elements run after.
+	 */
+	public schedule(
+		elements: ScheduleElement[],
+		options: {
+			types?: TypeEnvironment;
+			configuration?: { [name: string]: any };
+		} = {},
+	): Promise<ExecutionSchedule> {
+		return this.request({
+			op: "schedule",
+			elements,
+			types: options.types,
+			configuration: options.configuration,
+		});
+	}
+
+	/**
+	 * Resolve the method calls of the nodes of a path across nodes, starting
+	 * from `types` or from the `configuration` of an execution.
+	 */
+	public propagateTypes(options: {
+		codes: { [nodeId: string]: string };
+		scopes?: { [nodeId: string]: string };
+		path: string[];
+		types?: TypeEnvironment;
+		configuration?: { [name: string]: any };
+		cacheDir?: string;
+	}): Promise<TypePropagation> {
+		return this.request({
+			op: "types",
+			codes: options.codes,
+			scopes: options.scopes,
+			path: options.path,
+			types: options.types,
+			configuration: options.configuration,
+			cache_dir: options.cacheDir,
+		});
+	}
+
+	public symbolIndex(file: string): Promise<SymbolIndexResponse> {
+		return this.request({ op: "symbol_index", file });
+	}
+
+	public cacheStats(): Promise<AnalysisCacheStats> {
+		return this.request({ op: "cache_stats" });
+	}
+
+	public stop() {
+		if (this.process) {
+			this.process.stdin.end();
+			this.process = null;
+		}
+	}
+}
+
+const daemons = new Map<string, AnalyzerDaemon>();
+
+/**
+ * Get the shared analyzer daemon for a Python interpreter
+ *
+ * @param {string} pythonPath - The Python binary to run the analyzer with
+ * @returns {AnalyzerDaemon} - The daemon (started on its first request)
+ */
+export const getAnalyzerDaemon = (pythonPath: string): AnalyzerDaemon => {
+	let daemon = daemons.get(pythonPath);
+	if (!daemon) {
+		daemon = new AnalyzerDaemon(pythonPath);
+		daemons.set(pythonPath, daemon);
+	}
+	return daemon;
+};
@@ -0,0 +1,301 @@
+import os from "os";
+import path from "path";
+import readline from "readline";
+import { spawn, ChildProcessWithoutNullStreams } from "child_process";
+import {
+	CodeExecutionMetrics,
+	ConfigurationPage,
+	createCustomLogger,
+} from "shared";
+
+// Logger
+const logger = createCustomLogger("backend");
+
+const workerScriptPath = path.join(
+	__dirname,
+	"../scripts/python",
+	"execution_worker.py",
+);
+
+// Milliseconds a request may run before its worker is killed
+const DEFAULT_TIMEOUT = parseInt(process.env.EXECUTION_TIMEOUT_MS || "600000");
+
+export interface ExecutionRequest {
+	code: string;
+	stateIn: string;
+	stateOut: string;
+	configOut: string;
+	// Globals the fragment reads, loaded up front when the state is not live
+	// (the others are loaded on first access)
+	dependencies?: string[] | null;
+	// Directory to write the fragment's profile to, if it is to be profiled
+	profileDir?: string | null;
+	// Replay a recorded run of the fragment when its inputs are unchanged
+	memoize?: boolean;
+	// Write the globals the fragment reads and writes next to its configuration
+	trace?: boolean;
+	// Milliseconds after which the worker running the fragment is killed
+	// (defaults to EXECUTION_TIMEOUT_MS, 10 minutes; 0 waits forever)
+	timeout?: number;
+}
+
+export interface ExecutionResult {
+	output: string;
+	error: string;
+	failed: boolean;
+	// State files whose namespace the worker keeps alive
+	live: string[];
+	metrics: Omit<CodeExecutionMetrics, "executionTime" | "sessionId">;
+}
+
+export interface ConfigurationPageRequest {
+	state: string;
+	name: string;
+	// Keys or indices of the item to expand inside the global
+	path?: (string | number)[];
+	offset?: number;
+	limit?: number;
+}
+
+interface QueuedExecution {
+	// Request fields sent to the worker (without the id)
+	payload: object;
+	// The state the request works on
+	stateIn: string;
+	// Milliseconds before the worker is killed (0 waits forever)
+	timeout: number;
+	resolve: (result: any) => void;
+	reject: (error: Error) => void;
+}
+
+/**
+ * Long-lived `execution_worker.py` process running one request at a time.
+ */
+class PythonWorker {
+	private process: ChildProcessWithoutNullStreams | null = null;
+	private pending: QueuedExecution | null = null;
+	private nextId = 0;
+	private timer: NodeJS.Timeout | null = null;
+	// Why the process was killed, given to the request it was running
+	private killReason: Error | null = null;
+	public live: string[] = [];
+
+	constructor(private readonly pythonPath: string) {}
+
+	public get busy(): boolean {
+		return this.pending !== null;
+	}
+
+	private start(): ChildProcessWithoutNullStreams {
+		const pythonProcess = spawn(this.pythonPath, [workerScriptPath]);
+
+		readline
+			.createInterface({ input: pythonProcess.stdout })
+			.on("line", (line) => this.handleResponse(line));
+
+		pythonProcess.stdin.on("error", (err) => {
+			logger.error("Failed to write to execution worker", { error: err });
+		});
+
+		// Output written outside of the fragments' sys.stdout/sys.stderr
+		pythonProcess.stderr.on("data", (data: Buffer) => {
+			logger.info("Execution worker output", { output: data.toString() });
+		});
+
+		const handleExit = (error: Error) => {
+			if (this.process === pythonProcess) {
+				// The next request starts a fresh process
+				this.process = null;
+				this.live = [];
+			}
+			const reason = this.killReason ?? error;
+			this.killReason = null;
+			const pending = this.settle();
+			if (pending) {
+				pending.reject(reason);
+			}
+		};
+		pythonProcess.on("close", (code) =>
+			handleExit(new Error(`Execution worker exited with code ${code}`)),
+		);
+		pythonProcess.on("error", (err) => {
+			logger.error("Execution worker failed to start", { error: err });
+			handleExit(err);
+		});
+
+		return pythonProcess;
+	}
+
+	private handleResponse(line: string) {
+		let response: any;
+		try {
+			response = JSON.parse(line);
+		} catch (e) {
+			logger.error("Invalid response from execution worker", { line });
+			return;
+		}
+		if (!this.pending || response.id !== this.nextId) {
+			logger.error("Execution worker response has no pending request", {
+				response,
+			});
+			return;
+		}
+		const { resolve, reject } = this.settle()!;
+
+		if (response.error !== undefined) {
+			reject(new Error(response.error));
+		} else {
+			if (response.result.live !== undefined) {
+				this.live = response.result.live;
+			}
+			resolve(response.result);
+		}
+	}
+
+	/**
+	 * Take the pending request, stopping its timeout
+	 */
+	private settle(): QueuedExecution | null {
+		const pending = this.pending;
+		this.pending = null;
+		if (this.timer) {
+			clearTimeout(this.timer);
+			this.timer = null;
+		}
+		return pending;
+	}
+
+	public execute(execution: QueuedExecution) {
+		if (!this.process) {
+			this.process = this.start();
+		}
+		const pythonProcess = this.process;
+		this.pending = execution;
+		if (execution.timeout > 0) {
+			// A fragment that never finishes would keep the worker busy forever
+			this.timer = setTimeout(() => {
+				this.timer = null;
+				logger.error("Execution timed out, killing the worker", {
+					timeout: execution.timeout,
+				});
+				this.killReason = new Error(
+					`Execution timed out after ${execution.timeout} ms`,
+				);
+				pythonProcess.kill("SIGKILL");
+			}, execution.timeout);
+		}
+		pythonProcess.stdin.write(
+			JSON.stringify({ ...execution.payload, id: ++this.nextId }) + "\n",
+		);
+	}
+
+	public stop() {
+		if (this.process) {
+			this.process.stdin.end();
+			this.process = null;
+		}
+	}
+}
+
+/**
+ * Pool of warm Python workers executing code fragments.
+ *
+ * Workers keep the namespaces of the states they last saved alive, so a
+ * fragment is sent to the worker that already holds the state it continues
+ * from when one is idle; otherwise the state is loaded from disk by another
+ * worker. Workers are started lazily, up to `size`.
+ */
+export class PythonWorkerPool {
+	private workers: PythonWorker[] = [];
+	private queue: QueuedExecution[] = [];
+
+	constructor(
+		private readonly pythonPath: string,
+		private readonly size: number = Math.max(1, os.cpus().length),
+	) {}
+
+	public execute(request: ExecutionRequest): Promise<ExecutionResult> {
+		return this.enqueue(
+			{
+				code: request.code,
+				state_in: request.stateIn,
+				state_out: request.stateOut,
+				config_out: request.configOut,
+				dependencies: request.dependencies ?? null,
+				profile_dir: request.profileDir ?? null,
+				memoize: request.memoize ?? false,
+				trace: request.trace ?? false,
+			},
+			request.stateIn,
+			request.timeout ?? DEFAULT_TIMEOUT,
+		);
+	}
+
+	/**
+	 * Describe a page of the items of a global in a saved state (the
+	 * configuration only holds a preview of large values)
+	 */
+	public expand(request: ConfigurationPageRequest): Promise<ConfigurationPage> {
+		return this.enqueue({ op: "expand", ...request }, request.state, DEFAULT_TIMEOUT);
+	}
+
+	private enqueue(payload: object, stateIn: string, timeout: number): Promise<any> {
+		return new Promise((resolve, reject) => {
+			this.queue.push({ payload, stateIn, timeout, resolve, reject });
+			this.dispatch();
+		});
+	}
+
+	private dispatch() {
+		while (this.queue.length > 0) {
+			const execution = this.queue[0];
+			const idle = this.workers.filter((worker) => !worker.busy);
+			let worker =
+				idle.find((w) => w.live.includes(execution.stateIn)) ??
+				idle[0];
+			if (!worker) {
+				if (this.workers.length >= this.size) {
+					return;
+				}
+				worker = new PythonWorker(this.pythonPath);
+				this.workers.push(worker);
+			}
+			this.queue.shift();
+			worker.execute({
+				...execution,
+				resolve: (result) => {
+					execution.resolve(result);
+					this.dispatch();
+				},
+				reject: (error) => {
+					execution.reject(error);
+					this.dispatch();
+				},
+			});
+		}
+	}
+
+	public stop() {
+		for (const worker of this.workers) {
+			worker.stop();
+		}
+		this.workers = [];
+	}
+}
+
+const pools = new Map<string, PythonWorkerPool>();
+
+/**
+ * Get the shared worker pool for a Python interpreter
+ *
+ * @param {string} pythonPath - The Python binary to run the workers with
+ * @returns {PythonWorkerPool} - The pool (workers are started on demand)
+ */
+export const getPythonWorkerPool = (pythonPath: string): PythonWorkerPool => {
+	let pool = pools.get(pythonPath);
+	if (!pool) {
+		pool = new PythonWorkerPool(pythonPath);
+		pools.set(pythonPath, pool);
+	}
+	return pool;
+};
@@ -5,6 +5,8 @@ import {
 	CodeAnalysisResponse,
 	CodeExecutionRequest,
 	CodeExecutionResponse,
+	CodeManyAnalysisRequest,
+	CodeManyAnalysisResponse,
 	FileNode,
 	GetFileTreeRequest,
 	CopyRequest,
@@ -21,7 +23,16 @@ import {
 	SessionDataGetRequest,
 	SessionDataDeleteExecutionRequest,
 	SessionDataDeleteNodeRequest,
+	SymbolIndexResponse,
+	PythonImportRequest,
+	PythonImportResponse,
+	SessionCompactionRequest,
+	SessionCompactionResponse,
 	CodeManyExecutionRequest,
+	CodeRerunRequest,
+	ReexecutionPlan,
+	ConfigurationPage,
+	ConfigurationPageRequest,
 	FileIdCodeList,
     PrimarySessionRequest,
 } from "shared";
@@ -74,7 +85,7 @@ export const saveFileContent = (filePath: string, content: string) => {
 	return sendAxiosRequest<SetFileContentRequest, Empty>(options);
 };
 
-export const callAnalyze = (code: string) => {
+export const callAnalyze = (code: string, key?: string, scope?: string) => {
 	console.log("runAnalysis");
 	const options: UseAxiosRequestOptions<CodeAnalysisRequest> = {
 		method: "POST",
@@ -82,6 +93,8 @@ export const callAnalyze = (code: string) => {
 		data: {
 			code: code,
 			language: "python",
+			key: key,
+			scope: scope,
 		},
 		useJWT: false,
 	};
@@ -89,12 +102,87 @@ export const callAnalyze = (code: string) => {
 	return sendAxiosRequest<CodeAnalysisRequest, CodeAnalysisResponse>(options);
 };
 
+export const callAnalyzeMany = (
+	codes: { [nodeId: string]: string },
+	filePath?: string,
+	scopes?: { [nodeId: string]: string },
+) => {
+	const options: UseAxiosRequestOptions<CodeManyAnalysisRequest> = {
+		method: "POST",
+		route: "/api/code-handler/analyze-many",
+		data: {
+			codes: codes,
+			language: "python",
+			filePath: filePath,
+			scopes: scopes,
+		},
+		useJWT: false,
+	};
+
+	return sendAxiosRequest<CodeManyAnalysisRequest, CodeManyAnalysisResponse>(
+		options,
+	);
+};
+
+export const callImportPython = (sources: string[], outputDir: string) => {
+	const options: UseAxiosRequestOptions<PythonImportRequest> = {
+		method: "POST",
+		route: "/api/code-handler/import-python",
+		data: {
+			sources: sources,
+			outputDir: outputDir,
+		},
+		useJWT: false,
+	};
+
+	return sendAxiosRequest<PythonImportRequest, PythonImportResponse>(options);
+};
+
+export const callCompactSessions = (
+	filePath: string,
+	compress: boolean = false,
+	dryRun: boolean = false,
+) => {
+	const options: UseAxiosRequestOptions<SessionCompactionRequest> = {
+		method: "POST",
+		route: "/api/code-handler/compact-sessions",
+		data: {
+			filePath: filePath,
+			compress: compress,
+			dryRun: dryRun,
+		},
+		useJWT: false,
+	};
+
+	return sendAxiosRequest<SessionCompactionRequest, SessionCompactionResponse>(
+		options,
+	);
+};
+
+export const getSymbolIndex = (filePath: string) => {
+	const options: UseAxiosRequestOptions<SessionDataGetRequest> = {
+		method: "GET",
+		route: "/api/code-handler/symbol-index",
+		data: {
+			filePath: filePath,
+		},
+		useJWT: false,
+	};
+
+	return sendAxiosRequest<SessionDataGetRequest, SymbolIndexResponse>(
+		options,
+	);
+};
+
 export const callExecute = (
 	code: string,
 	language: string,
 	filePath: string,
 	nodeId: string,
 	sessionId: string | null,
+	profile: boolean = false,
+	memoize: boolean = false,
+	trace: boolean = false,
 ) => {
 	const options: UseAxiosRequestOptions<CodeExecutionRequest> = {
 		method: "POST",
@@ -104,6 +192,9 @@ export const callExecute = (
 			filePath: filePath,
 			nodeId: nodeId,
 			sessionId: sessionId ? sessionId : undefined,
+			profile: profile,
+			memoize: memoize,
+			trace: trace,
 		},
 		route: "/api/code-handler/execute",
 		useJWT: false,
@@ -119,6 +210,9 @@ export const callExecuteMany = (
 	language: string,
 	filePath: string,
 	sessionId?: string,
+	profile: boolean = false,
+	memoize: boolean = false,
+	trace: boolean = false,
 ) => {
 	const options: UseAxiosRequestOptions<CodeManyExecutionRequest> = {
 		method: "POST",
@@ -127,6 +221,9 @@ export const callExecuteMany = (
 			language: language,
 			filePath: filePath,
 			sessionId: sessionId,
+			profile: profile,
+			memoize: memoize,
+			trace: trace,
 		},
 		route: "/api/code-handler/execute-many",
 		useJWT: false,
@@ -135,6 +232,45 @@ export const callExecuteMany = (
 	return sendAxiosRequest<CodeManyExecutionRequest, Empty>(options);
 };
 
+export const callRerun = (
+	fileIdCodeList: FileIdCodeList,
+	codes: { [nodeId: string]: string },
+	scopes: { [nodeId: string]: string },
+	filePath: string,
+	sessionId: string,
+	memoize: boolean = false,
+	trace: boolean = false,
+) => {
+	const options: UseAxiosRequestOptions<CodeRerunRequest> = {
+		method: "POST",
+		data: {
+			fileIdCodeList: fileIdCodeList,
+			codes: codes,
+			scopes: scopes,
+			language: "python",
+			filePath: filePath,
+			sessionId: sessionId,
+			memoize: memoize,
+			trace: trace,
+		},
+		route: "/api/code-handler/rerun",
+		useJWT: false,
+	};
+
+	return sendAxiosRequest<CodeRerunRequest, ReexecutionPlan>(options);
+};
+
+export const getConfigurationPage = (request: ConfigurationPageRequest) => {
+	const options: UseAxiosRequestOptions<ConfigurationPageRequest> = {
+		method: "POST",
+		data: request,
+		route: "/api/code-handler/configuration-page",
+		useJWT: false,
+	};
+
+	return sendAxiosRequest<ConfigurationPageRequest, ConfigurationPage>(options);
+};
+
 export const getFileTree = (projectDirectory: string) => {
 	const options: UseAxiosRequestOptions<GetFileTreeRequest> = {
 		method: "GET",
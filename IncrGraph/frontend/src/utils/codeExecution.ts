@@ -1,7 +1,12 @@
 import { CodeAnalysisResponse, CodeExecutionResponse } from "shared";
 import { Node } from "reactflow";
 import { addEdge, getEdgeId } from "@/IGCItems/utils/utils";
-import { callAnalyze, callExecute, callExecuteMany } from "@/requests";
+import {
+	callAnalyze,
+	callAnalyzeMany,
+	callExecute,
+	callExecuteMany,
+} from "@/requests";
 import useStore from "@/store/store";
 import { createDependencyGraph } from "@/IGCItems/utils/edgeCreation";
 import {
@@ -23,7 +28,11 @@ export const runAnalysis = (node: Node) => {
 		return;
 	}
 	if (isCodeNode(node)) {
-		callAnalyze(node.data.codeData.code).then(
+		callAnalyze(
+			node.data.codeData.code,
+			`${selectedFile}#${node.id}`,
+			node.data.codeData.scope,
+		).then(
 			(response: CodeAnalysisResponse) => {
 				useStore.getState().setNodes(selectedFile, (prevNodes) => {
 					return prevNodes.map((n) => {
@@ -62,17 +71,16 @@ export const runAllAnalysis = async () => {
 		return;
 	}
 
-	// Get all analysis data for all nodes
-	const nodeAnalysisData: { [nodeId: string]: CodeAnalysisResponse } = {};
+	// Get all analysis data for all nodes in a single batch
+	const codes: { [nodeId: string]: string } = {};
+	const scopes: { [nodeId: string]: string } = {};
 	for (let node of useStore.getState().getNodes(selectedFile) as Node<
 		IGCCodeNodeData<IGCNodeData>
 	>[]) {
 		if (isCodeNode(node)) {
-			try {
-				const result = await callAnalyze(node.data.codeData.code);
-				nodeAnalysisData[node.id] = result;
-			} catch (error) {
-				console.error(`Error analyzing node ${node.id}:`, error);
+			codes[node.id] = node.data.codeData.code;
+			if (node.data.codeData.scope !== undefined) {
+				scopes[node.id] = node.data.codeData.scope;
 			}
 		} else {
 			const n = node as Node;
@@ -82,6 +90,21 @@ export const runAllAnalysis = async () => {
 		}
 	}
 
+	const nodeAnalysisData: { [nodeId: string]: CodeAnalysisResponse } = {};
+	try {
+		const results = await callAnalyzeMany(codes, selectedFile, scopes);
+		for (const nodeId in results) {
+			const result = results[nodeId];
+			if ("error" in result) {
+				console.error(`Error analyzing node ${nodeId}:`, result.error);
+			} else {
+				nodeAnalysisData[nodeId] = result;
+			}
+		}
+	} catch (error) {
+		console.error("Error analyzing nodes:", error);
+	}
+
 	useStore.getState().setNodes(selectedFile, (prevNodes) => {
 		return prevNodes.map((node) => {
 			if (node.id in nodeAnalysisData && isCodeNode(node)) {
@@ -156,6 +179,10 @@ const setScope = (
 		// Go through every new definition and set the scope
 		Object.keys(metaNodeData.new_definitions).forEach((key) => {
 			const typedKey = key as keyof typeof metaNodeData.new_definitions;
+			// Attribute paths start with a module-level name
+			if (typedKey === "attributes") {
+				return;
+			}
 			metaNodeData.new_definitions[typedKey] =
 				metaNodeData.new_definitions[typedKey].map(
 					(definition: string) => {
@@ -5,11 +5,12 @@ import {
 	deleteExecutionInSession,
 	getFileContent,
 	callExecuteMany,
+	callRerun,
 	createSession,
     deleteSession,
 } from "@/requests";
 import useStore from "@/store/store";
-import { FileIdCodeList, IGCFileSessionData } from "shared";
+import { FileIdCodeList, IGCFileSessionData, ReexecutionPlan } from "shared";
 import { Node } from "reactflow";
 import { updateExecutionPath } from "@/IGCItems/utils/utils";
 import { isCodeNode } from "@/IGCItems/nodes/CodeNode";
@@ -185,23 +186,43 @@ export const refreshSession = async (filePath: string) => {
     if (currentSessionId === null) {
         return;
     }
-    // Remove the session, then re-add it to refresh the data
-    // Get the execution path before deleting the session
+    // Get the execution path before touching the session
     const executionPath = await getExecutionPathFromSession(
         filePath,
         currentSessionId,
     );
-    // Remove the session
-    await deleteSession(filePath, currentSessionId);
-
-    // Create a new session
-    await createNewSession(filePath, currentSessionId);
 
     // Create the execution data
     const newExecutionData = await createExecutionData(filePath, executionPath);
 
-    // Execute the new execution data
-    await callExecuteMany(newExecutionData, "python", filePath, currentSessionId);
+    // Only re-run the fragments affected by the edits since the last run
+    const codes: { [nodeId: string]: string } = {};
+    const scopes: { [nodeId: string]: string } = {};
+    for (const node of useStore.getState().getNodes(filePath)) {
+        if (isCodeNode(node)) {
+            codes[node.id] = node.data.codeData.code;
+            if (node.data.codeData.scope !== undefined) {
+                scopes[node.id] = node.data.codeData.scope;
+            }
+        }
+    }
+    let plan: ReexecutionPlan | null = null;
+    try {
+        plan = await callRerun(newExecutionData, codes, scopes, filePath, currentSessionId);
+    } catch (error) {
+        console.error("Error planning the re-run:", error);
+    }
+
+    if (plan === null || plan.mode === "full") {
+        // Remove the session, then re-add it to refresh the data
+        await deleteSession(filePath, currentSessionId);
+
+        // Create a new session
+        await createNewSession(filePath, currentSessionId);
+
+        // Execute the new execution data
+        await callExecuteMany(newExecutionData, "python", filePath, currentSessionId);
+    }
 
     // Update session data
     await loadSessionData(filePath).then((sessionData) => {
@@ -60,10 +60,41 @@ export interface CodeExecutionRequest {
 	filePath: string;
 	nodeId: string;
 	sessionId?: string;
+	// Profile the fragment, writing profile.pstats and profile.collapsed
+	// (collapsed stacks for flame graphs) to its execution directory
+	profile?: boolean;
+	// Replay a recorded run of the same code on the same inputs instead of
+	// executing it (see execution_memo.py); only for fragments whose result
+	// depends on nothing but the globals they read
+	memoize?: boolean;
+	// Trace the globals the fragment reads and writes, writing trace.json to
+	// its execution directory (see global_trace.py); re-runs and merges of
+	// concurrent executions add them to the analyzer's dependencies
+	trace?: boolean;
+}
+// Globals an execution was traced using (trace.json)
+export interface FragmentTrace {
+	read: string[];
+	written: string[];
+	deleted: string[];
 }
 export interface CodeExecutionMetrics {
 	executionTime: number;
 	sessionId: string;
+	// Milliseconds spent in each phase of the run: waiting for a worker,
+	// loading the previous state, running the code, saving the state and
+	// writing the configuration
+	phases?: { [phase: string]: number };
+	// Whether the previous state was loaded from disk rather than kept live
+	restoredFromDisk?: boolean;
+	// Peak resident set size of the worker during the run, in bytes
+	peakRss?: number | null;
+	// Bytes of stored objects making up the saved state
+	stateSize?: number;
+	// Bytes the run added to the session's object store
+	storedBytes?: number;
+	// Whether a recorded run was replayed instead of executing the code
+	memoized?: boolean;
 }
 export interface CodeExecutionResponse {
 	output: string;
@@ -76,6 +107,10 @@ export interface CodeExecutionResponse {
 export interface CodeAnalysisRequest {
 	code: string;
 	language: string;
+	// Identifies the node being edited ("<file>#<node id>") so the analyzer
+	// can work incrementally and keep the file's symbol index current
+	key?: string;
+	scope?: string;
 }
 export interface IdCodeTuple {
 	id: string;
@@ -92,6 +127,15 @@ export interface CodeManyExecutionRequest {
 	language: string;
 	filePath: string;
 	sessionId?: string;
+	// Profile every fragment (see CodeExecutionRequest)
+	profile?: boolean;
+	// Memoize every fragment (see CodeExecutionRequest)
+	memoize?: boolean;
+	// Trace every fragment (see CodeExecutionRequest)
+	trace?: boolean;
+	// Run the fragments the analyzer shows to be independent concurrently
+	// (off by default)
+	parallel?: boolean;
 }
 
 export interface Dependencies {
@@ -99,16 +143,104 @@ export interface Dependencies {
 	functions: string[];
 	classes: string[];
 	modules: string[];
+	// Attribute paths read ("task.title") from variables only used through their attributes
+	attributes?: string[];
 }
 export interface Definitions {
 	variables: string[];
 	functions: string[];
 	classes: string[];
+	// Attribute paths changed ("tracker.tasks") on variables only used through their attributes
+	attributes?: string[];
 }
 export interface CodeAnalysisResponse {
 	dependencies: Dependencies;
 	new_definitions: Definitions;
 }
+export interface CodeManyAnalysisRequest {
+	codes: { [nodeId: string]: string };
+	language: string;
+	filePath?: string;
+	scopes?: { [nodeId: string]: string };
+}
+export interface PythonImportRequest {
+	// Python files, or directories searched for them
+	sources: string[];
+	// Directory the .igc files are written to, mirroring the sources
+	outputDir: string;
+}
+export interface PythonImportResponse {
+	// .igc file written for each module
+	files: { [modulePath: string]: string };
+	errors: { [modulePath: string]: string };
+}
+export interface SessionCompactionRequest {
+	filePath: string;
+	// Also compress the stored objects only earlier executions use
+	compress?: boolean;
+	// Only report what would be done
+	dryRun?: boolean;
+}
+export interface SessionCompactionResponse {
+	prunedExecutions: number;
+	removedObjects: number;
+	linkedStates: number;
+	compressedObjects: number;
+	expiredMemos: number;
+	freedBytes: number;
+}
+export interface SymbolIndexResponse {
+	definers: { [symbol: string]: string[] };
+	consumers: { [symbol: string]: string[] };
+}
+export interface AnalysisCacheStats {
+	entries: number;
+	max_entries: number;
+	hits: number;
+	disk_hits: number;
+	misses: number;
+	evictions: number;
+}
+export interface CodeRerunRequest {
+	fileIdCodeList: FileIdCodeList;
+	codes: { [nodeId: string]: string };
+	scopes?: { [nodeId: string]: string };
+	language: string;
+	filePath: string;
+	sessionId: string;
+	// Memoize the re-run fragments (see CodeExecutionRequest)
+	memoize?: boolean;
+	// Trace the re-run fragments (see CodeExecutionRequest)
+	trace?: boolean;
+}
+export interface ReexecutionPlan {
+	mode: "incremental" | "full";
+	rerun: number[];
+	skipped: number[];
+	changed: string[];
+	edited?: string[];
+	reason?: string;
+}
+export interface ConfigurationPageRequest {
+	filePath: string;
+	sessionId: string;
+	// Position of the execution in the session path (1-based)
+	execution: number;
+	name: string;
+	path?: (string | number)[];
+	offset?: number;
+	limit?: number;
+}
+export interface ConfigurationPage {
+	type: string;
+	offset: number;
+	length?: number;
+	items?: any;
+	value?: any;
+}
+export type CodeManyAnalysisResponse = {
+	[nodeId: string]: CodeAnalysisResponse | { error: string };
+};
 
 export type Cache = CacheEntry[];
 export interface CacheEntry {